@@ -7,20 +7,43 @@ setup(
              sources = ["src/strengths/engines/strengths_engine/src/engine.cpp"],
              include_dirs = ["src/strengths/engines/strengths_engine/src"],
              define_macros = [("CPYEMVER", None)],
-             extra_compile_args = ["-std=c++11"],
+             extra_compile_args = ["-std=c++11", "-pthread"],
+             extra_link_args = ["-pthread"],
              export_symbols = [
                 "engineexport_initialize_grid",
                 "engineexport_initialize_graph",
                 "engineexport_run",
+                "engineexport_cancel",
+                "engineexport_set_wall_time_limit",
                 "engineexport_iterate_n",
                 "engineexport_iterate",
+                "engineexport_set_stop_conditions",
+                "engineexport_set_tolerances",
+                "engineexport_set_multirate",
+                "engineexport_set_local_time_stepping",
+                "engineexport_set_hybrid_thresholds",
+                "engineexport_set_hybrid_region",
+                "engineexport_get_stop_condition",
                 "engineexport_get_progress",
                 "engineexport_get_trajectory",
+                "engineexport_get_samples",
                 "engineexport_get_state",
                 "engineexport_get_time",
+                "engineexport_get_time_step",
+                "engineexport_get_stable_time_step",
+                "engineexport_get_multirate_partition",
+                "engineexport_get_local_time_stepping_levels",
+                "engineexport_get_hybrid_partition",
                 "engineexport_get_tsample",
                 "engineexport_get_nsamples",
+                "engineexport_get_storage_overflow",
                 "engineexport_sample",
+                "engineexport_is_complete",
+                "engineexport_reset",
+                "engineexport_run_ensemble",
+                "engineexport_run_batch",
+                "engineexport_save_checkpoint",
+                "engineexport_load_checkpoint",
                 "engineexport_finalize"
                 ]
              )
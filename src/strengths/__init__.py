@@ -1,8 +1,9 @@
 from strengths.rdnetwork import *
-from strengths.rdoutput import RDTrajectory, load_rdtrajectory, save_rdtrajectory
+from strengths.rdoutput import RDTrajectory, RDTrajectoryEnsemble, load_rdtrajectory, save_rdtrajectory, rdtrajectory_from_dict, rdtrajectory_to_dict
 from strengths.rdscript import RDScript, load_rdscript, save_rdscript, rdscript_from_dict, rdscript_to_dict
-from strengths.simulate import simulate_script, simulate
+from strengths.simulate import simulate_script, simulate, simulate_ensemble, simulate_batch, simulate_async, simulate_script_async, SimulationProgress, SimulationObserver
+from strengths.parameters import apply_parameters
 from strengths.rdsystem import *
 from strengths.rdspace import *
 from strengths.units import *
-from strengths.engine_collection import euler_engine, gillespie_engine, tauleap_engine, default_engine
+from strengths.engine_collection import euler_engine, gillespie_engine, tauleap_engine, default_engine, imex_engine, rk45_engine, rk23_engine, hybrid_engine
@@ -0,0 +1,388 @@
+from strengths.rdscript import RDScript, rdscript_from_dict, rdscript_to_dict, load_rdscript
+from strengths.rdoutput import save_rdtrajectory, rdtrajectory_to_dict
+from strengths.typechecking import *
+from strengths import engine_collection
+
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+"""
+Module that implements a minimal coordinator/worker pair to distribute simulation jobs over several machines.
+The coordinator serves a queue of scripts over a TCP or Unix socket, and the workers pull the jobs,
+run them and push back their results. It can be used from python or from the command line :
+
+.. code::
+
+    python -m strengths.cluster serve jobs.json --address 0.0.0.0:7070 --results results.json
+    python -m strengths.cluster work --address coordinator-host:7070 --output-dir results
+"""
+
+def _parse_address(address) :
+    # "host:port" -> (host, port), "unix:path" -> path
+    if isstr(address) :
+        if address.startswith("unix:") :
+            return address[len("unix:"):]
+        host, port = address.rsplit(":", 1)
+        return (host, int(port))
+    return tuple(address)
+
+def _format_address(address) :
+    if isstr(address) :
+        return "unix:"+address
+    return address[0]+":"+str(address[1])
+
+def _request(address, message, timeout=60) :
+    # sends a message to the coordinator and returns its response.
+    # messages are JSON objects, one per line, and one request per connection.
+    address = _parse_address(address)
+    family = socket.AF_UNIX if isstr(address) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as s :
+        s.settimeout(timeout)
+        s.connect(address)
+        s.sendall((json.dumps(message)+"\n").encode("utf-8"))
+        with s.makefile("r", encoding="utf-8") as f :
+            return json.loads(f.readline())
+
+def make_engine(name) :
+    """
+    Returns the engine of engine_collection with the given name (ie. "euler" for euler_engine).
+
+    :param name: name of the engine ("euler", "tauleap", "gillespie" or "default").
+    :type name: str
+    :rtype: RDEngineBase
+    """
+    
+    factory = getattr(engine_collection, str(name)+"_engine", None)
+    if factory is None :
+        raise ValueError("unknown engine \""+str(name)+"\".")
+    return factory()
+
+class _Handler(socketserver.StreamRequestHandler) :
+    def handle(self) :
+        line = self.rfile.readline()
+        if not line :
+            return
+        try :
+            response = self.server.coordinator._handle(json.loads(line.decode("utf-8")))
+        except Exception as e :
+            response = {"type" : "error", "error" : repr(e)}
+        self.wfile.write((json.dumps(response)+"\n").encode("utf-8"))
+
+class _TCPServer(socketserver.ThreadingTCPServer) :
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, "ThreadingUnixStreamServer") :
+    class _UnixServer(socketserver.ThreadingUnixStreamServer) :
+        daemon_threads = True
+
+class Coordinator :
+    """
+    Serves a queue of simulation jobs to workers (see run_worker).
+    A job whose run fails, or is not reported before its timeout, is given again to
+    a worker, up to retries times. 
+
+    :param jobs: jobs to be run. a job can be a RDScript, or a dict with the keys
+        "script" (RDScript or dict, see rdscript_to_dict), "engine" (engine name, see make_engine)
+        and "timeout" (wall clock time limit in seconds), the last two being optional.
+    :type jobs: list
+    :param address: address the coordinator listens to, "host:port" or "unix:path".
+        with port 0, a free port is chosen (see the address property).
+    :type address: str
+    :param engine: name of the engine used for jobs that do not specify one.
+    :type engine: str
+    :param retries: number of times a job is run again after a failure.
+    :type retries: int
+    :param timeout: default wall clock time limit of a job, in seconds (None for no limit).
+    :type timeout: number or None
+    :param lease_margin: time (in seconds) granted to a worker beyond the job timeout to report
+        its result, after which the job is considered lost.
+    :type lease_margin: number
+    """
+    
+    def __init__(self, jobs, address="127.0.0.1:0", engine="default", retries=2, timeout=None, lease_margin=30) :
+        """
+        constructor
+        """
+        
+        self._jobs = [self._make_job(i, job, engine, timeout) for i, job in enumerate(jobs)]
+        self._retries = int(retries)
+        self._lease_margin = lease_margin
+        self._lock = threading.Lock()
+        self._pending = collections.deque(range(len(self._jobs)))
+        self._running = {}
+        self._results = [None for job in self._jobs]
+        self._attempts = [0 for job in self._jobs]
+        self._all_done = threading.Event()
+        if len(self._jobs) == 0 :
+            self._all_done.set()
+        
+        address = _parse_address(address)
+        if isstr(address) :
+            if os.path.exists(address) :
+                os.remove(address)
+            self._server = _UnixServer(address, _Handler)
+        else :
+            self._server = _TCPServer(address, _Handler)
+        self._server.coordinator = self
+        self._thread = None
+        
+    def _make_job(self, index, job, engine, timeout) :
+        if type(job) == RDScript or isstr(job) :
+            job = {"script" : job}
+        script = job["script"]
+        if isstr(script) :
+            script = load_rdscript(script)
+        if type(script) == RDScript :
+            script = rdscript_to_dict(script)
+        return {
+            "id" : index,
+            "script" : script,
+            "engine" : job.get("engine", engine),
+            "timeout" : job.get("timeout", timeout)
+            }
+    
+    @property
+    def address(self) :
+        """
+        address the coordinator listens to ("host:port" or "unix:path").
+        """
+        
+        return _format_address(self._server.server_address)
+    
+    def start(self) :
+        """
+        Starts serving the jobs in a background thread.
+        """
+        
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def stop(self) :
+        """
+        Stops serving the jobs.
+        """
+        
+        self._server.shutdown()
+        self._server.server_close()
+        if isstr(self._server.server_address) and os.path.exists(self._server.server_address) :
+            os.remove(self._server.server_address)
+    
+    def wait(self, timeout=None) :
+        """
+        Waits for all the jobs to be done (or failed), and returns the results.
+        
+        :param timeout: maximal waiting time in seconds (None for no limit).
+        :type timeout: number or None
+        :returns: the results (see the results property), or None if the timeout is reached.
+        """
+        
+        deadline = None if timeout is None else time.time()+timeout
+        while not self._all_done.is_set() :
+            with self._lock :
+                self._check_leases()
+            if deadline is not None and time.time() > deadline :
+                return None
+            self._all_done.wait(1)
+        return self.results
+    
+    @property
+    def results(self) :
+        """
+        result of each job (None if it is not finished yet), as a dict with the keys
+        "id", "status" ("done" or "failed"), "attempts", "worker", 
+        "result" (trajectory dict, see rdtrajectory_to_dict, or path of the trajectory file)
+        and "error".
+        """
+        
+        with self._lock :
+            return [None if r is None else dict(r) for r in self._results]
+    
+    def _finish(self, i, status, worker, result=None, error=None) :
+        self._results[i] = {
+            "id" : i,
+            "status" : status,
+            "attempts" : self._attempts[i],
+            "worker" : worker,
+            "result" : result,
+            "error" : error
+            }
+        if all(r is not None for r in self._results) :
+            self._all_done.set()
+    
+    def _fail(self, i, worker, error) :
+        # the job is either given again to a worker or flagged as failed.
+        if self._attempts[i] <= self._retries :
+            self._pending.append(i)
+        else :
+            self._finish(i, "failed", worker, error=error)
+    
+    def _check_leases(self) :
+        now = time.time()
+        for i in list(self._running) :
+            attempt, deadline, worker = self._running[i]
+            if deadline is not None and now > deadline :
+                del self._running[i]
+                self._fail(i, worker, "job not reported before its timeout.")
+    
+    def _handle(self, message) :
+        with self._lock :
+            self._check_leases()
+            
+            if message["type"] == "get" :
+                if len(self._pending) > 0 :
+                    i = self._pending.popleft()
+                    job = self._jobs[i]
+                    self._attempts[i] += 1
+                    deadline = None if job["timeout"] is None else time.time()+job["timeout"]+self._lease_margin
+                    self._running[i] = (self._attempts[i], deadline, message.get("worker", None))
+                    return dict(job, type="job", attempt=self._attempts[i])
+                elif len(self._running) > 0 :
+                    return {"type" : "wait"}
+                else :
+                    return {"type" : "done"}
+            
+            elif message["type"] == "result" :
+                i = message["id"]
+                # results of lost attempts that have already been given to another worker are ignored
+                if i in self._running and self._running[i][0] == message["attempt"] :
+                    del self._running[i]
+                    if message["ok"] :
+                        self._finish(i, "done", message.get("worker", None), result=message["result"])
+                    else :
+                        self._fail(i, message.get("worker", None), message["error"])
+                return {"type" : "ack"}
+            
+            raise ValueError("unknown message type \""+str(message["type"])+"\".")
+
+def run_job(script, engine, timeout=None) :
+    """
+    Runs a script with an engine, within an optional wall clock time limit.
+    
+    :param script: script to be run.
+    :type script: RDScript
+    :param engine: simulation engine.
+    :type engine: RDEngineBase
+    :param timeout: wall clock time limit in seconds (None for no limit).
+    :type timeout: number or None
+    :returns: trajectory
+    :rtype: RDTrajectory
+    """
+    
+    t0 = time.time()
+    engine.setup(script)
+    try :
+        while engine.run(1000) :
+            if timeout is not None and time.time()-t0 > timeout :
+                raise TimeoutError("the job exceeded its timeout ("+str(timeout)+" s).")
+        return engine.get_output()
+    finally :
+        engine.finalize()
+
+def run_worker(address, output_dir=None, poll_interval=1, name=None) :
+    """
+    Pulls jobs from a coordinator (see Coordinator) and runs them, until all the jobs are done.
+    
+    :param address: address of the coordinator, "host:port" or "unix:path".
+    :type address: str
+    :param output_dir: if not None, the trajectories are saved in this directory
+        (see save_rdtrajectory), which should be accessible to the coordinator host,
+        and only their path is pushed back. otherwise, the whole trajectory is pushed back.
+    :type output_dir: str or None
+    :param poll_interval: time (in seconds) waited before asking again for a job when none is available.
+    :type poll_interval: number
+    :param name: name of the worker reported to the coordinator (default : host name and process id).
+    :type name: str or None
+    :returns: number of jobs run by the worker.
+    :rtype: int
+    """
+    
+    if name is None :
+        name = socket.gethostname()+":"+str(os.getpid())
+    if output_dir is not None :
+        os.makedirs(output_dir, exist_ok=True)
+    
+    n_jobs = 0
+    connected = False
+    while True :
+        try :
+            message = _request(address, {"type" : "get", "worker" : name})
+        except OSError :
+            # the coordinator stops once all the jobs are done.
+            if connected :
+                return n_jobs
+            raise
+        connected = True
+        if message["type"] == "done" :
+            return n_jobs
+        if message["type"] == "wait" :
+            time.sleep(poll_interval)
+            continue
+        
+        response = {"type" : "result", "id" : message["id"], "attempt" : message["attempt"], "worker" : name}
+        try :
+            script = rdscript_from_dict(message["script"])
+            output = run_job(script, make_engine(message["engine"]), message["timeout"])
+            if output_dir is None :
+                result = rdtrajectory_to_dict(output)
+            else :
+                result = os.path.abspath(os.path.join(output_dir, "job_"+str(message["id"])+".json"))
+                save_rdtrajectory(output, result)
+            response.update(ok=True, result=result)
+        except Exception as e :
+            response.update(ok=False, error=repr(e))
+        _request(address, response)
+        n_jobs += 1
+
+def main(argv=None) :
+    parser = argparse.ArgumentParser(prog="python -m strengths.cluster", description="distributes simulation jobs over several workers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    serve = subparsers.add_parser("serve", help="serves a list of jobs to workers.")
+    serve.add_argument("jobs", help="JSON file containing the list of jobs (script paths, script dicts, or job dicts).")
+    serve.add_argument("--address", default="0.0.0.0:7070", help="address to listen to, host:port or unix:path.")
+    serve.add_argument("--engine", default="default", help="engine used for the jobs that do not specify one.")
+    serve.add_argument("--retries", type=int, default=2, help="number of times a failed job is run again.")
+    serve.add_argument("--timeout", type=float, default=None, help="wall clock time limit of a job, in seconds.")
+    serve.add_argument("--results", default="results.json", help="JSON file in which the results are written.")
+    
+    work = subparsers.add_parser("work", help="runs the jobs served by a coordinator.")
+    work.add_argument("--address", default="127.0.0.1:7070", help="address of the coordinator, host:port or unix:path.")
+    work.add_argument("--output-dir", default=None, help="directory in which the trajectories are saved.")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "serve" :
+        with open(args.jobs, "r", encoding="utf-8") as f :
+            jobs = json.load(f)
+        base_path = os.path.dirname(os.path.abspath(args.jobs))
+        for i in range(len(jobs)) :
+            # script paths are relative to the jobs file
+            if isstr(jobs[i]) :
+                jobs[i] = os.path.join(base_path, jobs[i])
+            elif isdict(jobs[i]) and isstr(jobs[i].get("script", None)) :
+                jobs[i] = dict(jobs[i], script=os.path.join(base_path, jobs[i]["script"]))
+        coordinator = Coordinator(jobs, args.address, args.engine, args.retries, args.timeout)
+        coordinator.start()
+        print("serving "+str(len(jobs))+" jobs on "+coordinator.address)
+        results = coordinator.wait()
+        coordinator.stop()
+        with open(args.results, "w", encoding="utf-8") as f :
+            json.dump(results, f)
+        n_failed = sum(r["status"] == "failed" for r in results)
+        print(str(len(results)-n_failed)+" jobs done, "+str(n_failed)+" failed.")
+        return 1 if n_failed > 0 else 0
+    else :
+        n_jobs = run_worker(args.address, args.output_dir)
+        print(str(n_jobs)+" jobs run.")
+        return 0
+
+if __name__ == "__main__" :
+    sys.exit(main())
@@ -238,7 +238,10 @@ def uncoarsegrain_trajectory(trajectory, ncg_system, index_map) :
         script = trajectory.script,
         engine_description = trajectory.engine_description,
         engine_option = trajectory.engine_option,
-        cgmap = index_map
+        cgmap = index_map,
+        stop_condition = trajectory.stop_condition,
+        t_stop = trajectory.t_stop,
+        diagnostics = trajectory.diagnostics
         )
     
     pass
\ No newline at end of file
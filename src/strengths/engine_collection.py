@@ -78,6 +78,93 @@ def euler_engine():
         requires_molecules=False
         )
 
+def imex_engine():
+    """
+    Engine using an implicit-explicit (IMEX) splitting with a static time step :
+    at each step, reactions are integrated with the Euler method, then diffusion is integrated
+    with the backward Euler method, solved with the conjugate gradient method (Saad, 2003) [#Saad2003]_.
+    The time step is then not limited by the diffusion stability condition of the Euler method,
+    which makes it suited to diffusion dominated systems.
+    Diffusion is treated as a first order reaction according to Bernstein's method (Bernstein, 2005) [#Bernstein2005]_.
+    """
+    # references :
+    # .. [#Bernstein2005] Bernstein, D. (2005). Simulating mesoscopic reaction-diffusion systems using the Gillespie algorithm. Physical Review E, 71(4), Article 041103. https://doi.org/10.1103/PhysRevE.71.041103
+    # .. [#Saad2003] Saad, Y. (2003). Iterative methods for sparse linear systems (2nd ed.). SIAM. https://doi.org/10.1137/1.9780898718003
+
+    path = _get_engine_path()
+    return LibRDEngine(
+        ctypes.CDLL(path),
+        option = "imex",
+        description = "description",
+        requires_molecules=False
+        )
+
+def rk45_engine():
+    """
+    Engine using the Dormand-Prince 5(4) Runge-Kutta method (Dormand & Prince, 1980) [#Dormand1980]_,
+    with an adaptive time step controlled by the local error tolerances RDScript.rtol and RDScript.atol
+    (RDScript.time_step is ignored).
+    With the "on_t_sample" and "on_interval" sampling policies, the states are sampled at exactly the requested times,
+    by interpolation.
+    Diffusion is treated as a first order reaction according to Bernstein's method (Bernstein, 2005) [#Bernstein2005]_.
+    """
+    # references :
+    # .. [#Bernstein2005] Bernstein, D. (2005). Simulating mesoscopic reaction-diffusion systems using the Gillespie algorithm. Physical Review E, 71(4), Article 041103. https://doi.org/10.1103/PhysRevE.71.041103
+    # .. [#Dormand1980] Dormand, J. R., & Prince, P. J. (1980). A family of embedded Runge-Kutta formulae. Journal of Computational and Applied Mathematics, 6(1), 19-26. https://doi.org/10.1016/0771-050X(80)90013-3
+
+    path = _get_engine_path()
+    return LibRDEngine(
+        ctypes.CDLL(path),
+        option = "rk45",
+        description = "description",
+        requires_molecules=False
+        )
+
+def rk23_engine():
+    """
+    Engine using the Bogacki-Shampine 3(2) Runge-Kutta method (Bogacki & Shampine, 1989) [#Bogacki1989]_,
+    with an adaptive time step controlled by the local error tolerances RDScript.rtol and RDScript.atol
+    (RDScript.time_step is ignored). It is cheaper than rk45_engine() per step, and may be more efficient with loose tolerances.
+    With the "on_t_sample" and "on_interval" sampling policies, the states are sampled at exactly the requested times,
+    by interpolation.
+    Diffusion is treated as a first order reaction according to Bernstein's method (Bernstein, 2005) [#Bernstein2005]_.
+    """
+    # references :
+    # .. [#Bernstein2005] Bernstein, D. (2005). Simulating mesoscopic reaction-diffusion systems using the Gillespie algorithm. Physical Review E, 71(4), Article 041103. https://doi.org/10.1103/PhysRevE.71.041103
+    # .. [#Bogacki1989] Bogacki, P., & Shampine, L. F. (1989). A 3(2) pair of Runge-Kutta formulas. Applied Mathematics Letters, 2(4), 321-325. https://doi.org/10.1016/0893-9659(89)90079-7
+
+    path = _get_engine_path()
+    return LibRDEngine(
+        ctypes.CDLL(path),
+        option = "rk23",
+        description = "description",
+        requires_molecules=False
+        )
+
+def hybrid_engine():
+    """
+    Engine using a hybrid stochastic/deterministic method with a static time step (Haseltine & Rawlings, 2002) [#Haseltine2002]_.
+    At each time step, the reaction and diffusion channels of each mesh are partitioned according to the script thresholds
+    (RDScript.hybrid_population_threshold and RDScript.hybrid_propensity_threshold) : the channels expected to fire often,
+    and only changing abundant species, are integrated with the Euler method, while the others fire
+    as in the Gillespie algorithm (Gillespie, 1977) [#Gillespie1977]_.
+    Alternatively, the partition can be spatial (RDScript.hybrid_stochastic_region) : the chosen cells or environments
+    are simulated stochastically, and the others deterministically.
+    Diffusion is treated as a first order reaction according to Bernstein's method (Bernstein, 2005) [#Bernstein2005]_.
+    """
+    # references :
+    # .. [#Bernstein2005] Bernstein, D. (2005). Simulating mesoscopic reaction-diffusion systems using the Gillespie algorithm. Physical Review E, 71(4), Article 041103. https://doi.org/10.1103/PhysRevE.71.041103
+    # .. [#Gillespie1977] Gillespie, D. T. (1977). Exact stochastic simulation of coupled chemical reactions. The Journal of Physical Chemistry, 81(25), 2340-2361. https://doi.org/10.1021/j100540a008
+    # .. [#Haseltine2002] Haseltine, E. L., & Rawlings, J. B. (2002). Approximate simulation of coupled fast and slow reactions for stochastic chemical kinetics. The Journal of Chemical Physics, 117(15), 6959-6969. https://doi.org/10.1063/1.1505860
+
+    path = _get_engine_path()
+    return LibRDEngine(
+        ctypes.CDLL(path),
+        option = "hybrid",
+        description = "description",
+        requires_molecules=True
+        )
+
 def default_engine():
     """
     Default engine (among those above) used by functions such as simulate.
@@ -6,44 +6,13 @@ class Euler3D : public SimulationAlgorithm3DBase
 
     std::vector<double> mesh_dxdt; //species quantities
 
-    void Compute_dxdt()
-        {
-        for(int i=0; i<n_meshes; i++)
-            {
-            //reaction rates
-            std::vector<double> rr(n_reactions);
-
-            for(int r=0; r<n_reactions; r++)
-                rr[r] = ReactionRate(i, r);
-
-            for(int s=0; s<n_species; s++)
-              {
-              mesh_dxdt[i*n_species+s] = 0;
-              if(mesh_chstt[i*n_species+s]) continue;
-
-              //reaction
-              for(int r=0; r<n_reactions; r++)
-                {
-                mesh_dxdt[i*n_species+s] += sto[s*n_reactions+r]*rr[r];
-                }
-
-              //diffusion
-              for (int n=0; n<6; n++)
-                {
-                if(mesh_neighbors[i*6+n] != -1)
-                  mesh_dxdt[i*n_species+s] -= DiffusionRateDifference(i, s, n);
-                }
-              }
-            }
-        }
-
-    void Apply_dxdt()
+    void Apply_dxdt(double h)
         {
         for(int i=0; i<n_meshes; i++)
             {
             for(int j=0; j<n_species; j++)
                 {
-                mesh_x[i*n_species+j] += mesh_dxdt[i*n_species+j]*dt;
+                mesh_x[i*n_species+j] += mesh_dxdt[i*n_species+j]*h;
                 }
             }
         }
@@ -63,6 +32,17 @@ class Euler3D : public SimulationAlgorithm3DBase
         {
         }
 
+    virtual SimulationAlgorithm3DBase * Clone()
+        {
+        return new Euler3D(*this);
+        }
+
+    virtual double StableTimeStep()
+    // the fast processes being sub-stepped, only the slow ones bound the time step.
+        {
+        return stable_dt_slow;
+        }
+
     virtual bool Iterate()
         {
         sampling_done_this_iteration = false; // reset the flag
@@ -70,8 +50,23 @@ class Euler3D : public SimulationAlgorithm3DBase
         if(complete)
           return false;
 
-        Compute_dxdt();
-        Apply_dxdt();
+        if(n_substeps == 1)
+          {
+          ComputeDerivative(mesh_dxdt);
+          Apply_dxdt(dt);
+          }
+        else
+          {
+          //multirate step : the slow processes are integrated over dt, then the fast ones
+          //over n_substeps steps, each within their stability bound (see SetMultirate).
+          ComputeDerivative(mesh_dxdt, 0);
+          Apply_dxdt(dt);
+          for(int k=0; k<n_substeps; k++)
+            {
+            ComputeDerivative(mesh_dxdt, 1);
+            Apply_dxdt(dt/n_substeps);
+            }
+          }
         t += dt;
         SamplingStep();
         CheckTMax();
@@ -0,0 +1,204 @@
+//implementation using the Euler method, integrating several parameter sets
+//of a same system in lockstep.
+//every array is laid out with the parameter set index innermost, so that the
+//inner loops run over the parameter sets.
+
+class EulerBatch
+    {
+    private :
+
+    int n_sets, n_meshes, n_species, n_reactions;
+    std::vector<double> x;                           // species quantities [mesh][species][set]
+    std::vector<double> dxdt;                        // species quantities derivative [mesh][species][set]
+    std::vector<double> rr;                          // reaction rates in the current mesh [reaction][set]
+    std::vector<double> kr;                          // reaction kinetic rates [mesh][reaction][set]
+    std::vector<int> chstt;                          // chemostats [mesh][species]
+    std::vector<double> sto;                         // reaction species change stoechiometry matrix [species][reaction]
+    std::vector<std::vector<int>> r_sub_species;     // substrates of each reaction
+    std::vector<std::vector<double>> r_sub_sto;      // substrates stoechiometry of each reaction
+
+    std::vector<int> term_start;                     // index of the first diffusion term of each (mesh, species) //size n_meshes*n_species+1
+    std::vector<int> term_j;                         // neighbor mesh of each diffusion term
+    std::vector<double> term_kout;                   // diffusion rate constant to the neighbor mesh [term][set]
+    std::vector<double> term_kin;                    // diffusion rate constant from the neighbor mesh [term][set]
+
+    void Compute_dxdt()
+        {
+        for(int i=0; i<n_meshes; i++)
+            {
+            //reaction rates
+            for(int r=0; r<n_reactions; r++)
+                {
+                double * rr_r = &rr[r*n_sets];
+                const double * kr_ir = &kr[(i*n_reactions+r)*n_sets];
+                for(int p=0; p<n_sets; p++)
+                    rr_r[p] = kr_ir[p];
+
+                for(size_t q=0; q<r_sub_species[r].size(); q++)
+                    {
+                    const double * x_is = &x[(i*n_species+r_sub_species[r][q])*n_sets];
+                    double e = r_sub_sto[r][q];
+                    if(e == 1)
+                        for(int p=0; p<n_sets; p++) rr_r[p] *= x_is[p];
+                    else
+                        for(int p=0; p<n_sets; p++) rr_r[p] *= pow(x_is[p], e);
+                    }
+                }
+
+            for(int s=0; s<n_species; s++)
+              {
+              double * dxdt_is = &dxdt[(i*n_species+s)*n_sets];
+              for(int p=0; p<n_sets; p++)
+                  dxdt_is[p] = 0;
+              if(chstt[i*n_species+s]) continue;
+
+              //reaction
+              for(int r=0; r<n_reactions; r++)
+                {
+                double c = sto[s*n_reactions+r];
+                const double * rr_r = &rr[r*n_sets];
+                for(int p=0; p<n_sets; p++)
+                    dxdt_is[p] += c*rr_r[p];
+                }
+
+              //diffusion
+              const double * x_is = &x[(i*n_species+s)*n_sets];
+              for(int n=term_start[i*n_species+s]; n<term_start[i*n_species+s+1]; n++)
+                {
+                const double * x_js = &x[(term_j[n]*n_species+s)*n_sets];
+                const double * kout = &term_kout[n*n_sets];
+                const double * kin  = &term_kin [n*n_sets];
+                for(int p=0; p<n_sets; p++)
+                    dxdt_is[p] -= x_is[p]*kout[p] - x_js[p]*kin[p];
+                }
+              }
+            }
+        }
+
+    void Apply_dxdt(double dt)
+        {
+        for(size_t i=0; i<x.size(); i++)
+            x[i] += dxdt[i]*dt;
+        }
+
+    void Sample(int sample_index, int capacity, double * trajectory_data)
+    // writes the current state of each set in trajectory_data [set[sample[species[mesh]]]]
+        {
+        size_t state_size = static_cast<size_t>(n_meshes)*n_species;
+        for(int p=0; p<n_sets; p++)
+            for(int s=0; s<n_species; s++)
+                for(int i=0; i<n_meshes; i++)
+                    trajectory_data[(static_cast<size_t>(p)*capacity + sample_index)*state_size + s*n_meshes + i] = x[(i*n_species+s)*n_sets+p];
+        }
+
+    public :
+
+    EulerBatch()
+        {
+        }
+
+    void Init(
+        int n_sets,
+        int n_meshes,
+        int n_species,
+        int n_reactions,
+        const std::vector<double> & sub,      //N*M substrate matrix
+        const std::vector<double> & sto,      //N*M stoechiometry matrix
+        const std::vector<int> & chstt,       //chemostats //mesh first array
+        const std::vector<std::vector<double>> & set_x0,   //initial state of each set //mesh first arrays
+        const std::vector<std::vector<double>> & set_kr,   //reaction kinetic rates of each set [mesh][reaction]
+        const std::vector<int> & term_i,      //source mesh of each diffusion term, in increasing (mesh, species) order
+        const std::vector<int> & term_j,      //neighbor mesh of each diffusion term
+        const std::vector<int> & term_s,      //species of each diffusion term
+        const std::vector<std::vector<double>> & set_kout, //diffusion rate constants to the neighbor mesh of each set [term]
+        const std::vector<std::vector<double>> & set_kin   //diffusion rate constants from the neighbor mesh of each set [term]
+        )
+        {
+        this->n_sets = n_sets;
+        this->n_meshes = n_meshes;
+        this->n_species = n_species;
+        this->n_reactions = n_reactions;
+        this->sto = sto;
+        this->chstt = chstt;
+
+        r_sub_species.assign(n_reactions, std::vector<int>());
+        r_sub_sto.assign(n_reactions, std::vector<double>());
+        for(int r=0; r<n_reactions; r++)
+            for(int s=0; s<n_species; s++)
+                if(sub[s*n_reactions+r] != 0)
+                    {
+                    r_sub_species[r].push_back(s);
+                    r_sub_sto[r].push_back(sub[s*n_reactions+r]);
+                    }
+
+        size_t state_size = static_cast<size_t>(n_meshes)*n_species;
+        x.resize(state_size*n_sets);
+        dxdt.resize(state_size*n_sets);
+        rr.resize(static_cast<size_t>(n_reactions)*n_sets);
+        kr.resize(static_cast<size_t>(n_meshes)*n_reactions*n_sets);
+        for(int p=0; p<n_sets; p++)
+            {
+            for(size_t i=0; i<state_size; i++)
+                x[i*n_sets+p] = set_x0[p][i];
+            for(size_t i=0; i<static_cast<size_t>(n_meshes)*n_reactions; i++)
+                kr[i*n_sets+p] = set_kr[p][i];
+            }
+
+        int n_terms = static_cast<int>(term_i.size());
+        this->term_j = term_j;
+        term_start.assign(state_size+1, 0);
+        for(int n=0; n<n_terms; n++)
+            term_start[term_i[n]*n_species+term_s[n]+1]++;
+        for(size_t i=0; i<state_size; i++)
+            term_start[i+1] += term_start[i];
+
+        term_kout.resize(static_cast<size_t>(n_terms)*n_sets);
+        term_kin.resize(static_cast<size_t>(n_terms)*n_sets);
+        for(int p=0; p<n_sets; p++)
+            for(int n=0; n<n_terms; n++)
+                {
+                term_kout[n*n_sets+p] = set_kout[p][n];
+                term_kin [n*n_sets+p] = set_kin [p][n];
+                }
+        }
+
+    int Run(
+        double dt,
+        const std::vector<double> & t_samples, //timepoints at which the system states should be sampled
+        double t_max,                          //time past which the simulation is stopped
+        double * t_sampled,                    //output : sampled times //size t_samples.size()
+        double * trajectory_data               //output : [set[sample[species[mesh]]]] //size n_sets*t_samples.size()*N*n_meshes
+        )
+    // integrates the sets until t_max, sampling the states as the "on_t_sample"
+    // sampling policy would. Returns the number of samples.
+        {
+        int capacity = static_cast<int>(t_samples.size());
+        int sample_pos = 0;
+        int n_sampled = 0;
+        double t = 0;
+
+        for(;;)
+            {
+            bool sampled = false;
+            while(sample_pos<capacity && t>=t_samples[sample_pos])
+                {
+                if(!sampled)
+                    {
+                    Sample(n_sampled, capacity, trajectory_data);
+                    t_sampled[n_sampled] = t;
+                    n_sampled++;
+                    sampled = true;
+                    }
+                sample_pos++;
+                }
+
+            if(t>t_max || (t_max<0 && sample_pos==capacity))
+                break;
+
+            Compute_dxdt();
+            Apply_dxdt(dt);
+            t += dt;
+            }
+        return n_sampled;
+        }
+    };
@@ -7,43 +7,13 @@ class EulerGraph : public SimulationAlgorithmGraphBase
 
     std::vector<double> mesh_dxdt; //species quantities
 
-    void Compute_dxdt()
-        {
-        for(int i=0; i<n_meshes; i++)
-            {
-            //reaction rates
-            std::vector<double> rr(n_reactions);
-
-            for(int r=0; r<n_reactions; r++)
-                rr[r] = ReactionRate(i, r);
-
-            for(int s=0; s<n_species; s++)
-              {
-              mesh_dxdt[i*n_species+s] = 0;
-              if(mesh_chstt[i*n_species+s]) continue;
-
-              //reaction
-              for(int r=0; r<n_reactions; r++)
-                {
-                mesh_dxdt[i*n_species+s] += sto[s*n_reactions+r]*rr[r];
-                }
-
-              //diffusion
-              for (int n=0; n<mesh_neighbor_n[i]; n++)
-                {
-                mesh_dxdt[i*n_species+s] -= DiffusionRateDifference(i, s, n);
-                }
-              }
-            }
-        }
-
-    void Apply_dxdt()
+    void Apply_dxdt(double h)
         {
         for(int i=0; i<n_meshes; i++)
             {
             for(int j=0; j<n_species; j++)
                 {
-                mesh_x[i*n_species+j] += mesh_dxdt[i*n_species+j]*dt;
+                mesh_x[i*n_species+j] += mesh_dxdt[i*n_species+j]*h;
                 }
             }
         }
@@ -63,6 +33,18 @@ class EulerGraph : public SimulationAlgorithmGraphBase
         {
         }
 
+    virtual SimulationAlgorithmGraphBase * Clone()
+        {
+        return new EulerGraph(*this);
+        }
+
+    virtual double StableTimeStep()
+    // the fast processes being sub-stepped, only the slow ones bound the time step
+    // (there is no bound with the local time stepping).
+        {
+        return lts_max_level >= 0 ? -1 : stable_dt_slow;
+        }
+
     virtual bool Iterate()
         {
         sampling_done_this_iteration = false; // reset the flag
@@ -70,8 +52,27 @@ class EulerGraph : public SimulationAlgorithmGraphBase
         if(complete)
           return false;
 
-        Compute_dxdt();
-        Apply_dxdt();
+        if(lts_max_level >= 0)
+          {
+          LocalTimeStep(false);
+          }
+        else if(n_substeps == 1)
+          {
+          ComputeDerivative(mesh_dxdt);
+          Apply_dxdt(dt);
+          }
+        else
+          {
+          //multirate step : the slow processes are integrated over dt, then the fast ones
+          //over n_substeps steps, each within their stability bound (see SetMultirate).
+          ComputeDerivative(mesh_dxdt, 0);
+          Apply_dxdt(dt);
+          for(int k=0; k<n_substeps; k++)
+            {
+            ComputeDerivative(mesh_dxdt, 1);
+            Apply_dxdt(dt/n_substeps);
+            }
+          }
         t += dt;
         SamplingStep();
         CheckTMax();
@@ -144,6 +144,11 @@ class Gillespie3D : public SimulationAlgorithm3DBase
         {
         }
 
+    virtual SimulationAlgorithm3DBase * Clone()
+        {
+        return new Gillespie3D(*this);
+        }
+
     virtual bool Iterate()
         {
         sampling_done_this_iteration = false; // reset the flag
@@ -145,6 +145,11 @@ class GillespieGraph : public SimulationAlgorithmGraphBase
         {
         }
 
+    virtual SimulationAlgorithmGraphBase * Clone()
+        {
+        return new GillespieGraph(*this);
+        }
+
     virtual bool Iterate()
         {
         sampling_done_this_iteration = false; // reset the flag
@@ -0,0 +1,31 @@
+//implementation using a hybrid stochastic/deterministic method with a static time step (see HybridBase)
+
+class Hybrid3D : public HybridBase<SimulationAlgorithm3DBase>
+    {
+    protected :
+
+    virtual int MeshNeighborN(int mesh_index)
+        {
+        return 6;
+        }
+
+    virtual int MeshNeighbor(int mesh_index, int direction)
+        {
+        return mesh_neighbors[mesh_index*6+direction];
+        }
+
+    public :
+
+    Hybrid3D()
+        {
+        }
+
+    virtual ~Hybrid3D()
+        {
+        }
+
+    virtual SimulationAlgorithm3DBase * Clone()
+        {
+        return new Hybrid3D(*this);
+        }
+    };
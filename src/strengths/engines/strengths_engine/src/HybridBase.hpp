@@ -0,0 +1,537 @@
+//implements the hybrid stochastic/deterministic method with a static time step, shared by the grid and graph
+//algorithms (see Hybrid3D and HybridGraph), which only give the neighbors of each mesh (see MeshNeighbor).
+//
+//at the beginning of each time step, the reaction and diffusion channels of each mesh are partitioned into
+//continuous channels, which would fire propensity_threshold times or more during the time step, and which only
+//change species quantities of population_threshold molecules or more, and stochastic channels (all the others).
+//during the time step, the stochastic channels fire as in the Gillespie algorithm [1], while the continuous
+//channels are integrated with the Euler method between the events [2].
+//the species only changed by stochastic channels thus keep integer quantities.
+//
+//alternatively, the partition can be spatial (see SetHybridRegion) : the meshes are split into a deterministic
+//and a stochastic region. The reactions of the deterministic meshes and the diffusion between them are integrated
+//with the Euler method, while the reactions of the stochastic meshes and the diffusion from them are simulated
+//with the Gillespie algorithm.
+//the diffusion from the deterministic region to the stochastic region is transferred at each time step as a whole
+//number of molecules, the flux being rounded randomly so that its expected value is conserved.
+//
+//in both cases, the stochastic propensities are only updated when the quantities they depend on change :
+//after an event, those of the reactions of which a changed species is a substrate and those of the diffusion
+//of the changed species, in the changed meshes, and after an integration of the continuous channels, those
+//of the stochastic channels that depend on a quantity changed by a continuous channel.
+//
+//references :
+//[1] Gillespie, D. T. (1977). Exact stochastic simulation of coupled chemical reactions. The Journal of Physical Chemistry, 81(25), 2340-2361. https://doi.org/10.1021/j100540a008
+//[2] Haseltine, E. L., & Rawlings, J. B. (2002). Approximate simulation of coupled fast and slow reactions for stochastic chemical kinetics. The Journal of Chemical Physics, 117(15), 6959-6969. https://doi.org/10.1063/1.1505860
+
+template<class AlgorithmBase> class HybridBase : public AlgorithmBase
+    {
+    protected :
+
+    using AlgorithmBase::n_meshes;
+    using AlgorithmBase::n_species;
+    using AlgorithmBase::n_reactions;
+    using AlgorithmBase::mesh_x;
+    using AlgorithmBase::mesh_chstt;
+    using AlgorithmBase::sto;
+    using AlgorithmBase::sub;
+    using AlgorithmBase::t;
+    using AlgorithmBase::dt;
+    using AlgorithmBase::complete;
+    using AlgorithmBase::rng;
+    using AlgorithmBase::uiud;
+    using AlgorithmBase::sampling_done_this_iteration;
+    using AlgorithmBase::ReactionRate;
+    using AlgorithmBase::ReactionProp;
+    using AlgorithmBase::DiffusionRate;
+    using AlgorithmBase::DiffusionProp;
+    using AlgorithmBase::SamplingStep;
+    using AlgorithmBase::CheckTMax;
+
+    virtual int MeshNeighborN(int mesh_index) = 0;
+    // number of diffusion directions of the mesh.
+
+    virtual int MeshNeighbor(int mesh_index, int direction) = 0;
+    // index of the neighbor of the mesh in the direction, -1 if there is none.
+
+    private :
+
+    struct DiffusionChannel
+        {
+        int mesh;
+        int species;
+        int direction;
+        };
+
+    double population_threshold;            // minimal quantity of the species changed by a continuous channel
+    double propensity_threshold;            // minimal expected number of events of a continuous channel during a time step
+    std::vector<int> neighbor_start;        // neighbors of mesh i are neighbor_index[neighbor_start[i]:neighbor_start[i+1]]
+    std::vector<int> neighbor_index;        // neighbor mesh index, -1 if there is no neighbor in the direction
+    std::vector<std::vector<int> > species_reactions; // reactions of which each species is a substrate
+    std::vector<std::vector<int> > reaction_species;  // species changed by each reaction
+    std::vector<char> mesh_rc;              // true if the reaction channel is continuous [mesh][reaction]
+    std::vector<char> mesh_dc;              // true if the diffusion channel is continuous [mesh][species][direction] (see DiffusionIndex)
+    std::vector<double> mesh_ar;            // stochastic reaction propensities (0 for the continuous channels)
+    std::vector<double> mesh_ad;            // stochastic diffusion propensities (0 for the continuous channels)
+    std::vector<double> mesh_a0r;           // sum of the stochastic reaction propensities of each mesh
+    std::vector<double> mesh_a0d;           // sum of the stochastic diffusion propensities of each mesh
+    std::vector<double> mesh_dxdt;          // time derivative of the quantities due to the continuous channels
+    std::vector<char> mesh_changed;         // true if the quantity is changed by a continuous channel
+    double a0;                              // sum of the stochastic propensities
+    bool has_continuous;                    // true if there is at least one continuous channel
+    std::vector<int> partition_counts;      // numbers of continuous and stochastic reaction and diffusion channels
+    std::vector<int> continuous_reactions;  // continuous reaction channels (mesh*n_reactions+reaction)
+    std::vector<DiffusionChannel> continuous_diffusion; // continuous diffusion channels
+    std::vector<int> continuous_x;          // quantities changed by a continuous channel (mesh*n_species+species)
+    std::vector<int> coupled_reactions;     // stochastic reaction channels of which a substrate is changed by a continuous channel
+    bool spatial;                           // true if the partition is spatial (see SetHybridRegion)
+    std::vector<char> mesh_stochastic;      // true if the mesh belongs to the stochastic region [mesh]
+    std::vector<int> region_meshes;         // indices of the meshes that can have stochastic channels
+
+    int NeighborN(int mesh_index)
+        {
+        return neighbor_start[mesh_index+1] - neighbor_start[mesh_index];
+        }
+
+    int Neighbor(int mesh_index, int direction)
+        {
+        return neighbor_index[neighbor_start[mesh_index]+direction];
+        }
+
+    int DiffusionIndex(int mesh_index, int species_index, int direction)
+        {
+        return n_species*neighbor_start[mesh_index] + species_index*NeighborN(mesh_index) + direction;
+        }
+
+    bool StochasticMesh(int mesh_index)
+        {
+        return !spatial || mesh_stochastic[mesh_index];
+        }
+
+    bool Abundant(int mesh_index, int species_index)
+        {
+        return mesh_chstt[mesh_index*n_species+species_index] || mesh_x[mesh_index*n_species+species_index] >= population_threshold;
+        }
+
+    bool ContinuousReaction(int i, int r)
+        {
+        if(spatial)
+            return !mesh_stochastic[i];
+        if(ReactionProp(i, r)*dt < propensity_threshold)
+            return false;
+        for(int s=0; s<n_species; s++)
+            if(sto[s*n_reactions+r] != 0 && !Abundant(i, s))
+                return false;
+        return true;
+        }
+
+    bool ContinuousDiffusion(int i, int s, int n, int j)
+    // the diffusion from the deterministic region to the stochastic region is not continuous, as it is
+    // transferred by InterfaceStep.
+        {
+        if(spatial)
+            return !mesh_stochastic[i] && !mesh_stochastic[j];
+        return DiffusionProp(i, s, n)*dt >= propensity_threshold && Abundant(i, s) && Abundant(j, s);
+        }
+
+    void MarkChanged(int mesh_index, int species_index)
+        {
+        int k = mesh_index*n_species+species_index;
+        if(!mesh_changed[k] && !mesh_chstt[k])
+            {
+            mesh_changed[k] = 1;
+            continuous_x.push_back(k);
+            }
+        }
+
+    void Partition()
+    // partitions the channels into continuous and stochastic ones according to the current state,
+    // or to the stochastic region if the partition is spatial.
+        {
+        partition_counts.assign(4, 0);
+        continuous_reactions.clear();
+        continuous_diffusion.clear();
+        region_meshes.clear();
+        for(int i=0; i<n_meshes; i++)
+            {
+            if(StochasticMesh(i))
+                region_meshes.push_back(i);
+
+            for(int r=0; r<n_reactions; r++)
+                {
+                bool continuous = ContinuousReaction(i, r);
+                mesh_rc[i*n_reactions+r] = continuous;
+                partition_counts[continuous ? 0 : 1]++;
+                if(continuous)
+                    continuous_reactions.push_back(i*n_reactions+r);
+                }
+
+            for(int s=0; s<n_species; s++)
+                for(int n=0; n<NeighborN(i); n++)
+                    {
+                    int j = Neighbor(i, n);
+                    bool continuous = j != -1 && ContinuousDiffusion(i, s, n, j);
+                    if(j != -1)
+                        partition_counts[(spatial ? !mesh_stochastic[i] : continuous) ? 2 : 3]++;
+                    mesh_dc[DiffusionIndex(i, s, n)] = continuous;
+                    if(continuous)
+                        continuous_diffusion.push_back({i, s, n});
+                    }
+            }
+        has_continuous = !continuous_reactions.empty() || !continuous_diffusion.empty();
+
+        // quantities changed by the continuous channels, and stochastic reactions depending on them
+        for(size_t k=0; k<continuous_x.size(); k++)
+            mesh_changed[continuous_x[k]] = 0;
+        continuous_x.clear();
+        for(size_t k=0; k<continuous_reactions.size(); k++)
+            {
+            int i = continuous_reactions[k]/n_reactions;
+            int r = continuous_reactions[k]%n_reactions;
+            for(size_t l=0; l<reaction_species[r].size(); l++)
+                MarkChanged(i, reaction_species[r][l]);
+            }
+        for(size_t k=0; k<continuous_diffusion.size(); k++)
+            {
+            const DiffusionChannel & c = continuous_diffusion[k];
+            MarkChanged(c.mesh, c.species);
+            MarkChanged(Neighbor(c.mesh, c.direction), c.species);
+            }
+
+        coupled_reactions.clear();
+        for(int i=0; i<n_meshes && !continuous_x.empty(); i++)
+            for(int r=0; r<n_reactions; r++)
+                {
+                if(mesh_rc[i*n_reactions+r]) continue;
+                for(int s=0; s<n_species; s++)
+                    if(sub[s*n_reactions+r] != 0 && mesh_changed[i*n_species+s])
+                        {
+                        coupled_reactions.push_back(i*n_reactions+r);
+                        break;
+                        }
+                }
+        }
+
+    void UpdateReaction(int i, int r)
+    // updates the stochastic propensity of the reaction r in the mesh i.
+        {
+        int k = i*n_reactions+r;
+        double a = (mesh_rc[k] || !StochasticMesh(i)) ? 0 : ReactionProp(i, r);
+        mesh_a0r[i] += a - mesh_ar[k];
+        a0 += a - mesh_ar[k];
+        mesh_ar[k] = a;
+        }
+
+    void UpdateDiffusion(int i, int s)
+    // updates the stochastic propensities of the diffusion of the species s from the mesh i.
+        {
+        for(int n=0; n<NeighborN(i); n++)
+            {
+            int k = DiffusionIndex(i, s, n);
+            double a = (Neighbor(i, n) == -1 || mesh_dc[k] || !StochasticMesh(i)) ? 0 : DiffusionProp(i, s, n);
+            mesh_a0d[i] += a - mesh_ad[k];
+            a0 += a - mesh_ad[k];
+            mesh_ad[k] = a;
+            }
+        }
+
+    void UpdateSpecies(int i, int s)
+    // updates the stochastic propensities that depend on the quantity of the species s in the mesh i.
+        {
+        if(mesh_chstt[i*n_species+s]) return;
+        for(size_t k=0; k<species_reactions[s].size(); k++)
+            UpdateReaction(i, species_reactions[s][k]);
+        UpdateDiffusion(i, s);
+        }
+
+    void UpdateCoupled()
+    // updates the stochastic propensities that depend on a quantity changed by the continuous channels.
+        {
+        for(size_t k=0; k<coupled_reactions.size(); k++)
+            UpdateReaction(coupled_reactions[k]/n_reactions, coupled_reactions[k]%n_reactions);
+        for(size_t k=0; k<continuous_x.size(); k++)
+            UpdateDiffusion(continuous_x[k]/n_species, continuous_x[k]%n_species);
+        }
+
+    void ComputePropensities()
+        {
+        std::fill(mesh_ar.begin(), mesh_ar.end(), 0);
+        std::fill(mesh_ad.begin(), mesh_ad.end(), 0);
+        std::fill(mesh_a0r.begin(), mesh_a0r.end(), 0);
+        std::fill(mesh_a0d.begin(), mesh_a0d.end(), 0);
+        a0 = 0;
+        for(size_t k=0; k<region_meshes.size(); k++)
+            {
+            int i = region_meshes[k];
+            for(int r=0; r<n_reactions; r++)
+                UpdateReaction(i, r);
+            for(int s=0; s<n_species; s++)
+                UpdateDiffusion(i, s);
+            }
+        }
+
+    void ContinuousStep(double h)
+    // integrates the continuous channels over h with the Euler method.
+        {
+        if(!has_continuous || h <= 0) return;
+        for(size_t k=0; k<continuous_x.size(); k++)
+            mesh_dxdt[continuous_x[k]] = 0;
+
+        for(size_t k=0; k<continuous_reactions.size(); k++)
+            {
+            int i = continuous_reactions[k]/n_reactions;
+            int r = continuous_reactions[k]%n_reactions;
+            double rate = ReactionRate(i, r);
+            for(size_t l=0; l<reaction_species[r].size(); l++)
+                {
+                int s = reaction_species[r][l];
+                mesh_dxdt[i*n_species+s] += sto[s*n_reactions+r]*rate;
+                }
+            }
+
+        for(size_t k=0; k<continuous_diffusion.size(); k++)
+            {
+            const DiffusionChannel & c = continuous_diffusion[k];
+            double rate = DiffusionRate(c.mesh, c.species, c.direction);
+            mesh_dxdt[c.mesh*n_species+c.species] -= rate;
+            mesh_dxdt[Neighbor(c.mesh, c.direction)*n_species+c.species] += rate;
+            }
+
+        for(size_t k=0; k<continuous_x.size(); k++)
+            mesh_x[continuous_x[k]] += mesh_dxdt[continuous_x[k]]*h;
+        }
+
+    void ApplyReaction(int mesh_index, int reaction_index)
+        {
+        for(size_t k=0; k<reaction_species[reaction_index].size(); k++)
+            {
+            int s = reaction_species[reaction_index][k];
+            if(!mesh_chstt[mesh_index*n_species+s])
+                {
+                mesh_x[mesh_index*n_species+s] += sto[s*n_reactions+reaction_index];
+                }
+            }
+        }
+
+    void ApplyDiffusion(int mesh_index, int species_index, int direction)
+        {
+        int j = Neighbor(mesh_index, direction);
+
+        if(!mesh_chstt[mesh_index*n_species+species_index])
+            {
+            mesh_x[mesh_index*n_species+species_index] -= 1;
+            }
+        if(!mesh_chstt[j*n_species+species_index])
+            {
+            mesh_x[j*n_species+species_index] += 1;
+            }
+        }
+
+    void ApplyMeshEvent(int i, double r)
+    // applies the stochastic event of the mesh i drawn with r in [0, mesh_a0r[i]+mesh_a0d[i]),
+    // and updates the propensities it changed.
+        {
+        if(r < mesh_a0r[i])
+            {
+            //reaction
+            double a_cumul = 0;
+            for(int j=0; j<n_reactions; j++)
+                {
+                a_cumul += mesh_ar[i*n_reactions+j];
+                if(r<a_cumul)
+                    {
+                    ApplyReaction(i, j);
+                    for(size_t k=0; k<reaction_species[j].size(); k++)
+                        UpdateSpecies(i, reaction_species[j][k]);
+                    return;
+                    }
+                }
+            return;
+            }
+
+        //diffusion
+        double r2 = r - mesh_a0r[i];
+        double a_cumul = 0;
+        for(int j=0; j<n_species; j++)
+            for(int n=0; n<NeighborN(i); n++)
+                {
+                a_cumul += mesh_ad[DiffusionIndex(i, j, n)];
+                if(r2<a_cumul)
+                    {
+                    ApplyDiffusion(i, j, n);
+                    UpdateSpecies(i, j);
+                    UpdateSpecies(Neighbor(i, n), j);
+                    return;
+                    }
+                }
+        }
+
+    void DrawAndApplyEvent()
+        {
+        double r = uiud(rng)*a0;
+        double a0_cumul = 0;
+        for(size_t k=0; k<region_meshes.size(); k++)
+            {
+            int i = region_meshes[k];
+            double a = mesh_a0r[i] + mesh_a0d[i];
+            if(r < a0_cumul + a)
+                {
+                ApplyMeshEvent(i, r - a0_cumul);
+                break;
+                }
+            a0_cumul += a;
+            }
+        }
+
+    void StochasticStep(bool coupled)
+    // simulates the stochastic channels over the time step with the Gillespie algorithm.
+    // if coupled is true, the continuous channels are integrated between the events.
+        {
+        ComputePropensities();
+        double t_end = t + dt;
+        double t_event = t;
+        for(;;)
+            {
+            double tau = a0 > 0 ? log(1/uiud(rng))/a0 : std::numeric_limits<double>::infinity();
+            if(t_event + tau >= t_end)
+                {
+                if(coupled)
+                    ContinuousStep(t_end - t_event);
+                break;
+                }
+            if(coupled)
+                {
+                ContinuousStep(tau);
+                UpdateCoupled();
+                }
+            t_event += tau;
+            DrawAndApplyEvent();
+            }
+        }
+
+    void InterfaceStep()
+    // transfers the diffusion from the deterministic region to the stochastic region over the time step.
+    // the flux is rounded randomly to a whole number of molecules, of which the expected value is the flux,
+    // and is limited to the whole molecules of the deterministic mesh.
+        {
+        for(int i=0; i<n_meshes; i++)
+            {
+            if(mesh_stochastic[i]) continue;
+            for(int s=0; s<n_species; s++)
+                for(int n=0; n<NeighborN(i); n++)
+                    {
+                    int j = Neighbor(i, n);
+                    if(j == -1 || !mesh_stochastic[j]) continue;
+                    double m = floor(DiffusionRate(i, s, n)*dt + uiud(rng));
+                    if(!mesh_chstt[i*n_species+s])
+                        {
+                        m = std::min(m, std::max(floor(mesh_x[i*n_species+s]), 0.0));
+                        mesh_x[i*n_species+s] -= m;
+                        }
+                    if(!mesh_chstt[j*n_species+s])
+                        mesh_x[j*n_species+s] += m;
+                    }
+            }
+        }
+
+    virtual void AlgorithmSpecificInit()
+        {
+        this->neighbor_start.assign(n_meshes+1, 0);
+        this->neighbor_index.clear();
+        for(int i=0; i<n_meshes; i++)
+            {
+            for(int n=0; n<MeshNeighborN(i); n++)
+                this->neighbor_index.push_back(MeshNeighbor(i, n));
+            this->neighbor_start[i+1] = static_cast<int>(this->neighbor_index.size());
+            }
+
+        this->species_reactions.assign(n_species, std::vector<int>());
+        this->reaction_species.assign(n_reactions, std::vector<int>());
+        for(int s=0; s<n_species; s++)
+            for(int r=0; r<n_reactions; r++)
+                {
+                if(sub[s*n_reactions+r] != 0)
+                    this->species_reactions[s].push_back(r);
+                if(sto[s*n_reactions+r] != 0)
+                    this->reaction_species[r].push_back(s);
+                }
+
+        this->mesh_rc.assign(n_reactions*n_meshes, 0);
+        this->mesh_dc.assign(n_species*neighbor_index.size(), 0);
+        this->mesh_ar.assign(n_reactions*n_meshes, 0);
+        this->mesh_ad.assign(n_species*neighbor_index.size(), 0);
+        this->mesh_a0r.assign(n_meshes, 0);
+        this->mesh_a0d.assign(n_meshes, 0);
+        this->mesh_dxdt.assign(n_species*n_meshes, 0);
+        this->mesh_changed.assign(n_species*n_meshes, 0);
+        this->continuous_x.clear();
+        this->has_continuous = false;
+        this->partition_counts.assign(4, 0);
+        // the stochastic region is kept when the simulation is reset
+        if(static_cast<int>(this->mesh_stochastic.size()) != n_meshes)
+            {
+            this->spatial = false;
+            this->mesh_stochastic.assign(n_meshes, 0);
+            }
+        if(this->spatial)
+            Partition();
+        }
+
+    public :
+
+    HybridBase()
+        {
+        population_threshold = 100;
+        propensity_threshold = 10;
+        spatial = false;
+        }
+
+    virtual ~HybridBase()
+        {
+        }
+
+    virtual void SetHybridThresholds(double population_threshold, double propensity_threshold)
+        {
+        this->population_threshold = population_threshold;
+        this->propensity_threshold = propensity_threshold;
+        }
+
+    virtual void SetHybridRegion(const std::vector<int> & mesh_stochastic)
+        {
+        this->spatial = !mesh_stochastic.empty();
+        this->mesh_stochastic.assign(n_meshes, 0);
+        for(int i=0; i<n_meshes && i<static_cast<int>(mesh_stochastic.size()); i++)
+            this->mesh_stochastic[i] = mesh_stochastic[i] != 0;
+        if(spatial)
+            Partition();
+        }
+
+    virtual std::vector<int> HybridPartition()
+        {
+        return partition_counts;
+        }
+
+    virtual bool Iterate()
+        {
+        sampling_done_this_iteration = false; // reset the flag
+
+        if(complete)
+          return false;
+
+        if(spatial)
+            {
+            InterfaceStep();
+            ContinuousStep(dt);
+            StochasticStep(false);
+            }
+        else
+            {
+            Partition();
+            StochasticStep(true);
+            }
+        t += dt;
+        SamplingStep();
+        CheckTMax();
+        return !complete;
+        }
+    };
@@ -0,0 +1,32 @@
+//implementation using a hybrid stochastic/deterministic method with a static time step (see HybridBase)
+//in a graph space
+
+class HybridGraph : public HybridBase<SimulationAlgorithmGraphBase>
+    {
+    protected :
+
+    virtual int MeshNeighborN(int mesh_index)
+        {
+        return mesh_neighbor_n[mesh_index];
+        }
+
+    virtual int MeshNeighbor(int mesh_index, int direction)
+        {
+        return mesh_neighbor_index[mesh_index][direction];
+        }
+
+    public :
+
+    HybridGraph()
+        {
+        }
+
+    virtual ~HybridGraph()
+        {
+        }
+
+    virtual SimulationAlgorithmGraphBase * Clone()
+        {
+        return new HybridGraph(*this);
+        }
+    };
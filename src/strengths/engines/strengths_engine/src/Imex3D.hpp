@@ -0,0 +1,108 @@
+//implementation using an implicit-explicit (IMEX) splitting :
+//each step integrates the reactions with the Euler method, then the diffusion
+//with the backward Euler method (see ImplicitDiffusion), which is stable for any time step.
+
+class Imex3D : public SimulationAlgorithm3DBase
+    {
+    private :
+
+    std::vector<double> mesh_dxdt; //species quantities derivative due to reactions
+    ImplicitDiffusion diffusion;
+
+    void Compute_dxdt()
+        {
+        std::vector<double> rr(n_reactions);
+        for(int i=0; i<n_meshes; i++)
+            {
+            //reaction rates
+            for(int r=0; r<n_reactions; r++)
+                rr[r] = ReactionRate(i, r);
+
+            for(int s=0; s<n_species; s++)
+              {
+              mesh_dxdt[i*n_species+s] = 0;
+              if(mesh_chstt[i*n_species+s]) continue;
+
+              for(int r=0; r<n_reactions; r++)
+                {
+                mesh_dxdt[i*n_species+s] += sto[s*n_reactions+r]*rr[r];
+                }
+              }
+            }
+        }
+
+    void Apply_dxdt()
+        {
+        for(size_t i=0; i<mesh_x.size(); i++)
+            {
+            mesh_x[i] += mesh_dxdt[i]*dt;
+            }
+        }
+
+    virtual void AlgorithmSpecificInit()
+        {
+        this->mesh_dxdt.resize(n_species*n_meshes);
+        diffusion.Init(n_meshes, n_species, std::vector<double>(n_meshes, mesh_vol), mesh_chstt);
+        for(int i=0; i<n_meshes; i++)
+            {
+            std::vector<int> neighbors;
+            for(int n=0; n<6; n++)
+                if(mesh_neighbors[i*6+n] != -1)
+                    neighbors.push_back(mesh_neighbors[i*6+n]);
+            diffusion.AddMesh(neighbors);
+            }
+        std::vector<double> g;
+        g.reserve(static_cast<size_t>(n_species)*diffusion.NNeighbors());
+        for(int s=0; s<n_species; s++)
+            for(int i=0; i<n_meshes; i++)
+                for(int n=0; n<6; n++)
+                    if(mesh_neighbors[i*6+n] != -1)
+                        g.push_back(mesh_kd[i*n_species*6+s*6+n]*mesh_vol);
+        diffusion.SetConductances(g);
+        }
+
+    public :
+
+    Imex3D()
+        {
+        }
+
+    virtual ~Imex3D()
+        {
+        }
+
+    virtual SimulationAlgorithm3DBase * Clone()
+        {
+        return new Imex3D(*this);
+        }
+
+    virtual double StableTimeStep()
+    // the diffusion being implicit, only the reactions bound the time step.
+        {
+        return stable_dt_reactions;
+        }
+
+    virtual double AutomaticTimeStep()
+        {
+        if(std::isfinite(stable_dt_reactions))
+            return 0.1*stable_dt_reactions;
+        return SimulationAlgorithm3DBase::AutomaticTimeStep();
+        }
+
+    virtual bool Iterate()
+        {
+        sampling_done_this_iteration = false; // reset the flag
+
+        if(complete)
+          return false;
+
+        Compute_dxdt();
+        Apply_dxdt();
+        diffusion.Step(mesh_x, dt);
+        t += dt;
+        SamplingStep();
+        CheckTMax();
+        return !complete;
+        }
+
+    };
@@ -0,0 +1,198 @@
+//implements the implicit (backward Euler) integration of the diffusion,
+//shared by the grid and graph IMEX algorithms.
+//
+//the diffusion flux from mesh i to its neighbor j is g_ij*(c_i-c_j), where c = x/vol is the concentration and
+//g_ij = kd_ij*vol_i is the (symmetric) conductance of the edge. A backward Euler step of length dt solves,
+//for each species and each non chemostated mesh i,
+//
+//    vol_i*c_i + dt*sum_j g_ij*(c_i-c_j) = x_i
+//
+//where the concentrations of the chemostated meshes are fixed. The system is symmetric positive definite,
+//and is solved with the Jacobi preconditioned conjugate gradient method [1].
+//
+//reference :
+//[1] Saad, Y. (2003). Iterative methods for sparse linear systems (2nd ed.). SIAM. https://doi.org/10.1137/1.9780898718003
+
+class ImplicitDiffusion
+    {
+    private :
+
+    int n_meshes;
+    int n_species;
+    std::vector<double> vol;                // mesh volumes
+    std::vector<int> neighbor_start;        // neighbors of mesh i are neighbor_index[neighbor_start[i]:neighbor_start[i+1]]
+    std::vector<int> neighbor_index;        // neighbor mesh index
+    std::vector<double> conductance;        // [species][neighbor] edge conductance
+    std::vector<int> chstt;                 // chemostats, mesh first array : [mesh [species]]
+    double rtol;                            // relative tolerance on the residual norm
+    int n_iterations;                       // total number of conjugate gradient iterations
+
+    // work vectors
+    std::vector<double> c, r, z, p, q, rhs;
+
+    bool Free(int i, int s)
+        {
+        return !chstt[i*n_species+s];
+        }
+
+    void Apply(int s, double dt, const std::vector<double> & v, std::vector<double> & out)
+    // out = A v on the non chemostated meshes, the chemostated ones being set to 0 in v.
+        {
+        const double * g = &conductance[static_cast<size_t>(s)*neighbor_index.size()];
+        for(int i=0; i<n_meshes; i++)
+            {
+            if(!Free(i, s))
+                {
+                out[i] = 0;
+                continue;
+                }
+            double a = vol[i]*v[i];
+            for(int n=neighbor_start[i]; n<neighbor_start[i+1]; n++)
+                {
+                int j = neighbor_index[n];
+                a += dt*g[n]*(v[i] - (Free(j, s) ? v[j] : 0));
+                }
+            out[i] = a;
+            }
+        }
+
+    double Dot(int s, const std::vector<double> & a, const std::vector<double> & b)
+        {
+        double sum = 0;
+        for(int i=0; i<n_meshes; i++)
+            if(Free(i, s)) sum += a[i]*b[i];
+        return sum;
+        }
+
+    void Precondition(int s, double dt, const std::vector<double> & v, std::vector<double> & out)
+    // out = D^-1 v, D being the diagonal of A.
+        {
+        const double * g = &conductance[static_cast<size_t>(s)*neighbor_index.size()];
+        for(int i=0; i<n_meshes; i++)
+            {
+            if(!Free(i, s))
+                {
+                out[i] = 0;
+                continue;
+                }
+            double diag = vol[i];
+            for(int n=neighbor_start[i]; n<neighbor_start[i+1]; n++)
+                if(neighbor_index[n] != i) diag += dt*g[n];
+            out[i] = v[i]/diag;
+            }
+        }
+
+    public :
+
+    ImplicitDiffusion()
+        {
+        n_meshes = 0;
+        n_species = 0;
+        rtol = 1e-12;
+        n_iterations = 0;
+        }
+
+    void Init(int n_meshes, int n_species, const std::vector<double> & vol, const std::vector<int> & chstt)
+    // starts the definition of the diffusion operator, the neighbors being added with AddMesh in mesh order.
+        {
+        this->n_meshes = n_meshes;
+        this->n_species = n_species;
+        this->vol = vol;
+        this->chstt = chstt;
+        this->neighbor_start.assign(1, 0);
+        this->neighbor_index.clear();
+        this->n_iterations = 0;
+        this->c.assign(n_meshes, 0);
+        this->r.assign(n_meshes, 0);
+        this->z.assign(n_meshes, 0);
+        this->p.assign(n_meshes, 0);
+        this->q.assign(n_meshes, 0);
+        this->rhs.assign(n_meshes, 0);
+        }
+
+    void AddMesh(const std::vector<int> & neighbors)
+    // adds the neighbors of the next mesh.
+        {
+        neighbor_index.insert(neighbor_index.end(), neighbors.begin(), neighbors.end());
+        neighbor_start.push_back(static_cast<int>(neighbor_index.size()));
+        }
+
+    void SetConductances(const std::vector<double> & g)
+    // sets the conductances, [species][neighbor] (in the order of the neighbors given by AddMesh).
+        {
+        conductance = g;
+        }
+
+    int NNeighbors()
+        {
+        return static_cast<int>(neighbor_index.size());
+        }
+
+    int NIterations()
+        {
+        return n_iterations;
+        }
+
+    void Step(std::vector<double> & mesh_x, double dt)
+    // integrates the diffusion of the state mesh_x (mesh first array) over dt.
+        {
+        const size_t n_neighbors = neighbor_index.size();
+        for(int s=0; s<n_species; s++)
+            {
+            const double * g = &conductance[s*n_neighbors];
+
+            // right hand side and initial guess
+            for(int i=0; i<n_meshes; i++)
+                {
+                c[i] = mesh_x[i*n_species+s]/vol[i];
+                rhs[i] = 0;
+                }
+            double rhs_norm2 = 0;
+            for(int i=0; i<n_meshes; i++)
+                {
+                if(!Free(i, s)) continue;
+                rhs[i] = mesh_x[i*n_species+s];
+                for(int n=neighbor_start[i]; n<neighbor_start[i+1]; n++)
+                    {
+                    int j = neighbor_index[n];
+                    if(!Free(j, s)) rhs[i] += dt*g[n]*c[j];
+                    }
+                rhs_norm2 += rhs[i]*rhs[i];
+                }
+            if(rhs_norm2 == 0) continue;
+
+            // preconditioned conjugate gradient
+            Apply(s, dt, c, q);
+            for(int i=0; i<n_meshes; i++)
+                r[i] = Free(i, s) ? rhs[i]-q[i] : 0;
+            Precondition(s, dt, r, z);
+            p = z;
+            double rz = Dot(s, r, z);
+            double tol2 = rtol*rtol*rhs_norm2;
+            for(int k=0; k<2*n_meshes+10; k++)
+                {
+                if(Dot(s, r, r) <= tol2) break;
+                Apply(s, dt, p, q);
+                double pq = Dot(s, p, q);
+                if(pq <= 0) break;
+                double alpha = rz/pq;
+                for(int i=0; i<n_meshes; i++)
+                    {
+                    if(!Free(i, s)) continue;
+                    c[i] += alpha*p[i];
+                    r[i] -= alpha*q[i];
+                    }
+                Precondition(s, dt, r, z);
+                double rz_new = Dot(s, r, z);
+                double beta = rz_new/rz;
+                rz = rz_new;
+                for(int i=0; i<n_meshes; i++)
+                    p[i] = z[i] + beta*p[i];
+                n_iterations++;
+                }
+
+            for(int i=0; i<n_meshes; i++)
+                if(Free(i, s)) mesh_x[i*n_species+s] = c[i]*vol[i];
+            }
+        }
+    };
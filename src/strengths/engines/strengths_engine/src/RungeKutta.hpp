@@ -0,0 +1,271 @@
+//implements the embedded Runge-Kutta pairs and the step size control of the adaptive algorithms,
+//shared by the grid and graph algorithms :
+//
+//  method 0 : Dormand-Prince 5(4) pair [1] ("rk45")
+//  method 1 : Bogacki-Shampine 3(2) pair [2] ("rk23")
+//
+//both pairs have the first same as last property : the derivative at the end of a step is computed
+//as the last stage of the step, and is reused as the first stage of the next one.
+//the local error, estimated as the difference between the two solutions of the pair, is measured with
+//the root mean square norm of error_i/(atol+rtol*max(|x_i(t)|, |x_i(t+h)|)), and the step is accepted
+//if this norm is lower than 1. The step size is then adapted as in [3] (section II.4).
+//the states between two steps are obtained with the continuous extensions (dense output) of the pairs [3] (section II.6),
+//of order 4 for the Dormand-Prince pair and 3 for the Bogacki-Shampine pair.
+//
+//references :
+//[1] Dormand, J. R., & Prince, P. J. (1980). A family of embedded Runge-Kutta formulae. Journal of Computational and Applied Mathematics, 6(1), 19-26. https://doi.org/10.1016/0771-050X(80)90013-3
+//[2] Bogacki, P., & Shampine, L. F. (1989). A 3(2) pair of Runge-Kutta formulas. Applied Mathematics Letters, 2(4), 321-325. https://doi.org/10.1016/0893-9659(89)90079-7
+//[3] Hairer, E., Norsett, S. P., & Wanner, G. (1993). Solving ordinary differential equations I : nonstiff problems (2nd ed.). Springer. https://doi.org/10.1007/978-3-540-78862-1
+
+class EmbeddedRungeKutta
+    {
+    private :
+
+    int n_stages;                           // number of stages
+    int order;                              // order of the propagated solution
+    int error_order;                        // order of the embedded solution used for the error estimation
+    std::vector<double> a;                  // [stage][stage] Runge-Kutta matrix
+    std::vector<double> e;                  // difference between the weights of the two solutions
+    std::vector<double> p;                  // [stage][power] coefficients of the continuous extension
+    int n_powers;                           // degree of the continuous extension
+    double rtol;                            // relative tolerance on the local error
+    double atol;                            // absolute tolerance on the local error
+
+    std::vector<double> x_start;            // state at the start of the last step
+    std::vector<double> dxdt_start;         // time derivative of x_start
+    std::vector<double> x_stage;            // state of the current stage
+    std::vector<std::vector<double> > k;    // derivatives of the stages (k[0] is unused, dxdt_start being the first stage)
+    double t_start;                         // time at the start of the last step
+    double h_last;                          // length of the last step
+
+    const std::vector<double> & K(int stage)
+        {
+        return stage == 0 ? dxdt_start : k[stage];
+        }
+
+    double ErrorScale(double x0, double x1)
+        {
+        return atol + rtol*std::max(fabs(x0), fabs(x1));
+        }
+
+    double ScaledNorm(const std::vector<double> & v, const std::vector<double> & x0, const std::vector<double> & x1)
+    // root mean square norm of v_i/(atol+rtol*max(|x0_i|, |x1_i|)).
+        {
+        if(v.empty()) return 0;
+        double sum = 0;
+        for(size_t i=0; i<v.size(); i++)
+            {
+            if(v[i] == 0) continue;
+            double r = v[i]/ErrorScale(x0[i], x1[i]);
+            sum += r*r;
+            }
+        return sqrt(sum/v.size());
+        }
+
+    template<typename F> double Step(F derivative, double h)
+    // computes a step of length h from x_start. The propagated solution is stored in x_stage,
+    // its time derivative in k[n_stages-1], and the local error norm is returned.
+        {
+        size_t size = x_start.size();
+        for(int s=1; s<n_stages; s++)
+            {
+            for(size_t i=0; i<size; i++)
+                {
+                double dx = 0;
+                for(int j=0; j<s; j++)
+                    dx += a[s*n_stages+j]*K(j)[i];
+                x_stage[i] = x_start[i] + h*dx;
+                }
+            derivative(x_stage, k[s]);
+            }
+
+        double sum = 0;
+        for(size_t i=0; i<size; i++)
+            {
+            double err = 0;
+            for(int j=0; j<n_stages; j++)
+                err += e[j]*K(j)[i];
+            err *= h;
+            if(err == 0) continue;
+            double r = err/ErrorScale(x_start[i], x_stage[i]);
+            sum += r*r;
+            }
+        return size > 0 ? sqrt(sum/size) : 0;
+        }
+
+    double NextStepSize(double h, double error, bool rejected)
+    // step size for the next attempt, according to the error norm of the step of length h.
+        {
+        double factor = 10;
+        if(error > 0)
+            factor = 0.9*pow(error, -1.0/(error_order+1));
+        if(!std::isfinite(factor) || factor < 0.2) factor = 0.2;
+        if(factor > 10) factor = 10;
+        if(rejected && factor > 1) factor = 1;
+        return h*factor;
+        }
+
+    public :
+
+    EmbeddedRungeKutta()
+        {
+        Init(0, 0);
+        }
+
+    void Init(int method, int size)
+    // sets the Runge-Kutta pair (see above) and the size of the states.
+        {
+        if(method == 1)
+            {
+            n_stages = 4;
+            order = 3;
+            error_order = 2;
+            a = {0,       0,       0,       0,
+                 1.0/2,   0,       0,       0,
+                 0,       3.0/4,   0,       0,
+                 2.0/9,   1.0/3,   4.0/9,   0};
+            e = {2.0/9-7.0/24, 1.0/3-1.0/4, 4.0/9-1.0/3, -1.0/8};
+            n_powers = 3;
+            p = {1, -4.0/3,  5.0/9,
+                 0,  1,     -2.0/3,
+                 0,  4.0/3, -8.0/9,
+                 0, -1,      1};
+            }
+        else
+            {
+            n_stages = 7;
+            order = 5;
+            error_order = 4;
+            a = {0,            0,             0,            0,          0,             0,       0,
+                 1.0/5,        0,             0,            0,          0,             0,       0,
+                 3.0/40,       9.0/40,        0,            0,          0,             0,       0,
+                 44.0/45,      -56.0/15,      32.0/9,       0,          0,             0,       0,
+                 19372.0/6561, -25360.0/2187, 64448.0/6561, -212.0/729, 0,             0,       0,
+                 9017.0/3168,  -355.0/33,     46732.0/5247, 49.0/176,   -5103.0/18656, 0,       0,
+                 35.0/384,     0,             500.0/1113,   125.0/192,  -2187.0/6784,  11.0/84, 0};
+            e = {35.0/384-5179.0/57600, 0, 500.0/1113-7571.0/16695, 125.0/192-393.0/640,
+                 -2187.0/6784+92097.0/339200, 11.0/84-187.0/2100, -1.0/40};
+            n_powers = 4;
+            p = {1, -8048581381.0/2820520608,    8663915743.0/2820520608,    -12715105075.0/11282082432,
+                 0,  0,                          0,                           0,
+                 0,  131558114200.0/32700410799, -68118460800.0/10900136933,  87487479700.0/32700410799,
+                 0, -1754552775.0/470086768,      14199869525.0/1410260304,   -10690763975.0/1880347072,
+                 0,  127303824393.0/49829197408, -318862633887.0/49829197408, 701980252875.0/199316789632,
+                 0, -282668133.0/205662961,       2019193451.0/616988883,     -1453857185.0/822651844,
+                 0,  40617522.0/29380423,        -110615467.0/29380423,        69997945.0/29380423};
+            }
+        rtol = 1e-3;
+        atol = 1e-6;
+        t_start = 0;
+        h_last = 0;
+        x_start.assign(size, 0);
+        dxdt_start.assign(size, 0);
+        x_stage.assign(size, 0);
+        k.assign(n_stages, std::vector<double>(size, 0));
+        k[0].clear();
+        }
+
+    void SetTolerances(double rtol, double atol)
+        {
+        this->rtol = rtol;
+        this->atol = atol;
+        }
+
+    template<typename F> double InitialStepSize(F derivative, const std::vector<double> & x, const std::vector<double> & dxdt, double h_max)
+    // returns the initial step size estimated from the state x and its derivative dxdt, as in [3] (section II.4).
+    // h_max is the maximal step size (ignored if not positive).
+        {
+        double d0 = ScaledNorm(x, x, x);
+        double d1 = ScaledNorm(dxdt, x, x);
+        double h0 = (d0 < 1e-5 || d1 < 1e-5) ? 1e-6 : 0.01*d0/d1;
+        if(h_max > 0) h0 = std::min(h0, h_max);
+
+        // explicit Euler step, to estimate the second derivative
+        std::vector<double> & dxdt1 = k[n_stages-1];
+        for(size_t i=0; i<x.size(); i++)
+            x_stage[i] = x[i] + h0*dxdt[i];
+        derivative(x_stage, dxdt1);
+        std::vector<double> ddx(x.size());
+        for(size_t i=0; i<x.size(); i++)
+            ddx[i] = (dxdt1[i] - dxdt[i])/h0;
+        double d2 = ScaledNorm(ddx, x, x);
+
+        double h1;
+        if(std::max(d1, d2) <= 1e-15)
+            h1 = std::max(1e-6, h0*1e-3);
+        else
+            h1 = pow(0.01/std::max(d1, d2), 1.0/(order+1));
+
+        double h = std::min(100*h0, h1);
+        if(h_max > 0) h = std::min(h, h_max);
+        return h;
+        }
+
+    template<typename F> void Advance(F derivative, std::vector<double> & x, std::vector<double> & dxdt, double & t, double & dt, double t_end)
+    // advances the state x at time t, of time derivative dxdt, by one accepted step of length dt at most,
+    // without going past t_end (if t_end is not negative). dt is then set to the size proposed for the next step.
+    // the state and derivative at the start of the step are kept for interpolation (see Interpolate).
+        {
+        x_start.swap(x);
+        dxdt_start.swap(dxdt);
+        t_start = t;
+
+        bool rejected = false;
+        for(;;)
+            {
+            double h = dt;
+            bool last = t_end >= 0 && t_start+h >= t_end;
+            if(last) h = t_end-t_start;
+
+            double error = Step(derivative, h);
+            double h_min = 16*std::numeric_limits<double>::epsilon()*std::max(fabs(t_start), 1e-300);
+            if(error <= 1 || h <= h_min)
+                {
+                double h_next = NextStepSize(h, error, rejected);
+                // a step shortened to reach t_end does not reduce the next step size
+                dt = last ? std::max(dt, h_next) : h_next;
+                h_last = h;
+                t = last ? t_end : t_start+h;
+                x.swap(x_stage);
+                dxdt.swap(k[n_stages-1]);
+                return;
+                }
+            dt = NextStepSize(h, error, true);
+            rejected = true;
+            }
+        }
+
+    void Interpolate(double t_x, const std::vector<double> & x, const std::vector<double> & dxdt, std::vector<double> & out)
+    // interpolates the state at time t_x within the last step, x and dxdt being the state and
+    // its derivative at the end of the step (the last stage of the step).
+        {
+        out.resize(x.size());
+        if(h_last <= 0)
+            {
+            out = x;
+            return;
+            }
+        double theta = std::min(std::max((t_x-t_start)/h_last, 0.0), 1.0);
+
+        // weight of each stage : h*sum_p p[stage][p]*theta^(p+1)
+        std::vector<double> w(n_stages, 0);
+        for(int s=0; s<n_stages; s++)
+            {
+            double theta_p = 1;
+            for(int q=0; q<n_powers; q++)
+                {
+                theta_p *= theta;
+                w[s] += p[s*n_powers+q]*theta_p;
+                }
+            w[s] *= h_last;
+            }
+
+        for(size_t i=0; i<x.size(); i++)
+            {
+            double dx = w[n_stages-1]*dxdt[i];
+            for(int s=0; s<n_stages-1; s++)
+                dx += w[s]*K(s)[i];
+            out[i] = x_start[i] + dx;
+            }
+        }
+    };
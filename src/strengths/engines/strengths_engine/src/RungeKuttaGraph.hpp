@@ -0,0 +1,121 @@
+//implementation using an embedded Runge-Kutta method with an adaptive time step (see EmbeddedRungeKutta)
+//in a graph space.
+//the states are sampled at the exact sample times, by interpolation, with the "on_t_sample" and "on_interval" policies.
+
+class RungeKuttaGraph : public SimulationAlgorithmGraphBase
+    {
+    private :
+
+    int method;                             // Runge-Kutta pair (see EmbeddedRungeKutta::Init)
+    double rtol;                            // relative tolerance on the local error
+    double atol;                            // absolute tolerance on the local error
+    EmbeddedRungeKutta rk;
+    std::vector<double> mesh_dxdt;          // time derivative of mesh_x
+    std::vector<double> interpolated_x;     // state interpolated at a sample time
+    bool dxdt_valid;                        // true if mesh_dxdt is the derivative of mesh_x at dxdt_t
+    double dxdt_t;
+
+    void Derivative(std::vector<double> & x, std::vector<double> & dxdt)
+    // computes the time derivative of the state x (mesh first array).
+        {
+        std::swap(mesh_x, x);
+        ComputeDerivative(dxdt);
+        std::swap(mesh_x, x);
+        }
+
+    void InterpolatedSample(double t_x)
+        {
+        rk.Interpolate(t_x, mesh_x, mesh_dxdt, interpolated_x);
+        PushSample(interpolated_x, t_x);
+        }
+
+    void DenseSamplingStep()
+    // manage the sampling procedure after a step, sampling at the exact sample times
+    // crossed by the step with the "on_t_sample" and "on_interval" policies.
+        {
+        switch(sampling_policy_code)
+          {
+          case 0 :
+            while(sample_pos<n_samples && t_samples[sample_pos]<=t)
+              {
+              InterpolatedSample(t_samples[sample_pos]);
+              sample_pos ++;
+              }
+            break;
+          case 2 :
+            while((last_tsi_ratio+1)*sampling_interval<=t)
+              {
+              last_tsi_ratio ++;
+              InterpolatedSample(last_tsi_ratio*sampling_interval);
+              }
+            break;
+          default : SamplingStep();
+          };
+        }
+
+    virtual void AlgorithmSpecificInit()
+        {
+        rk.Init(method, n_species*n_meshes);
+        rk.SetTolerances(rtol, atol);
+        this->mesh_dxdt.resize(n_species*n_meshes);
+        this->dxdt_valid = false;
+        this->dxdt_t = 0;
+        this->dt = 0; // chosen at the first iteration
+        }
+
+    public :
+
+    RungeKuttaGraph(int method)
+        {
+        this->method = method;
+        this->rtol = 1e-3;
+        this->atol = 1e-6;
+        }
+
+    virtual ~RungeKuttaGraph()
+        {
+        }
+
+    virtual SimulationAlgorithmGraphBase * Clone()
+        {
+        return new RungeKuttaGraph(*this);
+        }
+
+    virtual void SetTolerances(double rtol, double atol)
+        {
+        this->rtol = rtol;
+        this->atol = atol;
+        rk.SetTolerances(rtol, atol);
+        }
+
+    virtual bool Iterate()
+        {
+        sampling_done_this_iteration = false; // reset the flag
+
+        if(complete)
+          return false;
+
+        if(t_max>=0 && t>=t_max)
+          {
+          FlagAsComplete();
+          return false;
+          }
+
+        auto derivative = [this](std::vector<double> & x, std::vector<double> & dxdt) {Derivative(x, dxdt);};
+        if(!dxdt_valid || dxdt_t != t)
+          {
+          Derivative(mesh_x, mesh_dxdt);
+          dxdt_valid = true;
+          }
+        if(dt <= 0)
+          dt = rk.InitialStepSize(derivative, mesh_x, mesh_dxdt, t_max>=0 ? t_max-t : -1);
+
+        rk.Advance(derivative, mesh_x, mesh_dxdt, t, dt, t_max);
+        dxdt_t = t;
+        DenseSamplingStep();
+        if(t_max>=0 && t>=t_max)
+          FlagAsComplete();
+        return !complete;
+        }
+
+    };
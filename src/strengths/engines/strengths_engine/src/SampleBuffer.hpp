@@ -0,0 +1,192 @@
+//implements the storage of the sampled system states with a given data type
+
+class SampleBuffer
+    {
+    private :
+
+    int dtype_code;                 // storage data type : 0 : float64, 1 : float32, 2 : uint16, 3 : uint32, 4 : int32
+    int state_size;                 // size of a sampled state
+    int n_samples;                  // number of samples currently stored
+    bool overflow;                  // true if a sampled value could not be represented with the storage data type
+
+    std::vector<double>   data_f64; // sampled states (mesh first arrays), one vector per data type,
+    std::vector<float>    data_f32; // only the one matching dtype_code is used.
+    std::vector<uint16_t> data_u16;
+    std::vector<uint32_t> data_u32;
+    std::vector<int32_t>  data_i32;
+
+    template<typename T> void Reserve(std::vector<T> & data, size_t size)
+        {
+        data.clear();
+        data.reserve(size);
+        }
+
+    void PushFloat32(const std::vector<double> & x)
+        {
+        for(size_t i=0; i<x.size(); i++)
+            {
+            if(std::isfinite(x[i]) && fabs(x[i]) > std::numeric_limits<float>::max())
+                overflow = true;
+            data_f32.push_back(static_cast<float>(x[i]));
+            }
+        }
+
+    template<typename T> void PushInteger(std::vector<T> & data, const std::vector<double> & x)
+    // values are rounded to the nearest integer. Values that cannot be represented
+    // are clamped, and the overflow flag is raised.
+        {
+        double lo = static_cast<double>(std::numeric_limits<T>::min());
+        double hi = static_cast<double>(std::numeric_limits<T>::max());
+        for(size_t i=0; i<x.size(); i++)
+            {
+            double r = std::floor(x[i]+0.5);
+            if(!(r>=lo && r<=hi))
+                {
+                overflow = true;
+                if(std::isnan(r)) r = 0;
+                else r = std::min(std::max(r, lo), hi);
+                }
+            data.push_back(static_cast<T>(r));
+            }
+        }
+
+    template<typename T> void ExportSpeciesFirst(const std::vector<T> & data, T * out, int n_meshes, int n_species, int first, int count)
+        {
+        for(int n=0; n<count; n++)
+            for(int s=0; s<n_species; s++)
+                for(int i=0; i<n_meshes; i++)
+                    {
+                    //mesh first to species first
+                    out[static_cast<size_t>(n)*n_meshes*n_species + s*n_meshes + i] = data[static_cast<size_t>(first+n)*state_size + i*n_species + s];
+                    }
+        }
+
+    public :
+
+    SampleBuffer()
+        {
+        dtype_code = 0;
+        state_size = 0;
+        n_samples = 0;
+        overflow = false;
+        }
+
+    void Init(int dtype_code, int state_size, int expected_n_samples)
+    // clears the buffer and preallocates the storage for expected_n_samples states.
+        {
+        this->dtype_code = dtype_code;
+        this->state_size = state_size;
+        this->n_samples = 0;
+        this->overflow = false;
+
+        size_t size = static_cast<size_t>(std::max(expected_n_samples, 0))*state_size;
+        switch(dtype_code)
+          {
+          case 0 : Reserve(data_f64, size); break;
+          case 1 : Reserve(data_f32, size); break;
+          case 2 : Reserve(data_u16, size); break;
+          case 3 : Reserve(data_u32, size); break;
+          case 4 : Reserve(data_i32, size); break;
+          };
+        }
+
+    void Push(const std::vector<double> & x)
+    // appends the state x (mesh first array) to the buffer.
+        {
+        switch(dtype_code)
+          {
+          case 0 : data_f64.insert(data_f64.end(), x.begin(), x.end()); break;
+          case 1 : PushFloat32(x); break;
+          case 2 : PushInteger(data_u16, x); break;
+          case 3 : PushInteger(data_u32, x); break;
+          case 4 : PushInteger(data_i32, x); break;
+          };
+        n_samples++;
+        }
+
+    int NSamples()
+        {
+        return n_samples;
+        }
+
+    int DTypeCode()
+        {
+        return dtype_code;
+        }
+
+    bool Overflow()
+        {
+        return overflow;
+        }
+
+    size_t ItemSize()
+    // size in bytes of a stored value.
+        {
+        switch(dtype_code)
+          {
+          case 1 : return sizeof(float);
+          case 2 : return sizeof(uint16_t);
+          case 3 : return sizeof(uint32_t);
+          case 4 : return sizeof(int32_t);
+          };
+        return sizeof(double);
+        }
+
+    void Save(std::ostream & out)
+    // writes the buffer content in out.
+        {
+        WriteValue(out, dtype_code);
+        WriteValue(out, state_size);
+        WriteValue(out, n_samples);
+        WriteValue(out, overflow);
+        switch(dtype_code)
+          {
+          case 0 : WriteVector(out, data_f64); break;
+          case 1 : WriteVector(out, data_f32); break;
+          case 2 : WriteVector(out, data_u16); break;
+          case 3 : WriteVector(out, data_u32); break;
+          case 4 : WriteVector(out, data_i32); break;
+          };
+        }
+
+    bool Load(std::istream & in)
+    // reads the buffer content from in. Returns false if the data cannot be read
+    // or if they do not match the buffer data type and state size.
+        {
+        int dtype_code_in, state_size_in;
+        if(!ReadValue(in, dtype_code_in) || !ReadValue(in, state_size_in))
+            return false;
+        if(dtype_code_in != dtype_code || state_size_in != state_size)
+            return false;
+        if(!ReadValue(in, n_samples) || !ReadValue(in, overflow))
+            return false;
+        switch(dtype_code)
+          {
+          case 0 : return ReadVector(in, data_f64);
+          case 1 : return ReadVector(in, data_f32);
+          case 2 : return ReadVector(in, data_u16);
+          case 3 : return ReadVector(in, data_u32);
+          case 4 : return ReadVector(in, data_i32);
+          };
+        return false;
+        }
+
+    void Export(void * out, int n_meshes, int n_species)
+    // writes the sampled states in out as species first arrays of the storage data type.
+        {
+        ExportRange(out, n_meshes, n_species, 0, n_samples);
+        }
+
+    void ExportRange(void * out, int n_meshes, int n_species, int first, int count)
+    // writes the sampled states first to first+count-1 in out as species first arrays of the storage data type.
+        {
+        switch(dtype_code)
+          {
+          case 0 : ExportSpeciesFirst(data_f64, static_cast<double*>  (out), n_meshes, n_species, first, count); break;
+          case 1 : ExportSpeciesFirst(data_f32, static_cast<float*>   (out), n_meshes, n_species, first, count); break;
+          case 2 : ExportSpeciesFirst(data_u16, static_cast<uint16_t*>(out), n_meshes, n_species, first, count); break;
+          case 3 : ExportSpeciesFirst(data_u32, static_cast<uint32_t*>(out), n_meshes, n_species, first, count); break;
+          case 4 : ExportSpeciesFirst(data_i32, static_cast<int32_t*> (out), n_meshes, n_species, first, count); break;
+          };
+        }
+    };
@@ -0,0 +1,63 @@
+//implements binary (de)serialization helpers used for the engine checkpoints
+
+template<typename T> void WriteValue(std::ostream & out, const T & v)
+    {
+    out.write(reinterpret_cast<const char*>(&v), sizeof(T));
+    }
+
+template<typename T> bool ReadValue(std::istream & in, T & v)
+    {
+    in.read(reinterpret_cast<char*>(&v), sizeof(T));
+    return static_cast<bool>(in);
+    }
+
+template<typename T> void WriteVector(std::ostream & out, const std::vector<T> & v)
+    {
+    uint64_t size = v.size();
+    WriteValue(out, size);
+    if(size>0)
+        out.write(reinterpret_cast<const char*>(v.data()), size*sizeof(T));
+    }
+
+template<typename T> bool ReadVector(std::istream & in, std::vector<T> & v)
+    {
+    uint64_t size = 0;
+    if(!ReadValue(in, size))
+        return false;
+    v.resize(size);
+    if(size>0)
+        in.read(reinterpret_cast<char*>(v.data()), size*sizeof(T));
+    return static_cast<bool>(in);
+    }
+
+void WriteString(std::ostream & out, const std::string & s)
+    {
+    std::vector<char> v(s.begin(), s.end());
+    WriteVector(out, v);
+    }
+
+bool ReadString(std::istream & in, std::string & s)
+    {
+    std::vector<char> v;
+    if(!ReadVector(in, v))
+        return false;
+    s = std::string(v.begin(), v.end());
+    return true;
+    }
+
+void WriteRNG(std::ostream & out, const std::mt19937 & rng)
+    {
+    std::ostringstream ss;
+    ss << rng;
+    WriteString(out, ss.str());
+    }
+
+bool ReadRNG(std::istream & in, std::mt19937 & rng)
+    {
+    std::string s;
+    if(!ReadString(in, s))
+        return false;
+    std::istringstream ss(s);
+    ss >> rng;
+    return !ss.fail();
+    }
@@ -23,7 +23,8 @@ class SimulationAlgorithm3DBase
     int sample_pos;                                 // index of the next sample time
     std::vector<double> t_samples;                  // timepoints at which the system state should be sampled
 
-    std::vector<std::vector<double>> sampled_mesh_x; // sampled system states.
+    SampleBuffer sampled_mesh_x;                     // sampled system states.
+    std::vector<double> last_sampled_mesh_x;         // last sampled system state (kept for on_change sampling).
     std::vector<double> sampled_t;                   // exact time at which each system states in sampled_mesh_x were sampled.
 
     int sampling_policy_code;                        // see Init arguments
@@ -31,9 +32,21 @@ class SimulationAlgorithm3DBase
     double t_max;                                    // see Init arguments
     bool sampling_done_this_iteration;               // flags that tells if sample() have been called for the current iteration.
     double last_tsi_ratio;                           // floored value of the t/sampling_interval used for on_interval sampling.
+    double sampling_rtol;                            // see Init arguments
+    double sampling_atol;                            // see Init arguments
+    double sampling_max_gap;                         // see Init arguments
+    std::vector<int> sampling_observables;           // see Init arguments
 
     double t;                                        // time
     double dt;                                       // time step
+    double time_step;                                // time step given at initialization
+    double stable_dt_reactions;                      // explicit stability bound of the reactions (see ComputeStabilityBounds)
+    double stable_dt_diffusion;                      // explicit stability bound of the diffusion (see ComputeStabilityBounds)
+    std::vector<double> stable_dt_species;           // explicit stability bound of each species, diffusion and reactions (see ComputeStabilityBounds)
+    std::vector<int> reaction_group;                 // 0 : reaction integrated over the whole time step (slow), 1 : sub-stepped (fast)
+    std::vector<int> diffusion_group;                // 0 : diffusion of the species integrated over the whole time step (slow), 1 : sub-stepped (fast)
+    int n_substeps;                                  // number of sub-steps of the fast processes per time step
+    double stable_dt_slow;                           // explicit stability bound of the slow processes (see SetMultirate)
     bool complete;                                   // true if all the sampling is done.
     std::mt19937 rng;                                // pseudo random number generator
     std::uniform_real_distribution<double> uiud;     // floating point uniform distribution in [0,1[
@@ -201,6 +214,79 @@ class SimulationAlgorithm3DBase
           }
         }
 
+    double SpeciesTotal(const std::vector<double> & x, int species_index)
+    // returns the total quantity of a species in the state x (mesh first array).
+        {
+        double total = 0;
+        for(int i=0; i<n_meshes; i++)
+            total += x[i*n_species+species_index];
+        return total;
+        }
+
+    void SampleOnChange()
+    // sample when the tracked observables have changed by more than
+    // sampling_atol + sampling_rtol*|value at the last sample| since the last sample,
+    // or when sampling_max_gap (if positive) has elapsed since the last sample.
+    // if no species is tracked, the change is measured as the norm of the state difference.
+        {
+        if(sampled_t.empty())
+          {
+          Sample();
+          return;
+          }
+
+        if(sampling_max_gap>0 && t-sampled_t.back()>=sampling_max_gap)
+          {
+          Sample();
+          return;
+          }
+
+        const std::vector<double> & last_x = last_sampled_mesh_x;
+
+        if(sampling_observables.empty())
+          {
+          double diff2 = 0;
+          double last2 = 0;
+          for(size_t i=0; i<mesh_x.size(); i++)
+            {
+            diff2 += (mesh_x[i]-last_x[i])*(mesh_x[i]-last_x[i]);
+            last2 += last_x[i]*last_x[i];
+            }
+          if(sqrt(diff2) > sampling_atol + sampling_rtol*sqrt(last2))
+            Sample();
+          }
+        else
+          {
+          for(size_t n=0; n<sampling_observables.size(); n++)
+            {
+            double current = SpeciesTotal(mesh_x, sampling_observables[n]);
+            double last = SpeciesTotal(last_x, sampling_observables[n]);
+            if(fabs(current-last) > sampling_atol + sampling_rtol*fabs(last))
+              {
+              Sample();
+              break;
+              }
+            }
+          }
+        }
+
+    int ExpectedNSamples()
+    // returns the number of samples expected according to the sampling policy,
+    // used to preallocate the sample storage (0 if it cannot be predicted).
+        {
+        double expected = 0;
+        switch(sampling_policy_code)
+          {
+          case 0 : expected = n_samples; break;
+          case 1 : if(t_max>=0 && dt>0) expected = t_max/dt + 2; break;
+          case 2 : if(t_max>=0 && sampling_interval>0) expected = t_max/sampling_interval + 2; break;
+          case 4 : if(t_max>=0 && sampling_max_gap>0) expected = t_max/sampling_max_gap + 2; break;
+          };
+        // the preallocation is limited to 2^24 values.
+        double max_expected = 16777216.0/std::max(n_meshes*n_species, 1);
+        return static_cast<int>(std::min(expected, max_expected));
+        }
+
     void SamplingStep()
     // manage the sampling procedure according to the samplng policy.
         {
@@ -210,6 +296,7 @@ class SimulationAlgorithm3DBase
           case 1 : Sample(); break;           //sample on iteration
           case 2 : SampleOnInterval(); break; //sample on interval
           case 3 : break;                     //no sample
+          case 4 : SampleOnChange(); break;   //sample on change
           };
         }
 
@@ -290,6 +377,155 @@ class SimulationAlgorithm3DBase
         // #######################################################################################
         }
 
+    bool InGroup(const std::vector<int> & groups, int index, int group)
+    // tells if a process belongs to the group (0 : slow, 1 : fast, -1 : any group).
+        {
+        return group < 0 || groups[index] == group;
+        }
+
+    void ComputeDerivative(std::vector<double> & dxdt, int group=-1)
+    // computes the deterministic time derivative of mesh_x (mesh first array) in dxdt, accounting for
+    // the processes of the group (0 : slow, 1 : fast, -1 : all, see SetMultirate). The derivatives of the chemostated quantities are 0.
+        {
+        std::vector<double> rr(n_reactions, 0);
+        for(int i=0; i<n_meshes; i++)
+            {
+            //reaction rates
+            for(int r=0; r<n_reactions; r++)
+                if(InGroup(reaction_group, r, group))
+                  rr[r] = ReactionRate(i, r);
+
+            for(int s=0; s<n_species; s++)
+              {
+              dxdt[i*n_species+s] = 0;
+              if(mesh_chstt[i*n_species+s]) continue;
+
+              //reaction
+              for(int r=0; r<n_reactions; r++)
+                {
+                dxdt[i*n_species+s] += sto[s*n_reactions+r]*rr[r];
+                }
+
+              //diffusion
+              if(!InGroup(diffusion_group, s, group)) continue;
+              for (int n=0; n<6; n++)
+                {
+                if(mesh_neighbors[i*6+n] != -1)
+                  dxdt[i*n_species+s] -= DiffusionRateDifference(i, s, n);
+                }
+              }
+            }
+        }
+
+    double ReactionRateDerivative(int mesh_index, int reaction_index, int species_index)
+    // computes the derivative of the deterministic reaction rate with respect to the quantity of a species
+        {
+        double e = sub[species_index*n_reactions+reaction_index];
+        if(e == 0) return 0;
+        double r = mesh_kr[mesh_index*n_reactions+reaction_index]*e*pow(mesh_x[mesh_index*n_species+species_index], e-1);
+        for(int s=0; s<n_species; s++)
+            if(s != species_index)
+                r *= pow(mesh_x[mesh_index*n_species+s], sub[s*n_reactions+reaction_index]);
+        return r;
+        }
+
+    double DiffusionExitRate(int mesh_index, int species_index)
+    // returns the sum of the diffusion rate constants of a species out of a mesh.
+        {
+        int i = mesh_index;
+        int s = species_index;
+        double rate = 0;
+        for(int n=0; n<6; n++)
+            rate += mesh_kd[i*n_species*6+s*6+n];
+        return rate;
+        }
+
+    double ReactionLossRate(int mesh_index, int species_index, int group=-1)
+    // returns the derivative of the consumption rate of a species by the reactions of the group with respect to its quantity.
+        {
+        double rate = 0;
+        for(int r=0; r<n_reactions; r++)
+            if(sto[species_index*n_reactions+r] < 0 && InGroup(reaction_group, r, group))
+                rate -= sto[species_index*n_reactions+r]*ReactionRateDerivative(mesh_index, r, species_index);
+        return rate;
+        }
+
+    void ComputeStabilityBounds()
+    // computes the largest time steps for which the explicit Euler method keeps the quantities positive :
+    // 1/max(k_out) for the diffusion, k_out being the sum of the diffusion rate constants out of a mesh,
+    // and 1/max(k_loss) for the reactions, k_loss being the derivative of the consumption rate of a species
+    // with respect to its quantity, evaluated at the current state (the initial state at initialization).
+    // the bound of a species, 1/max(k_out+k_loss), accounts for both its diffusion and its consumption.
+    // a bound is infinite if there is no diffusion or no consumption.
+        {
+        double max_diffusion = 0;
+        double max_reactions = 0;
+        std::vector<double> max_species(n_species, 0);
+        for(int i=0; i<n_meshes; i++)
+          {
+          for(int s=0; s<n_species; s++)
+            {
+            if(mesh_chstt[i*n_species+s]) continue;
+            double rate_diffusion = DiffusionExitRate(i, s);
+            double rate_reactions = ReactionLossRate(i, s);
+            max_diffusion = std::max(max_diffusion, rate_diffusion);
+            max_reactions = std::max(max_reactions, rate_reactions);
+            max_species[s] = std::max(max_species[s], rate_diffusion+rate_reactions);
+            }
+          }
+        stable_dt_diffusion = Bound(max_diffusion);
+        stable_dt_reactions = Bound(max_reactions);
+        stable_dt_species.resize(n_species);
+        for(int s=0; s<n_species; s++)
+            stable_dt_species[s] = Bound(max_species[s]);
+        }
+
+    double Bound(double max_rate)
+    // returns the explicit stability bound 1/max_rate (infinite if max_rate is 0).
+        {
+        return max_rate > 0 ? 1/max_rate : std::numeric_limits<double>::infinity();
+        }
+
+    virtual double AutomaticTimeStep()
+    // returns the time step chosen when none is given : a tenth of the reactions stability bound, for accuracy,
+    // and at most half the diffusion stability bound, for which the explicit diffusion is not oscillating.
+        {
+        double h = std::min(0.1*stable_dt_reactions, 0.5*stable_dt_diffusion);
+        if(!std::isfinite(h)) return t_max > 0 ? t_max : 1;
+        return h;
+        }
+
+    int Substeps(double dt, double bound)
+    // returns the number of sub-steps needed to integrate over dt within a stability bound.
+        {
+        if(!(dt > 0) || !std::isfinite(bound)) return 1;
+        return std::max(1, static_cast<int>(ceil(dt/bound*(1-1e-12))));
+        }
+
+    double GroupStabilityBound(int group)
+    // returns the explicit stability bound of the processes of a group, evaluated at the current state.
+        {
+        double max_rate = 0;
+        for(int i=0; i<n_meshes; i++)
+          for(int s=0; s<n_species; s++)
+            {
+            if(mesh_chstt[i*n_species+s]) continue;
+            double rate = ReactionLossRate(i, s, group);
+            if(InGroup(diffusion_group, s, group)) rate += DiffusionExitRate(i, s);
+            max_rate = std::max(max_rate, rate);
+            }
+        return Bound(max_rate);
+        }
+
+    void PushSample(const std::vector<double> & x, double t_x)
+    // stores the state x (mesh first array), sampled at time t_x.
+        {
+        sampled_mesh_x.Push(x);
+        sampled_t.push_back(t_x);
+        if(sampling_policy_code == 4)
+          last_sampled_mesh_x = x;
+        }
+
     virtual void AlgorithmSpecificInit() = 0;
     // should contain algorithm specific initialization steps, in order to avoid overwriting the constructor
 
@@ -325,9 +561,14 @@ class SimulationAlgorithm3DBase
         std::vector<double> t_samples,  //sample timepoints
         int sampling_policy_code,       //tells when the system state should be sampled
         double sampling_interval,       //interval at which the system state should be sampled (if sampling_policy_code=2)
+        double sampling_rtol,           //relative change threshold (if sampling_policy_code=4)
+        double sampling_atol,           //absolute change threshold (if sampling_policy_code=4)
+        double sampling_max_gap,        //maximal time between two samples (if sampling_policy_code=4 and if positive)
+        std::vector<int> sampling_observables, //indices of the species which total quantity is tracked (if sampling_policy_code=4). if empty, the whole state is tracked.
         double t_max,                   //time past which the simulation should be flagged as complete (if negative, there is no t_max).
-        double time_step,               //time step
-        int seed                        //rng seed
+        double time_step,               //time step (if negative, it is chosen automatically, see AutomaticTimeStep)
+        int seed,                       //rng seed
+        int storage_dtype_code          //data type used to store the sampled states (0 : float64, 1 : float32, 2 : uint16, 3 : uint32, 4 : int32)
         )
         {
         this->boundary_conditions = boundary_conditions;
@@ -352,20 +593,52 @@ class SimulationAlgorithm3DBase
         this->t_samples = t_samples;
         this->sample_pos = 0;
 
-        this->sampled_mesh_x.clear();
         this->sampled_t.clear();
 
         this->sampling_policy_code = sampling_policy_code;
         this->sampling_interval = sampling_interval;
+        this->sampling_rtol = sampling_rtol;
+        this->sampling_atol = sampling_atol;
+        this->sampling_max_gap = sampling_max_gap;
+        this->sampling_observables = sampling_observables;
         this->t_max = t_max;
         this->sampling_done_this_iteration = false;
         this->last_tsi_ratio = -1; // rather than 0, to allow for t0 sampling.
 
+        Build_mesh_kr(k);
+        Build_mesh_kd(D);
+        ComputeStabilityBounds();
+        if(time_step < 0) time_step = AutomaticTimeStep();
+
         this->t = 0.0;
         this->dt = time_step;
+        this->time_step = time_step;
         this->complete = false;
-        Build_mesh_kr(k);
-        Build_mesh_kd(D);
+        SetMultirate(0, std::vector<int>());
+        this->sampled_mesh_x.Init(storage_dtype_code, n_meshes*n_species, ExpectedNSamples());
+        this->sampled_t.reserve(ExpectedNSamples());
+        this->rng = std::mt19937(seed);
+        this->uiud = std::uniform_real_distribution<double> (0.0, 1.0);
+        this->AlgorithmSpecificInit();
+
+        SamplingStep(); //for t0 sampling if necessary
+        }
+
+    void Reset(std::vector<double> mesh_x0, int seed)
+    // resets the simulation to t=0 with the initial state mesh_x0 (mesh first array)
+    // and the rng seed, keeping the topology and rate tables built by Init.
+        {
+        this->mesh_x = mesh_x0;
+        this->sample_pos = 0;
+        this->sampled_t.clear();
+        this->last_sampled_mesh_x.clear();
+        this->sampling_done_this_iteration = false;
+        this->last_tsi_ratio = -1; // rather than 0, to allow for t0 sampling.
+
+        this->t = 0.0;
+        this->dt = time_step;
+        this->complete = false;
+        this->sampled_mesh_x.Init(sampled_mesh_x.DTypeCode(), n_meshes*n_species, ExpectedNSamples());
         this->rng = std::mt19937(seed);
         this->uiud = std::uniform_real_distribution<double> (0.0, 1.0);
         this->AlgorithmSpecificInit();
@@ -373,9 +646,105 @@ class SimulationAlgorithm3DBase
         SamplingStep(); //for t0 sampling if necessary
         }
 
+    virtual SimulationAlgorithm3DBase * Clone() = 0;
+    // returns a new copy of the simulation (used to run replicates concurrently).
+
     virtual bool Iterate() = 0;
     // one itetation of the simulation algorithm. Returns true if the simulation should continue. False otherwise.
 
+    virtual double StableTimeStep()
+    // returns the largest time step for which the algorithm is stable, estimated at initialization,
+    // or -1 if the algorithm has no such bound.
+        {
+        return -1;
+        }
+
+    void SetMultirate(int mode, const std::vector<int> & fast_species)
+    // sets the partition of the processes into slow ones, integrated over the whole time step,
+    // and fast ones, integrated over n_substeps sub-steps by the algorithms supporting it (Euler and tau leap) :
+    //   mode 0 : (default) the diffusion is fast and the reactions are slow, the diffusion being
+    //            sub-cycled only if the time step exceeds its stability bound.
+    //   mode 1 : the fast species are the ones of which the stability bound is lower than the time step.
+    //   mode 2 : the fast species are given by fast_species (1 if the species is fast, size n_species).
+    //   mode 3 : no process is fast, all the processes being integrated over the whole time step.
+    // in modes 1 and 2, the diffusion of the fast species and the reactions changing their quantities are fast.
+    // the number of sub-steps is the smallest one for which the fast processes are integrated
+    // within their stability bound, evaluated at the current state (the initial state after Init).
+    // if it is 1, all the processes are slow.
+        {
+        reaction_group.assign(n_reactions, 0);
+        diffusion_group.assign(n_species, 0);
+
+        if(mode == 0)
+            {
+            n_substeps = Substeps(time_step, stable_dt_diffusion);
+            diffusion_group.assign(n_species, 1);
+            }
+        else if(mode == 3)
+            {
+            n_substeps = 1;
+            }
+        else
+            {
+            double fast_bound = std::numeric_limits<double>::infinity();
+            for(int s=0; s<n_species; s++)
+                {
+                bool fast = mode == 1 ? Substeps(time_step, stable_dt_species[s]) > 1 : fast_species[s] != 0;
+                if(!fast) continue;
+                diffusion_group[s] = 1;
+                fast_bound = std::min(fast_bound, stable_dt_species[s]);
+                for(int r=0; r<n_reactions; r++)
+                    if(sto[s*n_reactions+r] != 0) reaction_group[r] = 1;
+                }
+            n_substeps = Substeps(time_step, fast_bound);
+            }
+
+        if(n_substeps == 1)
+            {
+            reaction_group.assign(n_reactions, 0);
+            diffusion_group.assign(n_species, 0);
+            }
+        stable_dt_slow = GroupStabilityBound(0);
+        }
+
+    int NSubsteps()
+        {
+        return n_substeps;
+        }
+
+    const std::vector<int> & GetDiffusionGroups()
+        {
+        return diffusion_group;
+        }
+
+    const std::vector<int> & GetReactionGroups()
+        {
+        return reaction_group;
+        }
+
+    virtual void SetTolerances(double rtol, double atol)
+    // sets the local error tolerances of the algorithms using an adaptive time step (ignored by the other algorithms).
+        {
+        }
+
+    virtual void SetHybridThresholds(double population_threshold, double propensity_threshold)
+    // sets the thresholds of the partition into continuous and stochastic channels of the hybrid algorithms (ignored by the other algorithms).
+        {
+        }
+
+    virtual void SetHybridRegion(const std::vector<int> & mesh_stochastic)
+    // sets the meshes of the stochastic region of the hybrid algorithms, 1 if the mesh is stochastic, 0 otherwise,
+    // an empty vector restoring the partition according to the thresholds (ignored by the other algorithms).
+        {
+        }
+
+    virtual std::vector<int> HybridPartition()
+    // returns the numbers of continuous and stochastic reaction channels, and of continuous and stochastic diffusion channels,
+    // at the last partition of the hybrid algorithms (empty for the other algorithms).
+        {
+        return std::vector<int>();
+        }
+
     double GetProgress()
     // returns 100*t/t_max
         {
@@ -383,8 +752,8 @@ class SimulationAlgorithm3DBase
         else return 0;
         }
 
-    std::vector<std::vector<double>> & GetSampledStates()
-    // returns sample_mesh_xO
+    SampleBuffer & GetSampledStates()
+    // returns sampled_mesh_x
         {
         return sampled_mesh_x;
         }
@@ -401,6 +770,77 @@ class SimulationAlgorithm3DBase
         return n_species;
         }
 
+    int NReactions()
+        {
+        return n_reactions;
+        }
+
+    std::vector<double> & GetSub()
+        {
+        return sub;
+        }
+
+    std::vector<double> & GetSto()
+        {
+        return sto;
+        }
+
+    std::vector<int> & GetChemostats()
+        {
+        return mesh_chstt;
+        }
+
+    std::vector<double> & GetTSamples()
+        {
+        return t_samples;
+        }
+
+    double GetTimeStep()
+        {
+        return time_step;
+        }
+
+    double GetTMax()
+        {
+        return t_max;
+        }
+
+    std::vector<double> BuildReactionRates(const std::vector<double> & k)
+    // returns the reaction kinetic rates [mesh][reaction] obtained with the reaction rates k,
+    // leaving the ones of the simulation untouched.
+        {
+        std::vector<double> mesh_kr_sim = mesh_kr;
+        Build_mesh_kr(k);
+        std::vector<double> kr = mesh_kr;
+        mesh_kr = mesh_kr_sim;
+        return kr;
+        }
+
+    void BuildDiffusionTerms(
+        const std::vector<double> & D,
+        std::vector<int> & term_i, std::vector<int> & term_j, std::vector<int> & term_s,
+        std::vector<double> & term_kout, std::vector<double> & term_kin)
+    // lists the diffusion exchanges obtained with the diffusion coefficients D, in the order
+    // in which they are accumulated by the Euler method, leaving the ones of the simulation untouched.
+        {
+        std::vector<double> mesh_kd_sim = mesh_kd;
+        Build_mesh_kd(D);
+        term_i.clear(); term_j.clear(); term_s.clear(); term_kout.clear(); term_kin.clear();
+        for(int i=0; i<n_meshes; i++)
+            for(int s=0; s<n_species; s++)
+                for(int n=0; n<6; n++)
+                    {
+                    int j = mesh_neighbors[i*6+n];
+                    if(j == -1) continue;
+                    term_i.push_back(i);
+                    term_j.push_back(j);
+                    term_s.push_back(s);
+                    term_kout.push_back(mesh_kd[i*n_species*6+s*6+n]);
+                    term_kin.push_back(mesh_kd[j*n_species*6+s*6+opposed_direction[n]]);
+                    }
+        mesh_kd = mesh_kd_sim;
+        }
+
     int NMeshes()
         {
         return n_meshes;
@@ -421,13 +861,60 @@ class SimulationAlgorithm3DBase
         return sampled_t;
         }
 
+    void SaveState(std::ostream & out)
+    // writes the dynamic state of the simulation (everything that changes
+    // during iterations, including the samples) in out.
+        {
+        WriteValue(out, n_meshes);
+        WriteValue(out, n_species);
+        WriteValue(out, t);
+        WriteValue(out, dt);
+        WriteValue(out, complete);
+        WriteValue(out, sample_pos);
+        WriteValue(out, last_tsi_ratio);
+        WriteVector(out, mesh_x);
+        WriteVector(out, last_sampled_mesh_x);
+        WriteVector(out, sampled_t);
+        sampled_mesh_x.Save(out);
+        WriteRNG(out, rng);
+        }
+
+    bool LoadState(std::istream & in)
+    // reads the dynamic state of the simulation from in.
+    // returns false if the data cannot be read or do not match the simulation.
+        {
+        int n_meshes_in, n_species_in;
+        if(!ReadValue(in, n_meshes_in) || !ReadValue(in, n_species_in))
+            return false;
+        if(n_meshes_in != n_meshes || n_species_in != n_species)
+            return false;
+
+        bool ok = ReadValue(in, t) &&
+                  ReadValue(in, dt) &&
+                  ReadValue(in, complete) &&
+                  ReadValue(in, sample_pos) &&
+                  ReadValue(in, last_tsi_ratio) &&
+                  ReadVector(in, mesh_x) &&
+                  ReadVector(in, last_sampled_mesh_x) &&
+                  ReadVector(in, sampled_t) &&
+                  sampled_mesh_x.Load(in) &&
+                  ReadRNG(in, rng);
+
+        sampling_done_this_iteration = false;
+        return ok && mesh_x.size() == static_cast<size_t>(n_meshes*n_species);
+        }
+
+    bool IsComplete()
+        {
+        return complete;
+        }
+
     void Sample()
     // sample the current system state and time.
         {
         if(!sampling_done_this_iteration)
           {
-          sampled_mesh_x.push_back(mesh_x);
-          sampled_t.push_back(t);
+          PushSample(mesh_x, t);
           sampling_done_this_iteration = true;
           }
         }
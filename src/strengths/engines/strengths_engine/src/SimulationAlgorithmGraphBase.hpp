@@ -28,7 +28,8 @@ class SimulationAlgorithmGraphBase
     int sample_pos;                                 // index of the next sample time
     std::vector<double> t_samples;                  // timepoints at which the system state should be sampled
 
-    std::vector<std::vector<double>> sampled_mesh_x; // sampled system states.
+    SampleBuffer sampled_mesh_x;                     // sampled system states.
+    std::vector<double> last_sampled_mesh_x;         // last sampled system state (kept for on_change sampling).
     std::vector<double> sampled_t;                   // exact time at which each system states in sampled_mesh_x were sampled.
 
     int sampling_policy_code;                        // see Init arguments
@@ -36,9 +37,27 @@ class SimulationAlgorithmGraphBase
     double t_max;                                    // see Init arguments
     bool sampling_done_this_iteration;               // flags that tells if sample() have been called for the current iteration.
     double last_tsi_ratio;                           // floored value of the t/sampling_interval used for on_interval sampling.
+    double sampling_rtol;                            // see Init arguments
+    double sampling_atol;                            // see Init arguments
+    double sampling_max_gap;                         // see Init arguments
+    std::vector<int> sampling_observables;           // see Init arguments
 
     double t;                                        // time
     double dt;                                       // time step
+    double time_step;                                // time step given at initialization
+    double stable_dt_reactions;                      // explicit stability bound of the reactions (see ComputeStabilityBounds)
+    double stable_dt_diffusion;                      // explicit stability bound of the diffusion (see ComputeStabilityBounds)
+    std::vector<double> stable_dt_species;           // explicit stability bound of each species, diffusion and reactions (see ComputeStabilityBounds)
+    std::vector<int> reaction_group;                 // 0 : reaction integrated over the whole time step (slow), 1 : sub-stepped (fast)
+    std::vector<int> diffusion_group;                // 0 : diffusion of the species integrated over the whole time step (slow), 1 : sub-stepped (fast)
+    int n_substeps;                                  // number of sub-steps of the fast processes per time step
+    double stable_dt_slow;                           // explicit stability bound of the slow processes (see SetMultirate)
+    int lts_max_level;                               // finest local time stepping level, -1 if the local time stepping is disabled (see SetLocalTimeStepping)
+    std::vector<int> mesh_level;                     // local time stepping level of each mesh
+    std::vector<std::vector<int>> level_meshes;      // meshes of each level
+    std::vector<std::vector<int>> level_edges;       // directed edges of each level, as pairs (mesh index, direction)
+    std::vector<double> lts_dx;                      // variations of the quantities during a local time step (mesh first array)
+    std::vector<int> lts_touched;                    // meshes of which the quantities vary during a local time step
     bool complete;                                   // true if all the sampling is done.
     std::mt19937 rng;                                // pseudo random number generator
     std::uniform_real_distribution<double> uiud;     // floating point uniform distribution in [0,1[
@@ -174,6 +193,79 @@ class SimulationAlgorithmGraphBase
           }
         }
 
+    double SpeciesTotal(const std::vector<double> & x, int species_index)
+    // returns the total quantity of a species in the state x (mesh first array).
+        {
+        double total = 0;
+        for(int i=0; i<n_meshes; i++)
+            total += x[i*n_species+species_index];
+        return total;
+        }
+
+    void SampleOnChange()
+    // sample when the tracked observables have changed by more than
+    // sampling_atol + sampling_rtol*|value at the last sample| since the last sample,
+    // or when sampling_max_gap (if positive) has elapsed since the last sample.
+    // if no species is tracked, the change is measured as the norm of the state difference.
+        {
+        if(sampled_t.empty())
+          {
+          Sample();
+          return;
+          }
+
+        if(sampling_max_gap>0 && t-sampled_t.back()>=sampling_max_gap)
+          {
+          Sample();
+          return;
+          }
+
+        const std::vector<double> & last_x = last_sampled_mesh_x;
+
+        if(sampling_observables.empty())
+          {
+          double diff2 = 0;
+          double last2 = 0;
+          for(size_t i=0; i<mesh_x.size(); i++)
+            {
+            diff2 += (mesh_x[i]-last_x[i])*(mesh_x[i]-last_x[i]);
+            last2 += last_x[i]*last_x[i];
+            }
+          if(sqrt(diff2) > sampling_atol + sampling_rtol*sqrt(last2))
+            Sample();
+          }
+        else
+          {
+          for(size_t n=0; n<sampling_observables.size(); n++)
+            {
+            double current = SpeciesTotal(mesh_x, sampling_observables[n]);
+            double last = SpeciesTotal(last_x, sampling_observables[n]);
+            if(fabs(current-last) > sampling_atol + sampling_rtol*fabs(last))
+              {
+              Sample();
+              break;
+              }
+            }
+          }
+        }
+
+    int ExpectedNSamples()
+    // returns the number of samples expected according to the sampling policy,
+    // used to preallocate the sample storage (0 if it cannot be predicted).
+        {
+        double expected = 0;
+        switch(sampling_policy_code)
+          {
+          case 0 : expected = n_samples; break;
+          case 1 : if(t_max>=0 && dt>0) expected = t_max/dt + 2; break;
+          case 2 : if(t_max>=0 && sampling_interval>0) expected = t_max/sampling_interval + 2; break;
+          case 4 : if(t_max>=0 && sampling_max_gap>0) expected = t_max/sampling_max_gap + 2; break;
+          };
+        // the preallocation is limited to 2^24 values.
+        double max_expected = 16777216.0/std::max(n_meshes*n_species, 1);
+        return static_cast<int>(std::min(expected, max_expected));
+        }
+
     void SamplingStep()
     // manage the sampling procedure according to the samplng policy.
         {
@@ -183,6 +275,7 @@ class SimulationAlgorithmGraphBase
           case 1 : Sample(); break;           //sample on iteration
           case 2 : SampleOnInterval(); break; //sample on interval
           case 3 : break;                     //no sample
+          case 4 : SampleOnChange(); break;   //sample on change
           };
         }
 
@@ -264,6 +357,154 @@ class SimulationAlgorithmGraphBase
         // #######################################################################################
         }
 
+    bool InGroup(const std::vector<int> & groups, int index, int group)
+    // tells if a process belongs to the group (0 : slow, 1 : fast, -1 : any group).
+        {
+        return group < 0 || groups[index] == group;
+        }
+
+    void ComputeDerivative(std::vector<double> & dxdt, int group=-1)
+    // computes the deterministic time derivative of mesh_x (mesh first array) in dxdt, accounting for
+    // the processes of the group (0 : slow, 1 : fast, -1 : all, see SetMultirate). The derivatives of the chemostated quantities are 0.
+        {
+        std::vector<double> rr(n_reactions, 0);
+        for(int i=0; i<n_meshes; i++)
+            {
+            //reaction rates
+            for(int r=0; r<n_reactions; r++)
+                if(InGroup(reaction_group, r, group))
+                  rr[r] = ReactionRate(i, r);
+
+            for(int s=0; s<n_species; s++)
+              {
+              dxdt[i*n_species+s] = 0;
+              if(mesh_chstt[i*n_species+s]) continue;
+
+              //reaction
+              for(int r=0; r<n_reactions; r++)
+                {
+                dxdt[i*n_species+s] += sto[s*n_reactions+r]*rr[r];
+                }
+
+              //diffusion
+              if(!InGroup(diffusion_group, s, group)) continue;
+              for (int n=0; n<mesh_neighbor_n[i]; n++)
+                {
+                dxdt[i*n_species+s] -= DiffusionRateDifference(i, s, n);
+                }
+              }
+            }
+        }
+
+    double ReactionRateDerivative(int mesh_index, int reaction_index, int species_index)
+    // computes the derivative of the deterministic reaction rate with respect to the quantity of a species
+        {
+        double e = sub[species_index*n_reactions+reaction_index];
+        if(e == 0) return 0;
+        double r = mesh_kr[mesh_index*n_reactions+reaction_index]*e*pow(mesh_x[mesh_index*n_species+species_index], e-1);
+        for(int s=0; s<n_species; s++)
+            if(s != species_index)
+                r *= pow(mesh_x[mesh_index*n_species+s], sub[s*n_reactions+reaction_index]);
+        return r;
+        }
+
+    double DiffusionExitRate(int mesh_index, int species_index)
+    // returns the sum of the diffusion rate constants of a species out of a mesh.
+        {
+        int i = mesh_index;
+        int s = species_index;
+        double rate = 0;
+        for(int n=0; n<mesh_neighbor_n[i]; n++)
+            rate += mesh_kd_out[i][s*mesh_neighbor_n[i]+n];
+        return rate;
+        }
+
+    double ReactionLossRate(int mesh_index, int species_index, int group=-1)
+    // returns the derivative of the consumption rate of a species by the reactions of the group with respect to its quantity.
+        {
+        double rate = 0;
+        for(int r=0; r<n_reactions; r++)
+            if(sto[species_index*n_reactions+r] < 0 && InGroup(reaction_group, r, group))
+                rate -= sto[species_index*n_reactions+r]*ReactionRateDerivative(mesh_index, r, species_index);
+        return rate;
+        }
+
+    void ComputeStabilityBounds()
+    // computes the largest time steps for which the explicit Euler method keeps the quantities positive :
+    // 1/max(k_out) for the diffusion, k_out being the sum of the diffusion rate constants out of a mesh,
+    // and 1/max(k_loss) for the reactions, k_loss being the derivative of the consumption rate of a species
+    // with respect to its quantity, evaluated at the current state (the initial state at initialization).
+    // the bound of a species, 1/max(k_out+k_loss), accounts for both its diffusion and its consumption.
+    // a bound is infinite if there is no diffusion or no consumption.
+        {
+        double max_diffusion = 0;
+        double max_reactions = 0;
+        std::vector<double> max_species(n_species, 0);
+        for(int i=0; i<n_meshes; i++)
+          {
+          for(int s=0; s<n_species; s++)
+            {
+            if(mesh_chstt[i*n_species+s]) continue;
+            double rate_diffusion = DiffusionExitRate(i, s);
+            double rate_reactions = ReactionLossRate(i, s);
+            max_diffusion = std::max(max_diffusion, rate_diffusion);
+            max_reactions = std::max(max_reactions, rate_reactions);
+            max_species[s] = std::max(max_species[s], rate_diffusion+rate_reactions);
+            }
+          }
+        stable_dt_diffusion = Bound(max_diffusion);
+        stable_dt_reactions = Bound(max_reactions);
+        stable_dt_species.resize(n_species);
+        for(int s=0; s<n_species; s++)
+            stable_dt_species[s] = Bound(max_species[s]);
+        }
+
+    double Bound(double max_rate)
+    // returns the explicit stability bound 1/max_rate (infinite if max_rate is 0).
+        {
+        return max_rate > 0 ? 1/max_rate : std::numeric_limits<double>::infinity();
+        }
+
+    virtual double AutomaticTimeStep()
+    // returns the time step chosen when none is given : a tenth of the reactions stability bound, for accuracy,
+    // and at most half the diffusion stability bound, for which the explicit diffusion is not oscillating.
+        {
+        double h = std::min(0.1*stable_dt_reactions, 0.5*stable_dt_diffusion);
+        if(!std::isfinite(h)) return t_max > 0 ? t_max : 1;
+        return h;
+        }
+
+    int Substeps(double dt, double bound)
+    // returns the number of sub-steps needed to integrate over dt within a stability bound.
+        {
+        if(!(dt > 0) || !std::isfinite(bound)) return 1;
+        return std::max(1, static_cast<int>(ceil(dt/bound*(1-1e-12))));
+        }
+
+    double GroupStabilityBound(int group)
+    // returns the explicit stability bound of the processes of a group, evaluated at the current state.
+        {
+        double max_rate = 0;
+        for(int i=0; i<n_meshes; i++)
+          for(int s=0; s<n_species; s++)
+            {
+            if(mesh_chstt[i*n_species+s]) continue;
+            double rate = ReactionLossRate(i, s, group);
+            if(InGroup(diffusion_group, s, group)) rate += DiffusionExitRate(i, s);
+            max_rate = std::max(max_rate, rate);
+            }
+        return Bound(max_rate);
+        }
+
+    void PushSample(const std::vector<double> & x, double t_x)
+    // stores the state x (mesh first array), sampled at time t_x.
+        {
+        sampled_mesh_x.Push(x);
+        sampled_t.push_back(t_x);
+        if(sampling_policy_code == 4)
+          last_sampled_mesh_x = x;
+        }
+
     virtual void AlgorithmSpecificInit() = 0;
     // should contain algorithm specific initialization steps, in order to avoid overwriting the constructor
 
@@ -306,9 +547,14 @@ class SimulationAlgorithmGraphBase
         std::vector<double> t_samples,  //sample timepoints
         int sampling_policy_code,       //tells when the system state should be sampled
         double sampling_interval,       //interval at which the system state should be sampled (if sampling_policy_code=2)
+        double sampling_rtol,           //relative change threshold (if sampling_policy_code=4)
+        double sampling_atol,           //absolute change threshold (if sampling_policy_code=4)
+        double sampling_max_gap,        //maximal time between two samples (if sampling_policy_code=4 and if positive)
+        std::vector<int> sampling_observables, //indices of the species which total quantity is tracked (if sampling_policy_code=4). if empty, the whole state is tracked.
         double t_max,                   //time past which the simulation should be flagged as complete (if negative, there is no t_max).
-        double time_step,               //time step
-        int seed                        //rng seed
+        double time_step,               //time step (if negative, it is chosen automatically, see AutomaticTimeStep)
+        int seed,                       //rng seed
+        int storage_dtype_code          //data type used to store the sampled states (0 : float64, 1 : float32, 2 : uint16, 3 : uint32, 4 : int32)
         )
         {
         this->n_meshes = n_nodes;
@@ -330,20 +576,53 @@ class SimulationAlgorithmGraphBase
         this->t_samples = t_samples;
         this->sample_pos = 0;
 
-        this->sampled_mesh_x.clear();
         this->sampled_t.clear();
 
         this->sampling_policy_code = sampling_policy_code;
         this->sampling_interval = sampling_interval;
+        this->sampling_rtol = sampling_rtol;
+        this->sampling_atol = sampling_atol;
+        this->sampling_max_gap = sampling_max_gap;
+        this->sampling_observables = sampling_observables;
         this->t_max = t_max;
         this->sampling_done_this_iteration = false;
         this->last_tsi_ratio = -1; // rather than 0, to allow for t0 sampling.
 
+        Build_mesh_kr(k);
+        Build_mesh_kd(D);
+        ComputeStabilityBounds();
+        if(time_step < 0) time_step = AutomaticTimeStep();
+
+        this->t = 0.0;
+        this->dt = time_step;
+        this->time_step = time_step;
+        this->complete = false;
+        SetMultirate(0, std::vector<int>());
+        SetLocalTimeStepping(false);
+        this->sampled_mesh_x.Init(storage_dtype_code, n_meshes*n_species, ExpectedNSamples());
+        this->sampled_t.reserve(ExpectedNSamples());
+        this->rng = std::mt19937(seed);
+        this->uiud = std::uniform_real_distribution<double> (0.0, 1.0);
+        this->AlgorithmSpecificInit();
+
+        SamplingStep(); //for t0 sampling if necessary
+        }
+
+    void Reset(std::vector<double> mesh_x0, int seed)
+    // resets the simulation to t=0 with the initial state mesh_x0 (mesh first array)
+    // and the rng seed, keeping the topology and rate tables built by Init.
+        {
+        this->mesh_x = mesh_x0;
+        this->sample_pos = 0;
+        this->sampled_t.clear();
+        this->last_sampled_mesh_x.clear();
+        this->sampling_done_this_iteration = false;
+        this->last_tsi_ratio = -1; // rather than 0, to allow for t0 sampling.
+
         this->t = 0.0;
         this->dt = time_step;
         this->complete = false;
-        Build_mesh_kr(k);
-        Build_mesh_kd(D);
+        this->sampled_mesh_x.Init(sampled_mesh_x.DTypeCode(), n_meshes*n_species, ExpectedNSamples());
         this->rng = std::mt19937(seed);
         this->uiud = std::uniform_real_distribution<double> (0.0, 1.0);
         this->AlgorithmSpecificInit();
@@ -351,9 +630,222 @@ class SimulationAlgorithmGraphBase
         SamplingStep(); //for t0 sampling if necessary
         }
 
+    virtual SimulationAlgorithmGraphBase * Clone() = 0;
+    // returns a new copy of the simulation (used to run replicates concurrently).
+
     virtual bool Iterate() = 0;
     // one itetation of the simulation algorithm. Returns true if the simulation should continue. False otherwise.
 
+    virtual double StableTimeStep()
+    // returns the largest time step for which the algorithm is stable, estimated at initialization,
+    // or -1 if the algorithm has no such bound.
+        {
+        return -1;
+        }
+
+    void SetMultirate(int mode, const std::vector<int> & fast_species)
+    // sets the partition of the processes into slow ones, integrated over the whole time step,
+    // and fast ones, integrated over n_substeps sub-steps by the algorithms supporting it (Euler and tau leap) :
+    //   mode 0 : (default) the diffusion is fast and the reactions are slow, the diffusion being
+    //            sub-cycled only if the time step exceeds its stability bound.
+    //   mode 1 : the fast species are the ones of which the stability bound is lower than the time step.
+    //   mode 2 : the fast species are given by fast_species (1 if the species is fast, size n_species).
+    //   mode 3 : no process is fast, all the processes being integrated over the whole time step.
+    // in modes 1 and 2, the diffusion of the fast species and the reactions changing their quantities are fast.
+    // the number of sub-steps is the smallest one for which the fast processes are integrated
+    // within their stability bound, evaluated at the current state (the initial state after Init).
+    // if it is 1, all the processes are slow.
+        {
+        reaction_group.assign(n_reactions, 0);
+        diffusion_group.assign(n_species, 0);
+
+        if(mode == 0)
+            {
+            n_substeps = Substeps(time_step, stable_dt_diffusion);
+            diffusion_group.assign(n_species, 1);
+            }
+        else if(mode == 3)
+            {
+            n_substeps = 1;
+            }
+        else
+            {
+            double fast_bound = std::numeric_limits<double>::infinity();
+            for(int s=0; s<n_species; s++)
+                {
+                bool fast = mode == 1 ? Substeps(time_step, stable_dt_species[s]) > 1 : fast_species[s] != 0;
+                if(!fast) continue;
+                diffusion_group[s] = 1;
+                fast_bound = std::min(fast_bound, stable_dt_species[s]);
+                for(int r=0; r<n_reactions; r++)
+                    if(sto[s*n_reactions+r] != 0) reaction_group[r] = 1;
+                }
+            n_substeps = Substeps(time_step, fast_bound);
+            }
+
+        if(n_substeps == 1)
+            {
+            reaction_group.assign(n_reactions, 0);
+            diffusion_group.assign(n_species, 0);
+            }
+        stable_dt_slow = GroupStabilityBound(0);
+        }
+
+    int NSubsteps()
+        {
+        return n_substeps;
+        }
+
+    const std::vector<int> & GetDiffusionGroups()
+        {
+        return diffusion_group;
+        }
+
+    const std::vector<int> & GetReactionGroups()
+        {
+        return reaction_group;
+        }
+
+    void SetLocalTimeStepping(bool enabled)
+    // enables or disables the local time stepping of the algorithms supporting it (Euler and tau leap).
+    // each mesh is assigned the lowest level L for which dt/2^L is within its explicit stability bound
+    // (diffusion out of the mesh and consumption by the reactions, evaluated at the current state),
+    // and its reactions are integrated with 2^L steps of dt/2^L per time step. The diffusion along an edge
+    // is integrated at the finest level of its two meshes, and is applied to both of them at once,
+    // so that the fluxes between meshes of different levels are conservative.
+        {
+        const int max_level = 20;
+        mesh_level.assign(n_meshes, 0);
+        level_meshes.clear();
+        level_edges.clear();
+        lts_touched.clear();
+        lts_max_level = -1;
+        if(!enabled) return;
+
+        for(int i=0; i<n_meshes; i++)
+            {
+            double max_rate = 0;
+            for(int s=0; s<n_species; s++)
+                if(!mesh_chstt[i*n_species+s])
+                    max_rate = std::max(max_rate, DiffusionExitRate(i, s)+ReactionLossRate(i, s));
+            int n = Substeps(time_step, Bound(max_rate));
+            while((1 << mesh_level[i]) < n && mesh_level[i] < max_level)
+                mesh_level[i]++;
+            lts_max_level = std::max(lts_max_level, mesh_level[i]);
+            }
+
+        level_meshes.resize(lts_max_level+1);
+        level_edges.resize(lts_max_level+1);
+        for(int i=0; i<n_meshes; i++)
+            {
+            level_meshes[mesh_level[i]].push_back(i);
+            for(int n=0; n<mesh_neighbor_n[i]; n++)
+                {
+                int level = std::max(mesh_level[i], mesh_level[mesh_neighbor_index[i][n]]);
+                level_edges[level].push_back(i);
+                level_edges[level].push_back(n);
+                }
+            }
+        lts_dx.assign(n_meshes*n_species, 0);
+        }
+
+    void LocalTimeStep(bool stochastic)
+    // advances the state by dt with the local time stepping (see SetLocalTimeStepping).
+    // the time step is divided into 2^lts_max_level ticks, the meshes and edges of a level being updated
+    // every 2^(lts_max_level-level) ticks from the state at the current tick. The reactions and the diffusion are
+    // integrated with the explicit Euler method (stochastic = false), or the numbers of events are drawn from
+    // Poisson distributions, as in the tau leap method (stochastic = true).
+        {
+        int n_ticks = 1 << lts_max_level;
+        for(int tick=0; tick<n_ticks; tick++)
+            {
+            int min_level = lts_max_level;
+            while(min_level > 0 && tick % (1 << (lts_max_level-min_level+1)) == 0)
+                min_level--;
+
+            for(int level=min_level; level<=lts_max_level; level++)
+                {
+                double h = dt/(1 << level);
+
+                //reactions
+                for(size_t k=0; k<level_meshes[level].size(); k++)
+                    {
+                    int i = level_meshes[level][k];
+                    for(int r=0; r<n_reactions; r++)
+                        {
+                        double a = stochastic ? Poisson(ReactionProp(i, r)*h) : ReactionRate(i, r)*h;
+                        if(a == 0) continue;
+                        for(int s=0; s<n_species; s++)
+                            if(!mesh_chstt[i*n_species+s])
+                                lts_dx[i*n_species+s] += sto[s*n_reactions+r]*a;
+                        }
+                    lts_touched.push_back(i);
+                    }
+
+                //diffusion
+                for(size_t k=0; k<level_edges[level].size(); k+=2)
+                    {
+                    int i = level_edges[level][k];
+                    int n = level_edges[level][k+1];
+                    int j = mesh_neighbor_index[i][n];
+                    for(int s=0; s<n_species; s++)
+                        {
+                        double a = stochastic ? Poisson(DiffusionProp(i, s, n)*h) : DiffusionRate(i, s, n)*h;
+                        if(a == 0) continue;
+                        if(!mesh_chstt[i*n_species+s]) lts_dx[i*n_species+s] -= a;
+                        if(!mesh_chstt[j*n_species+s]) lts_dx[j*n_species+s] += a;
+                        }
+                    lts_touched.push_back(i);
+                    lts_touched.push_back(j);
+                    }
+                }
+
+            for(size_t k=0; k<lts_touched.size(); k++)
+                {
+                int i = lts_touched[k];
+                for(int s=0; s<n_species; s++)
+                    {
+                    mesh_x[i*n_species+s] += lts_dx[i*n_species+s];
+                    lts_dx[i*n_species+s] = 0;
+                    }
+                }
+            lts_touched.clear();
+            }
+        }
+
+    int LocalTimeSteppingMaxLevel()
+        {
+        return lts_max_level;
+        }
+
+    const std::vector<int> & GetMeshLevels()
+        {
+        return mesh_level;
+        }
+
+    virtual void SetTolerances(double rtol, double atol)
+    // sets the local error tolerances of the algorithms using an adaptive time step (ignored by the other algorithms).
+        {
+        }
+
+    virtual void SetHybridThresholds(double population_threshold, double propensity_threshold)
+    // sets the thresholds of the partition into continuous and stochastic channels of the hybrid algorithms (ignored by the other algorithms).
+        {
+        }
+
+    virtual void SetHybridRegion(const std::vector<int> & mesh_stochastic)
+    // sets the meshes of the stochastic region of the hybrid algorithms, 1 if the mesh is stochastic, 0 otherwise,
+    // an empty vector restoring the partition according to the thresholds (ignored by the other algorithms).
+        {
+        }
+
+    virtual std::vector<int> HybridPartition()
+    // returns the numbers of continuous and stochastic reaction channels, and of continuous and stochastic diffusion channels,
+    // at the last partition of the hybrid algorithms (empty for the other algorithms).
+        {
+        return std::vector<int>();
+        }
+
     double GetProgress()
     // returns 100*t/t_max
         {
@@ -361,8 +853,8 @@ class SimulationAlgorithmGraphBase
         else return 0;
         }
 
-    std::vector<std::vector<double>> & GetSampledStates()
-    // returns sample_mesh_xO
+    SampleBuffer & GetSampledStates()
+    // returns sampled_mesh_x
         {
         return sampled_mesh_x;
         }
@@ -379,6 +871,77 @@ class SimulationAlgorithmGraphBase
         return n_species;
         }
 
+    int NReactions()
+        {
+        return n_reactions;
+        }
+
+    std::vector<double> & GetSub()
+        {
+        return sub;
+        }
+
+    std::vector<double> & GetSto()
+        {
+        return sto;
+        }
+
+    std::vector<int> & GetChemostats()
+        {
+        return mesh_chstt;
+        }
+
+    std::vector<double> & GetTSamples()
+        {
+        return t_samples;
+        }
+
+    double GetTimeStep()
+        {
+        return time_step;
+        }
+
+    double GetTMax()
+        {
+        return t_max;
+        }
+
+    std::vector<double> BuildReactionRates(const std::vector<double> & k)
+    // returns the reaction kinetic rates [mesh][reaction] obtained with the reaction rates k,
+    // leaving the ones of the simulation untouched.
+        {
+        std::vector<double> mesh_kr_sim = mesh_kr;
+        Build_mesh_kr(k);
+        std::vector<double> kr = mesh_kr;
+        mesh_kr = mesh_kr_sim;
+        return kr;
+        }
+
+    void BuildDiffusionTerms(
+        const std::vector<double> & D,
+        std::vector<int> & term_i, std::vector<int> & term_j, std::vector<int> & term_s,
+        std::vector<double> & term_kout, std::vector<double> & term_kin)
+    // lists the diffusion exchanges obtained with the diffusion coefficients D, in the order
+    // in which they are accumulated by the Euler method, leaving the ones of the simulation untouched.
+        {
+        std::vector<std::vector<double>> mesh_kd_out_sim = mesh_kd_out;
+        std::vector<std::vector<double>> mesh_kd_in_sim = mesh_kd_in;
+        Build_mesh_kd(D);
+        term_i.clear(); term_j.clear(); term_s.clear(); term_kout.clear(); term_kin.clear();
+        for(int i=0; i<n_meshes; i++)
+            for(int s=0; s<n_species; s++)
+                for(int n=0; n<mesh_neighbor_n[i]; n++)
+                    {
+                    term_i.push_back(i);
+                    term_j.push_back(mesh_neighbor_index[i][n]);
+                    term_s.push_back(s);
+                    term_kout.push_back(mesh_kd_out[i][s*mesh_neighbor_n[i]+n]);
+                    term_kin.push_back(mesh_kd_in[i][s*mesh_neighbor_n[i]+n]);
+                    }
+        mesh_kd_out = mesh_kd_out_sim;
+        mesh_kd_in = mesh_kd_in_sim;
+        }
+
     int NMeshes()
         {
         return n_meshes;
@@ -399,13 +962,60 @@ class SimulationAlgorithmGraphBase
         return sampled_t;
         }
 
+    void SaveState(std::ostream & out)
+    // writes the dynamic state of the simulation (everything that changes
+    // during iterations, including the samples) in out.
+        {
+        WriteValue(out, n_meshes);
+        WriteValue(out, n_species);
+        WriteValue(out, t);
+        WriteValue(out, dt);
+        WriteValue(out, complete);
+        WriteValue(out, sample_pos);
+        WriteValue(out, last_tsi_ratio);
+        WriteVector(out, mesh_x);
+        WriteVector(out, last_sampled_mesh_x);
+        WriteVector(out, sampled_t);
+        sampled_mesh_x.Save(out);
+        WriteRNG(out, rng);
+        }
+
+    bool LoadState(std::istream & in)
+    // reads the dynamic state of the simulation from in.
+    // returns false if the data cannot be read or do not match the simulation.
+        {
+        int n_meshes_in, n_species_in;
+        if(!ReadValue(in, n_meshes_in) || !ReadValue(in, n_species_in))
+            return false;
+        if(n_meshes_in != n_meshes || n_species_in != n_species)
+            return false;
+
+        bool ok = ReadValue(in, t) &&
+                  ReadValue(in, dt) &&
+                  ReadValue(in, complete) &&
+                  ReadValue(in, sample_pos) &&
+                  ReadValue(in, last_tsi_ratio) &&
+                  ReadVector(in, mesh_x) &&
+                  ReadVector(in, last_sampled_mesh_x) &&
+                  ReadVector(in, sampled_t) &&
+                  sampled_mesh_x.Load(in) &&
+                  ReadRNG(in, rng);
+
+        sampling_done_this_iteration = false;
+        return ok && mesh_x.size() == static_cast<size_t>(n_meshes*n_species);
+        }
+
+    bool IsComplete()
+        {
+        return complete;
+        }
+
     void Sample()
     // sample the current system state and time.
         {
         if(!sampling_done_this_iteration)
           {
-          sampled_mesh_x.push_back(mesh_x);
-          sampled_t.push_back(t);
+          PushSample(mesh_x, t);
           sampling_done_this_iteration = true;
           }
         }
@@ -0,0 +1,296 @@
+//implements the user defined stopping conditions of a simulation (see RDScript.stop_conditions)
+
+class StopConditions
+    {
+    private :
+
+    struct Condition
+        {
+        int type;                   // 0 : above, 1 : below, 2 : relative change, 3 : steady state
+        int species;                // index of the species, -1 for all the species
+        std::vector<int> cells;     // indices of the cells of the region, empty for the whole system
+        double value;               // threshold (quantity for above/below, relative change for relative change and steady state)
+        double atol;                // absolute tolerance (steady state)
+        double interval;            // time interval over which the relative change is measured (relative change and steady state)
+        bool has_ref;               // true if a reference value has been recorded (relative change and steady state)
+        double ref_value;           // reference value (relative change)
+        double ref_t;               // time at which the reference value was recorded / at which the window started
+        double last_t;              // time of the last evaluation (steady state)
+        double max_rate;            // maximal norm of the state rate of change in the current window (steady state, deterministic)
+        std::vector<double> last_x; // state at the last evaluation (steady state)
+        std::vector<double> mean;   // time weighted sum of the species totals in the current window (steady state, stochastic)
+        std::vector<double> prev_mean; // mean species totals in the previous window (steady state, stochastic)
+        };
+
+    std::vector<Condition> conditions;
+    int check_interval;             // number of iterations between two evaluations
+    int n_iterations;               // number of iterations since the last evaluation
+    int fired;                      // index of the condition that fired, -1 if none did
+    double t_fired;                 // time at which the condition fired
+    bool is_stochastic;             // true if the state is made of molecule counts (see EvaluateSteadyState)
+
+    static double MaxNorm(const std::vector<double> & x)
+        {
+        double v = 0;
+        for(size_t i=0; i<x.size(); i++)
+            v = std::max(v, fabs(x[i]));
+        return v;
+        }
+
+    bool EvaluateSteadyState(Condition & c, const std::vector<double> & mesh_x, int n_species, int n_meshes, double t)
+    // deterministic states : the system is stationary if the maximal norm of its rate of change
+    // over a window of c.interval, times c.interval, is lower than atol + rtol*|x|.
+    // stochastic states : the system is stationary if the time weighted mean species totals
+    // of two successive windows of c.interval differ by less than atol + rtol*|mean|.
+        {
+        if(!c.has_ref)
+            {
+            c.has_ref = true;
+            c.ref_t = t;
+            c.last_t = t;
+            c.max_rate = 0;
+            c.last_x = mesh_x;
+            c.mean.assign(n_species, 0);
+            c.prev_mean.clear();
+            return false;
+            }
+
+        double dt = t - c.last_t;
+        if(is_stochastic)
+            {
+            for(int i=0; i<n_meshes; i++)
+                for(int s=0; s<n_species; s++)
+                    c.mean[s] += c.last_x[static_cast<size_t>(i)*n_species + s]*dt;
+            }
+        else if(dt > 0)
+            {
+            double d = 0;
+            for(size_t i=0; i<mesh_x.size(); i++)
+                d = std::max(d, fabs(mesh_x[i] - c.last_x[i]));
+            c.max_rate = std::max(c.max_rate, d/dt);
+            }
+        c.last_x = mesh_x;
+        c.last_t = t;
+
+        double window = t - c.ref_t;
+        if(window < c.interval || window <= 0)
+            return false;
+
+        bool stationary = false;
+        if(is_stochastic)
+            {
+            for(int s=0; s<n_species; s++)
+                c.mean[s] /= window;
+            if(!c.prev_mean.empty())
+                {
+                double d = 0;
+                for(int s=0; s<n_species; s++)
+                    d = std::max(d, fabs(c.mean[s] - c.prev_mean[s]));
+                stationary = d <= c.atol + c.value*MaxNorm(c.mean);
+                }
+            c.prev_mean = c.mean;
+            c.mean.assign(n_species, 0);
+            }
+        else
+            {
+            stationary = c.max_rate*window <= c.atol + c.value*MaxNorm(mesh_x);
+            c.max_rate = 0;
+            }
+        c.ref_t = t;
+        return stationary;
+        }
+
+    double Observable(const Condition & c, const std::vector<double> & mesh_x, int n_species, int n_meshes)
+    // total quantity of the species (or of all the species) in the region (mesh_x is a mesh first array).
+        {
+        double v = 0;
+        if(c.cells.empty())
+            {
+            for(int i=0; i<n_meshes; i++)
+                v += CellQuantity(c, mesh_x, n_species, i);
+            }
+        else
+            {
+            for(size_t i=0; i<c.cells.size(); i++)
+                v += CellQuantity(c, mesh_x, n_species, c.cells[i]);
+            }
+        return v;
+        }
+
+    double CellQuantity(const Condition & c, const std::vector<double> & mesh_x, int n_species, int cell)
+        {
+        if(c.species >= 0)
+            return mesh_x[static_cast<size_t>(cell)*n_species + c.species];
+        double v = 0;
+        for(int s=0; s<n_species; s++)
+            v += mesh_x[static_cast<size_t>(cell)*n_species + s];
+        return v;
+        }
+
+    bool Evaluate(Condition & c, const std::vector<double> & mesh_x, int n_species, int n_meshes, double t)
+        {
+        double v = (c.type == 3) ? 0 : Observable(c, mesh_x, n_species, n_meshes);
+        switch(c.type)
+          {
+          case 0 : return v >= c.value;
+          case 1 : return v <= c.value;
+          case 3 : return EvaluateSteadyState(c, mesh_x, n_species, n_meshes, t);
+          case 2 :
+            if(!c.has_ref)
+              {
+              c.has_ref = true;
+              c.ref_value = v;
+              c.ref_t = t;
+              return false;
+              }
+            if(t - c.ref_t >= c.interval)
+              {
+              double scale = std::max(fabs(v), fabs(c.ref_value));
+              double change = (scale > 0) ? fabs(v - c.ref_value)/scale : 0;
+              if(change <= c.value)
+                return true;
+              c.ref_value = v;
+              c.ref_t = t;
+              }
+            return false;
+          };
+        return false;
+        }
+
+    public :
+
+    StopConditions()
+        {
+        check_interval = 1;
+        is_stochastic = false;
+        Clear();
+        }
+
+    void Clear()
+    // removes all the conditions.
+        {
+        conditions.clear();
+        Reset();
+        }
+
+    void Add(int type, int species, const std::vector<int> & cells, double value, double atol, double interval)
+        {
+        Condition c;
+        c.type = type;
+        c.species = species;
+        c.cells = cells;
+        c.value = value;
+        c.atol = atol;
+        c.interval = interval;
+        c.has_ref = false;
+        c.ref_value = 0;
+        c.ref_t = 0;
+        conditions.push_back(c);
+        }
+
+    void SetCheckInterval(int check_interval)
+        {
+        this->check_interval = std::max(check_interval, 1);
+        }
+
+    void SetStochastic(bool is_stochastic)
+        {
+        this->is_stochastic = is_stochastic;
+        }
+
+    void Reset()
+    // forgets the evaluations of the previous simulation.
+        {
+        n_iterations = 0;
+        fired = -1;
+        t_fired = 0;
+        for(size_t i=0; i<conditions.size(); i++)
+            conditions[i].has_ref = false;
+        }
+
+    bool Check(const std::vector<double> & mesh_x, int n_species, int n_meshes, double t)
+    // to be called after each iteration. Evaluates the conditions every check_interval iterations,
+    // and returns true if one of them fired (now or before).
+        {
+        if(fired >= 0)
+            return true;
+        if(conditions.empty() || ++n_iterations < check_interval)
+            return false;
+        n_iterations = 0;
+        for(size_t i=0; i<conditions.size(); i++)
+            {
+            if(Evaluate(conditions[i], mesh_x, n_species, n_meshes, t))
+                {
+                fired = static_cast<int>(i);
+                t_fired = t;
+                return true;
+                }
+            }
+        return false;
+        }
+
+    void SaveState(std::ostream & out)
+    // writes the evaluation state of the conditions (references and windows) in out.
+        {
+        WriteValue(out, n_iterations);
+        WriteValue(out, fired);
+        WriteValue(out, t_fired);
+        WriteValue(out, conditions.size());
+        for(size_t i=0; i<conditions.size(); i++)
+            {
+            const Condition & c = conditions[i];
+            WriteValue(out, c.type);
+            WriteValue(out, c.has_ref);
+            WriteValue(out, c.ref_value);
+            WriteValue(out, c.ref_t);
+            WriteValue(out, c.last_t);
+            WriteValue(out, c.max_rate);
+            WriteVector(out, c.last_x);
+            WriteVector(out, c.mean);
+            WriteVector(out, c.prev_mean);
+            }
+        }
+
+    bool LoadState(std::istream & in)
+    // reads the evaluation state of the conditions from in.
+    // returns false if the data cannot be read or do not match the conditions.
+        {
+        size_t n_conditions;
+        if(!ReadValue(in, n_iterations) || !ReadValue(in, fired) || !ReadValue(in, t_fired) || !ReadValue(in, n_conditions))
+            return false;
+        if(n_conditions != conditions.size())
+            return false;
+        for(size_t i=0; i<conditions.size(); i++)
+            {
+            Condition & c = conditions[i];
+            int type;
+            bool ok = ReadValue(in, type) &&
+                      ReadValue(in, c.has_ref) &&
+                      ReadValue(in, c.ref_value) &&
+                      ReadValue(in, c.ref_t) &&
+                      ReadValue(in, c.last_t) &&
+                      ReadValue(in, c.max_rate) &&
+                      ReadVector(in, c.last_x) &&
+                      ReadVector(in, c.mean) &&
+                      ReadVector(in, c.prev_mean);
+            if(!ok || type != c.type)
+                return false;
+            }
+        return true;
+        }
+
+    bool Empty()
+        {
+        return conditions.empty();
+        }
+
+    int Fired()
+        {
+        return fired;
+        }
+
+    double TFired()
+        {
+        return t_fired;
+        }
+    };
@@ -15,31 +15,35 @@ class TauLeapGraph : public SimulationAlgorithmGraphBase
     std::vector<int> mesh_nr; //species quantities
     std::vector<std::vector<int>> mesh_nd; //species quantities
 
-    void Compute_nevt()
+    void Compute_nevt(int group, double h)
+    // draws the numbers of events of the processes of the group (0 : slow, 1 : fast, -1 : all, see SetMultirate) occuring during h.
         {
         for(int i=0; i<n_meshes; i++)
             {
             //reaction rates
             for(int r=0; r<n_reactions; r++)
-                mesh_nr[i*n_reactions+r] = Poisson(ReactionProp(i, r)*dt);
+                if(InGroup(reaction_group, r, group))
+                  mesh_nr[i*n_reactions+r] = Poisson(ReactionProp(i, r)*h);
 
             for(int s=0; s<n_species; s++)
                 {
+                if(!InGroup(diffusion_group, s, group)) continue;
                 //diffusion
                 for (int n=0; n<mesh_neighbor_n[i]; n++)
                   {
-                  mesh_nd[i][s*mesh_neighbor_n[i]+n] = Poisson(DiffusionProp(i, s, n)*dt);
+                  mesh_nd[i][s*mesh_neighbor_n[i]+n] = Poisson(DiffusionProp(i, s, n)*h);
                   }
                 }
             }
         }
 
-    void Apply_nevt()
+    void Apply_nevt(int group)
         {
         for(int i=0; i<n_meshes; i++)
             {
             for(int r=0; r<n_reactions; r++)
               {
+              if(!InGroup(reaction_group, r, group)) continue;
               for(int j=0; j<n_species; j++)
                 {
                 if(mesh_chstt[i*n_species+j]) continue;
@@ -49,6 +53,7 @@ class TauLeapGraph : public SimulationAlgorithmGraphBase
 
             for(int s=0; s<n_species; s++)
                 {
+                if(!InGroup(diffusion_group, s, group)) continue;
                 for (int n=0; n<mesh_neighbor_n[i]; n++)
                     {
                     if(mesh_nd[i][s*mesh_neighbor_n[i]+n]==0) continue;
@@ -87,6 +92,18 @@ class TauLeapGraph : public SimulationAlgorithmGraphBase
         {
         }
 
+    virtual SimulationAlgorithmGraphBase * Clone()
+        {
+        return new TauLeapGraph(*this);
+        }
+
+    virtual double StableTimeStep()
+    // the fast processes being sub-stepped, only the slow ones bound the time step
+    // (there is no bound with the local time stepping).
+        {
+        return lts_max_level >= 0 ? -1 : stable_dt_slow;
+        }
+
     virtual bool Iterate()
         {
         sampling_done_this_iteration = false; // reset the flag
@@ -94,8 +111,27 @@ class TauLeapGraph : public SimulationAlgorithmGraphBase
         if(complete)
           return false;
 
-        Compute_nevt();
-        Apply_nevt();
+        if(lts_max_level >= 0)
+          {
+          LocalTimeStep(true);
+          }
+        else if(n_substeps == 1)
+          {
+          Compute_nevt(-1, dt);
+          Apply_nevt(-1);
+          }
+        else
+          {
+          //multirate step : the events of the slow processes are drawn over dt, then the ones
+          //of the fast processes over n_substeps steps, each within their stability bound.
+          Compute_nevt(0, dt);
+          Apply_nevt(0);
+          for(int k=0; k<n_substeps; k++)
+            {
+            Compute_nevt(1, dt/n_substeps);
+            Apply_nevt(1);
+            }
+          }
         t += dt;
         SamplingStep();
         CheckTMax();
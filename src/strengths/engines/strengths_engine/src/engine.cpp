@@ -1,17 +1,41 @@
 #include <iostream>
 #include <random>
+#include <cmath>
+#include <cstdint>
+#include <limits>
+#include <algorithm>
+#include <fstream>
+#include <sstream>
+#include <string>
+
+#include "Serialization.hpp"
+#include "SampleBuffer.hpp"
+#include "StopConditions.hpp"
+#include "ImplicitDiffusion.hpp"
+#include "RungeKutta.hpp"
+#include "HybridBase.hpp"
 
 #include "SimulationAlgorithm3DBase.hpp"
 #include "Euler3D.hpp"
 #include "TauLeap3D.hpp"
 #include "Gillespie3D.hpp"
+#include "Imex3D.hpp"
+#include "RungeKutta3D.hpp"
+#include "Hybrid3D.hpp"
 
 #include "SimulationAlgorithmGraphBase.hpp"
 #include "EulerGraph.hpp"
 #include "TauLeapGraph.hpp"
 #include "GillespieGraph.hpp"
+#include "ImexGraph.hpp"
+#include "RungeKuttaGraph.hpp"
+#include "HybridGraph.hpp"
+
+#include "EulerBatch.hpp"
 
 #include <chrono>
+#include <thread>
+#include <atomic>
 
 #ifdef CPYEMVER
   #include <Python.h>
@@ -141,6 +165,46 @@ SimulationAlgorithm3DBase * global_grid_algo;
 SimulationAlgorithmGraphBase * global_graph_algo;
 int global_space_type; //0 : grid, 1 : graph
 bool global_algo_freed = true;
+std::vector<double> global_init_state;   //initial state given at initialization (species first array), used by engineexport_reset
+std::string global_init_state_processing; //init state processing given at initialization, used by engineexport_reset
+bool global_is_stochastic;               //true if the current algorithm is stochastic
+bool global_is_euler;                    //true if the current algorithm uses the Euler method
+int global_n_env;                        //number of environments of the current simulation
+int global_seed;                         //rng seed of the current simulation
+std::atomic<bool> global_cancel_requested(false); //set by engineexport_cancel, stops engineexport_run
+bool global_has_deadline = false;                  //true if a wall clock deadline is set for the current simulation
+std::chrono::steady_clock::time_point global_deadline; //wall clock deadline of the current simulation
+int global_check_interval = 1;                     //number of iterations between two checks of the clock in engineexport_run
+StopConditions global_stop_conditions;             //user defined stopping conditions of the current simulation
+
+void ResetRunControl()
+    //clears the cancellation request and the deadline of the previous simulation.
+    {
+    global_cancel_requested = false;
+    global_has_deadline = false;
+    global_check_interval = 1;
+    global_stop_conditions.Reset();
+    }
+
+bool IterateOnce()
+    //iterates the current algorithm once, then evaluates the stopping conditions.
+    //returns false if the simulation is over.
+    {
+    bool unfinished = true;
+    if (global_space_type == 0)
+      {
+      unfinished = global_grid_algo->Iterate();
+      if (unfinished && global_stop_conditions.Check(global_grid_algo->GetState(), global_grid_algo->NSpecies(), global_grid_algo->NMeshes(), global_grid_algo->GetT()))
+        unfinished = false;
+      }
+    else if (global_space_type == 1)
+      {
+      unfinished = global_graph_algo->Iterate();
+      if (unfinished && global_stop_conditions.Check(global_graph_algo->GetState(), global_graph_algo->NSpecies(), global_graph_algo->NMeshes(), global_graph_algo->GetT()))
+        unfinished = false;
+      }
+    return unfinished;
+    }
 
 template<typename T> std::vector<T> SpeciesFirstToMeshFirstArray(std::vector<T> species_first_array, int n_species, int n_meshes)
     {
@@ -157,6 +221,66 @@ bool CompareStr(const char * str1, const char * str2)
     return (std::string(str1) == std::string(str2));
     }
 
+int StorageDTypeCode(const char * storage_dtype)
+    {
+    //returns the code associated with the storage data type, -1 if it is invalid.
+    if      (CompareStr(storage_dtype, "float64")) return 0;
+    else if (CompareStr(storage_dtype, "float32")) return 1;
+    else if (CompareStr(storage_dtype, "uint16" )) return 2;
+    else if (CompareStr(storage_dtype, "uint32" )) return 3;
+    else if (CompareStr(storage_dtype, "int32"  )) return 4;
+    else return -1;
+    }
+
+int ProcessInitState(
+    std::vector<double> & mesh_x,             //processed initial state (output) //mesh first array
+    const std::vector<double> & mesh_state,   //initial state //species first array
+    int n_meshes,
+    int n_species,
+    int seed,
+    const char * init_state_processing,
+    bool is_stochastic
+    )
+    //return codes :
+    //  0 : success
+    //  4 : invalid init state processing
+    {
+    if     (CompareStr(init_state_processing, "Poisson"))
+      {
+      std::mt19937 rng(seed);
+      mesh_x.resize(n_meshes*n_species);
+      for(size_t i=0; i<mesh_x.size(); i++)
+        {
+        mesh_x[i] = static_cast<double>(std::poisson_distribution<int>(mesh_state[i])(rng));
+        }
+      }
+    else if(CompareStr(init_state_processing, "floor"))
+      {
+      mesh_x.resize(n_meshes*n_species);
+      for(size_t i=0; i<mesh_x.size(); i++)
+        {
+        mesh_x[i] = floor(mesh_state[i]);
+        }
+      }
+    else if(CompareStr(init_state_processing, "redist") || (is_stochastic && CompareStr(init_state_processing, "auto")))
+      {
+      mesh_x = GenerateStochasticDistribution (
+        SpeciesFirstToMeshFirstArray(mesh_state, n_species, n_meshes),
+        n_meshes,
+        n_species,
+        seed);
+      }
+    else if(CompareStr(init_state_processing, "none") || (!is_stochastic && CompareStr(init_state_processing, "auto")))
+      {
+      mesh_x = SpeciesFirstToMeshFirstArray(mesh_state, n_species, n_meshes);
+      }
+    else
+      {
+      return 4;
+      }
+    return 0;
+    }
+
 extern "C" int engineexport_initialize_grid (
     int w,               //system width
     int h,               //system height
@@ -184,11 +308,17 @@ extern "C" int engineexport_initialize_grid (
 
     const char * sampling_policy, //tells how the sampling should be done
     double sampling_interval,     //time interval at which the system should be sampled, if used
+    double sampling_rtol,         //relative change threshold for on_change sampling
+    double sampling_atol,         //absolute change threshold for on_change sampling
+    double sampling_max_gap,      //maximal time between two samples for on_change sampling (ignored if not positive)
+    int n_sampling_observables,   //number of species tracked for on_change sampling (0 : the whole state is tracked)
+    int * sampling_observables,   //indices of the species tracked for on_change sampling //size n_sampling_observables
     double t_max,                 //time past which the simulation should be stopped
 
     double time_step,    //time step
     int seed,            //rng seed
     const char * init_state_processing, //describes how the initial state should be processed
+    const char * storage_dtype, //data type used to store the sampled states
     const char * option  //option
     )
     //return codes :
@@ -197,6 +327,7 @@ extern "C" int engineexport_initialize_grid (
     //  2 : invalid boudary condition
     //  3 : invalid sampling policy
     //  4 : invalid init state processing
+    //  5 : invalid storage data type
     {
     global_space_type = 0;
     int n_meshes = w*h*d;
@@ -222,50 +353,35 @@ extern "C" int engineexport_initialize_grid (
     else if(CompareStr(sampling_policy, "on_iteration")) sampling_policy_code = 1;
     else if(CompareStr(sampling_policy, "on_interval" )) sampling_policy_code = 2;
     else if(CompareStr(sampling_policy, "no_sampling" )) sampling_policy_code = 3;
+    else if(CompareStr(sampling_policy, "on_change"   )) sampling_policy_code = 4;
     else return 3;
 
+    // storage data type
+    int storage_dtype_code = StorageDTypeCode(storage_dtype);
+    if (storage_dtype_code == -1) return 5;
+
     // option
     if      (CompareStr(option, "gillespie"))   {global_grid_algo = new Gillespie3D(); global_algo_freed = false;}
     else if (CompareStr(option, "tauleap"))     {global_grid_algo = new TauLeap3D();   global_algo_freed = false;}
     else if (CompareStr(option, "euler"))       {global_grid_algo = new Euler3D();     global_algo_freed = false;}
+    else if (CompareStr(option, "imex"))        {global_grid_algo = new Imex3D();      global_algo_freed = false;}
+    else if (CompareStr(option, "rk45"))        {global_grid_algo = new RungeKutta3D(0); global_algo_freed = false;}
+    else if (CompareStr(option, "rk23"))        {global_grid_algo = new RungeKutta3D(1); global_algo_freed = false;}
+    else if (CompareStr(option, "hybrid"))      {global_grid_algo = new Hybrid3D();    global_algo_freed = false;}
     else return 1;
 
-    std::vector<double> mesh_x;
-    bool is_stochastic = (CompareStr(option, "tauleap") || CompareStr(option, "gillespie"));
+    global_init_state = MkVec<double, double>(mesh_state, n_meshes*n_species);
+    global_init_state_processing = init_state_processing;
+    global_is_stochastic = (CompareStr(option, "tauleap") || CompareStr(option, "gillespie") || CompareStr(option, "hybrid"));
+    global_is_euler = CompareStr(option, "euler");
+    global_n_env = n_env;
+    global_seed = seed;
+    global_stop_conditions.Clear();
+    ResetRunControl();
 
-    if     (CompareStr(init_state_processing, "Poisson"))
-      {
-      std::mt19937 rng(seed);
-      mesh_x.resize(n_meshes*n_species);
-      for(size_t i=0; i<mesh_x.size(); i++)
-        {
-        mesh_x[i] = static_cast<double>(std::poisson_distribution<int>(mesh_state[i])(rng));
-        }
-      }
-    else if(CompareStr(init_state_processing, "floor"))
-      {
-      mesh_x.resize(n_meshes*n_species);
-      for(size_t i=0; i<mesh_x.size(); i++)
-        {
-        mesh_x[i] = floor(mesh_state[i]);
-        }
-      }
-    else if(CompareStr(init_state_processing, "redist") || (is_stochastic && CompareStr(init_state_processing, "auto")))
-      {
-      mesh_x = GenerateStochasticDistribution (
-        SpeciesFirstToMeshFirstArray(MkVec<double, double>(mesh_state, n_meshes*n_species), n_species, n_meshes),
-        n_meshes,
-        n_species,
-        seed);
-      }
-    else if(CompareStr(init_state_processing, "none") || (!is_stochastic && CompareStr(init_state_processing, "auto")))
-      {
-      mesh_x = SpeciesFirstToMeshFirstArray(MkVec<double, double>(mesh_state, n_meshes*n_species), n_species, n_meshes);
-      }
-    else
-      {
+    std::vector<double> mesh_x;
+    if (ProcessInitState(mesh_x, global_init_state, n_meshes, n_species, seed, global_init_state_processing.c_str(), global_is_stochastic) != 0)
       return 4;
-      }
 
     global_grid_algo->Init(
           w,
@@ -290,10 +406,15 @@ extern "C" int engineexport_initialize_grid (
 
           sampling_policy_code,
           sampling_interval,
+          sampling_rtol,
+          sampling_atol,
+          sampling_max_gap,
+          MkVec<int, int>(sampling_observables, n_sampling_observables),
           t_max,
 
           time_step,
-          seed
+          seed,
+          storage_dtype_code
           );
 
     return 0;
@@ -330,11 +451,17 @@ extern "C" int engineexport_initialize_graph (
 
     const char * sampling_policy, //tells how the sampling should be done
     double sampling_interval,     //time interval at which the system should be sampled, if used
+    double sampling_rtol,         //relative change threshold for on_change sampling
+    double sampling_atol,         //absolute change threshold for on_change sampling
+    double sampling_max_gap,      //maximal time between two samples for on_change sampling (ignored if not positive)
+    int n_sampling_observables,   //number of species tracked for on_change sampling (0 : the whole state is tracked)
+    int * sampling_observables,   //indices of the species tracked for on_change sampling //size n_sampling_observables
     double t_max,                 //time past which the simulation should be stopped
 
     double time_step,    //time step
     int seed,            //rng seed
     const char * init_state_processing, //describes how the initial state should be processed
+    const char * storage_dtype, //data type used to store the sampled states
     const char * option  //option
     )
     //return codes :
@@ -343,6 +470,7 @@ extern "C" int engineexport_initialize_graph (
     //  2 : invalid boudary condition
     //  3 : invalid sampling policy
     //  4 : invalid init state processing
+    //  5 : invalid storage data type
     {
     global_space_type = 1;
     int n_meshes = n_nodes;
@@ -353,50 +481,35 @@ extern "C" int engineexport_initialize_graph (
     else if(CompareStr(sampling_policy, "on_iteration")) sampling_policy_code = 1;
     else if(CompareStr(sampling_policy, "on_interval" )) sampling_policy_code = 2;
     else if(CompareStr(sampling_policy, "no_sampling" )) sampling_policy_code = 3;
+    else if(CompareStr(sampling_policy, "on_change"   )) sampling_policy_code = 4;
     else return 3;
 
+    // storage data type
+    int storage_dtype_code = StorageDTypeCode(storage_dtype);
+    if (storage_dtype_code == -1) return 5;
+
     // option
     if      (CompareStr(option, "gillespie"))   {global_graph_algo = new GillespieGraph(); global_algo_freed = false;}
     else if (CompareStr(option, "tauleap"))     {global_graph_algo = new TauLeapGraph();   global_algo_freed = false;}
     else if (CompareStr(option, "euler"))       {global_graph_algo = new EulerGraph();     global_algo_freed = false;}
+    else if (CompareStr(option, "imex"))        {global_graph_algo = new ImexGraph();      global_algo_freed = false;}
+    else if (CompareStr(option, "rk45"))        {global_graph_algo = new RungeKuttaGraph(0); global_algo_freed = false;}
+    else if (CompareStr(option, "rk23"))        {global_graph_algo = new RungeKuttaGraph(1); global_algo_freed = false;}
+    else if (CompareStr(option, "hybrid"))      {global_graph_algo = new HybridGraph();    global_algo_freed = false;}
     else return 1;
 
-    std::vector<double> mesh_x;
-    bool is_stochastic = (CompareStr(option, "tauleap") || CompareStr(option, "gillespie"));
+    global_init_state = MkVec<double, double>(mesh_state, n_meshes*n_species);
+    global_init_state_processing = init_state_processing;
+    global_is_stochastic = (CompareStr(option, "tauleap") || CompareStr(option, "gillespie") || CompareStr(option, "hybrid"));
+    global_is_euler = CompareStr(option, "euler");
+    global_n_env = n_env;
+    global_seed = seed;
+    global_stop_conditions.Clear();
+    ResetRunControl();
 
-    if     (CompareStr(init_state_processing, "Poisson"))
-      {
-      std::mt19937 rng(seed);
-      mesh_x.resize(n_meshes*n_species);
-      for(size_t i=0; i<mesh_x.size(); i++)
-        {
-        mesh_x[i] = static_cast<double>(std::poisson_distribution<int>(mesh_state[i])(rng));
-        }
-      }
-    else if(CompareStr(init_state_processing, "floor"))
-      {
-      mesh_x.resize(n_meshes*n_species);
-      for(size_t i=0; i<mesh_x.size(); i++)
-        {
-        mesh_x[i] = floor(mesh_state[i]);
-        }
-      }
-    else if(CompareStr(init_state_processing, "redist") || (is_stochastic && CompareStr(init_state_processing, "auto")))
-      {
-      mesh_x = GenerateStochasticDistribution (
-        SpeciesFirstToMeshFirstArray(MkVec<double, double>(mesh_state, n_meshes*n_species), n_species, n_meshes),
-        n_meshes,
-        n_species,
-        seed);
-      }
-    else if(CompareStr(init_state_processing, "none") || (!is_stochastic && CompareStr(init_state_processing, "auto")))
-      {
-      mesh_x = SpeciesFirstToMeshFirstArray(MkVec<double, double>(mesh_state, n_meshes*n_species), n_species, n_meshes);
-      }
-    else
-      {
+    std::vector<double> mesh_x;
+    if (ProcessInitState(mesh_x, global_init_state, n_meshes, n_species, seed, global_init_state_processing.c_str(), global_is_stochastic) != 0)
       return 4;
-      }
 
     global_graph_algo->Init(
           n_meshes,
@@ -429,28 +542,233 @@ extern "C" int engineexport_initialize_graph (
 
           sampling_policy_code,
           sampling_interval,
+          sampling_rtol,
+          sampling_atol,
+          sampling_max_gap,
+          MkVec<int, int>(sampling_observables, n_sampling_observables),
           t_max,
 
           time_step,
-          seed
+          seed,
+          storage_dtype_code
           );
 
     return 0;
     }
 
+extern "C" int engineexport_reset(int seed, double * mesh_state)
+    //resets the current simulation to t=0 with a new rng seed, without rebuilding
+    //the system topology and the rate tables. The sampled states are discarded.
+    //mesh_state : new initial state (species first array), or NULL to reuse
+    //             the initial state given at initialization.
+    //return codes :
+    //  0 : success
+    //  4 : invalid init state processing
+    {
+    int n_meshes, n_species;
+    if (global_space_type == 0)
+      {
+      n_meshes  = global_grid_algo->NMeshes();
+      n_species = global_grid_algo->NSpecies();
+      }
+    else
+      {
+      n_meshes  = global_graph_algo->NMeshes();
+      n_species = global_graph_algo->NSpecies();
+      }
+
+    if (mesh_state != NULL)
+      global_init_state = MkVec<double, double>(mesh_state, n_meshes*n_species);
+
+    std::vector<double> mesh_x;
+    if (ProcessInitState(mesh_x, global_init_state, n_meshes, n_species, seed, global_init_state_processing.c_str(), global_is_stochastic) != 0)
+      return 4;
+
+    ResetRunControl();
+
+    if (global_space_type == 0)
+      global_grid_algo->Reset(mesh_x, seed);
+    else
+      global_graph_algo->Reset(mesh_x, seed);
+
+    return 0;
+    }
+
+template<typename T> int RunEnsemble(T * prototype, int n_replicates, int n_threads, int * seeds, int n_samples, char * trajectory_data)
+    //runs the replicates on a pool of n_threads threads. Each thread repeatedly takes the next
+    //replicate to be run, on its own copy of the prototype.
+    {
+    int n_meshes  = prototype->NMeshes();
+    int n_species = prototype->NSpecies();
+    size_t replicate_size = static_cast<size_t>(n_samples)*n_meshes*n_species*prototype->GetSampledStates().ItemSize();
+
+    std::atomic<int> next_replicate(0);
+    std::atomic<int> status(0);
+
+    auto worker = [&]()
+      {
+      for(int r = next_replicate++; r < n_replicates; r = next_replicate++)
+        {
+        std::vector<double> mesh_x;
+        ProcessInitState(mesh_x, global_init_state, n_meshes, n_species, seeds[r], global_init_state_processing.c_str(), global_is_stochastic);
+
+        T * algo = prototype->Clone();
+        algo->Reset(mesh_x, seeds[r]);
+        while(algo->Iterate());
+
+        if (algo->NSamples() != n_samples)
+          status = 1;
+        else
+          {
+          if (algo->GetSampledStates().Overflow())
+            status = 2;
+          algo->GetSampledStates().Export(trajectory_data + r*replicate_size, n_meshes, n_species);
+          }
+        delete algo;
+        }
+      };
+
+    if (n_threads <= 0)
+      n_threads = std::max(1, static_cast<int>(std::thread::hardware_concurrency()));
+    n_threads = std::min(n_threads, std::max(n_replicates, 1));
+
+    std::vector<std::thread> threads;
+    for(int i=0; i<n_threads; i++)
+      threads.push_back(std::thread(worker));
+    for(size_t i=0; i<threads.size(); i++)
+      threads[i].join();
+
+    return status;
+    }
+
+extern "C" int engineexport_run_ensemble(
+    int n_replicates,      //number of replicates
+    int n_threads,         //number of threads (if not positive, the number of hardware threads is used)
+    int * seeds,           //rng seed of each replicate //size n_replicates
+    int n_samples,         //number of samples expected for each replicate
+    void * trajectory_data //output : sampled states of each replicate, with the storage data type
+                           //[replicate[sample[species[mesh]]]] //size n_replicates*n_samples*N*n_meshes
+    )
+    //runs independent replicates of the current simulation from its initial conditions,
+    //each one with its own rng seed. The current simulation itself is left untouched.
+    //return codes :
+    //  0 : success
+    //  1 : a replicate did not produce the expected number of samples
+    //  2 : a sampled value cannot be represented with the storage data type
+    {
+    if (global_space_type == 0)
+      return RunEnsemble(global_grid_algo, n_replicates, n_threads, seeds, n_samples, static_cast<char*>(trajectory_data));
+    else
+      return RunEnsemble(global_graph_algo, n_replicates, n_threads, seeds, n_samples, static_cast<char*>(trajectory_data));
+    }
+
+template<typename T> int RunBatch(T * prototype, int n_sets, double * k, double * D, double * mesh_state, int seed, double * t_sampled, double * trajectory_data)
+    {
+    int n_meshes    = prototype->NMeshes();
+    int n_species   = prototype->NSpecies();
+    int n_reactions = prototype->NReactions();
+    int n_env       = global_n_env;
+
+    std::vector<std::vector<double>> set_x0(n_sets), set_kr(n_sets), set_kout(n_sets), set_kin(n_sets);
+    std::vector<int> term_i, term_j, term_s;
+    for(int p=0; p<n_sets; p++)
+        {
+        if(ProcessInitState(set_x0[p], MkVec<double, double>(mesh_state+static_cast<size_t>(p)*n_meshes*n_species, n_meshes*n_species),
+                            n_meshes, n_species, seed, global_init_state_processing.c_str(), false) != 0)
+            return -2;
+        set_kr[p] = prototype->BuildReactionRates(MkVec<double, double>(k+static_cast<size_t>(p)*n_env*n_reactions, n_env*n_reactions));
+        prototype->BuildDiffusionTerms(MkVec<double, double>(D+static_cast<size_t>(p)*n_species*n_env, n_species*n_env),
+                                       term_i, term_j, term_s, set_kout[p], set_kin[p]);
+        }
+
+    EulerBatch batch;
+    batch.Init(n_sets, n_meshes, n_species, n_reactions,
+               prototype->GetSub(), prototype->GetSto(), prototype->GetChemostats(),
+               set_x0, set_kr, term_i, term_j, term_s, set_kout, set_kin);
+    return batch.Run(prototype->GetTimeStep(), prototype->GetTSamples(), prototype->GetTMax(), t_sampled, trajectory_data);
+    }
+
+extern "C" int engineexport_run_batch(
+    int n_sets,               //number of parameter sets
+    double * k,               //reaction rates of each set //size n_sets*n_env*M
+    double * D,               //diffusion coefficients of each set //size n_sets*N*n_env
+    double * mesh_state,      //initial state of each set //species first arrays //size n_sets*N*n_meshes
+    double * t_sampled,       //output : sampled times //size sample_n
+    double * trajectory_data  //output : sampled states of each set [set[sample[species[mesh]]]] //size n_sets*sample_n*N*n_meshes
+    )
+    //integrates several parameter sets of the current simulation in lockstep with the Euler method.
+    //the topology, chemostats, sample times, time step and t_max are the ones of the current simulation,
+    //which must use the euler option. The current simulation itself is left untouched.
+    //returns the number of samples, or :
+    //  -1 : the current simulation does not use the euler option
+    //  -2 : invalid init state processing
+    {
+    if (!global_is_euler)
+      return -1;
+    if (global_space_type == 0)
+      return RunBatch(global_grid_algo, n_sets, k, D, mesh_state, global_seed, t_sampled, trajectory_data);
+    else
+      return RunBatch(global_graph_algo, n_sets, k, D, mesh_state, global_seed, t_sampled, trajectory_data);
+    }
+
 extern "C" int engineexport_run(int breathe_dt)
+    //keeps iterating for breathe_dt ms, until the simulation is over, until a cancellation is
+    //requested (see engineexport_cancel) or until the deadline is reached (see engineexport_set_wall_time_limit).
+    //The clock and the cancellation flag are checked every global_check_interval iterations,
+    //which is adapted so that checks occur about every 100 us whatever the cost of an iteration.
+    //return codes :
+    //  0 : the simulation is over
+    //  1 : breathe_dt is elapsed
+    //  2 : the run was cancelled
+    //  3 : the deadline is reached
     {
     bool unfinished = true;
-    auto t0 = std::chrono::system_clock::now();
+    auto t0 = std::chrono::steady_clock::now();
+    auto t_check = t0;
     for(;;)
         {
-        if      (global_space_type == 0) unfinished = global_grid_algo->Iterate();
-        else if (global_space_type == 1) unfinished = global_graph_algo->Iterate();
-        int dt = static_cast<int>(std::chrono::duration_cast<std::chrono::milliseconds>(std::chrono::system_clock::now() - t0).count());
-        if(!unfinished || dt>=breathe_dt)
-            break;
+        for(int i=0; i<global_check_interval && unfinished; i++)
+            unfinished = IterateOnce();
+        if(!unfinished)
+            return 0;
+
+        auto now = std::chrono::steady_clock::now();
+        double check_dt = std::chrono::duration<double, std::micro>(now - t_check).count();
+        t_check = now;
+        if     (check_dt <  50 && global_check_interval < (1<<20)) global_check_interval *= 2;
+        else if(check_dt > 200 && global_check_interval > 1)       global_check_interval /= 2;
+
+        if(global_cancel_requested)
+            return 2;
+        if(global_has_deadline && now >= global_deadline)
+            return 3;
+        if(std::chrono::duration_cast<std::chrono::milliseconds>(now - t0).count() >= breathe_dt)
+            return 1;
         }
-    return unfinished;
+    }
+
+extern "C" int engineexport_cancel()
+    //requests the current or next engineexport_run call to stop. Can be called from any thread.
+    //The request holds until the simulation is reset or initialized again.
+    {
+    global_cancel_requested = true;
+    return 0;
+    }
+
+extern "C" int engineexport_set_wall_time_limit(double limit)
+    //sets a deadline *limit* seconds from now, after which engineexport_run stops.
+    //a negative limit removes the deadline.
+    {
+    if(limit < 0)
+      {
+      global_has_deadline = false;
+      }
+    else
+      {
+      global_deadline = std::chrono::steady_clock::now() + std::chrono::duration_cast<std::chrono::steady_clock::duration>(std::chrono::duration<double>(limit));
+      global_has_deadline = true;
+      }
+    return 0;
     }
 
 extern "C" int engineexport_iterate_n(int n_iterations)
@@ -458,8 +776,7 @@ extern "C" int engineexport_iterate_n(int n_iterations)
     bool unfinished = true;
     for(int i=0; i<n_iterations; i++)
         {
-        if      (global_space_type == 0) unfinished = global_grid_algo->Iterate();
-        else if (global_space_type == 1) unfinished = global_graph_algo->Iterate();
+        unfinished = IterateOnce();
         if(!unfinished)
             break;
         }
@@ -468,10 +785,122 @@ extern "C" int engineexport_iterate_n(int n_iterations)
 
 extern "C" int engineexport_iterate()
     {
-    bool unfinished = true;
-    if      (global_space_type == 0) unfinished = global_grid_algo->Iterate();
-    else if (global_space_type == 1) unfinished = global_graph_algo->Iterate();
-    return unfinished;
+    return IterateOnce();
+    }
+
+extern "C" int engineexport_set_stop_conditions(
+    int n_conditions,     //number of conditions
+    int * types,          //type of each condition (0 : above, 1 : below, 2 : relative change, 3 : steady state)
+    int * species,        //species index of each condition (-1 for all the species)
+    double * values,      //threshold of each condition (relative tolerance for steady state)
+    double * atols,       //absolute tolerance of each condition (steady state)
+    double * intervals,   //time interval of each condition (relative change and steady state)
+    int * cells_offsets,  //offset of the cells of each condition in cells //size n_conditions+1
+    int * cells,          //cells of the conditions (no cells for the whole system)
+    int check_interval    //number of iterations between two evaluations
+    )
+    //sets the stopping conditions of the current simulation.
+    {
+    global_stop_conditions.Clear();
+    global_stop_conditions.SetCheckInterval(check_interval);
+    global_stop_conditions.SetStochastic(global_is_stochastic);
+    for(int i=0; i<n_conditions; i++)
+      global_stop_conditions.Add(types[i], species[i], std::vector<int>(cells+cells_offsets[i], cells+cells_offsets[i+1]), values[i], atols[i], intervals[i]);
+    return 0;
+    }
+
+extern "C" int engineexport_set_tolerances(double rtol, double atol)
+    //sets the local error tolerances of the current simulation, used by the adaptive time step options ("rk45" and "rk23").
+    {
+    if (global_space_type == 0)
+      global_grid_algo->SetTolerances(rtol, atol);
+    else
+      global_graph_algo->SetTolerances(rtol, atol);
+    return 0;
+    }
+
+extern "C" int engineexport_set_multirate(
+    int mode,          //0 : diffusion sub-cycling only (default), 1 : automatic partition, 2 : given fast species, 3 : no sub-cycling
+    int * fast_species //1 if the species is fast, 0 otherwise (if mode is 2) //size N
+    )
+    //sets the partition of the processes of the current simulation into slow ones, integrated over the whole time step,
+    //and fast ones, sub-stepped by the "euler" and "tauleap" options (see SetMultirate).
+    {
+    if (global_space_type == 0)
+      global_grid_algo->SetMultirate(mode, MkVec<int, int>(fast_species, mode == 2 ? global_grid_algo->NSpecies() : 0));
+    else
+      global_graph_algo->SetMultirate(mode, MkVec<int, int>(fast_species, mode == 2 ? global_graph_algo->NSpecies() : 0));
+    return 0;
+    }
+
+extern "C" int engineexport_set_local_time_stepping(int enabled)
+    //enables or disables the local time stepping of the current simulation, used by the "euler" and "tauleap" options
+    //on graph spaces (see SimulationAlgorithmGraphBase::SetLocalTimeStepping).
+    //returns -1 if the current simulation is on a grid space, 0 otherwise.
+    {
+    if (global_space_type == 0)
+      return -1;
+    global_graph_algo->SetLocalTimeStepping(enabled != 0);
+    return 0;
+    }
+
+extern "C" int engineexport_set_hybrid_thresholds(double population_threshold, double propensity_threshold)
+    //sets the thresholds of the partition into continuous and stochastic channels of the current simulation,
+    //used by the "hybrid" option.
+    {
+    if (global_space_type == 0)
+      global_grid_algo->SetHybridThresholds(population_threshold, propensity_threshold);
+    else
+      global_graph_algo->SetHybridThresholds(population_threshold, propensity_threshold);
+    return 0;
+    }
+
+extern "C" int engineexport_set_hybrid_region(
+    int enabled,           //1 if the partition is spatial, 0 if it follows the thresholds
+    int * mesh_stochastic  //1 if the mesh belongs to the stochastic region, 0 otherwise (if enabled is 1) //size n_meshes
+    )
+    //sets the spatial partition of the current simulation into a deterministic and a stochastic region,
+    //used by the "hybrid" option.
+    {
+    if (global_space_type == 0)
+      global_grid_algo->SetHybridRegion(MkVec<int, int>(mesh_stochastic, enabled ? global_grid_algo->NMeshes() : 0));
+    else
+      global_graph_algo->SetHybridRegion(MkVec<int, int>(mesh_stochastic, enabled ? global_graph_algo->NMeshes() : 0));
+    return 0;
+    }
+
+extern "C" int engineexport_get_stop_condition(double * t)
+    //returns the index of the stopping condition that ended the simulation (-1 if none did),
+    //and writes the time at which it fired in t.
+    {
+    *t = global_stop_conditions.TFired();
+    return global_stop_conditions.Fired();
+    }
+
+extern "C" int engineexport_get_local_time_stepping_levels(
+    int * mesh_level //output : local time stepping level of each mesh (graph spaces only) //size n_meshes
+    )
+    //returns the finest local time stepping level of the current simulation (-1 if the local time stepping is disabled),
+    //and writes the level of each mesh.
+    {
+    if (global_space_type == 0)
+      return -1;
+    const std::vector<int> & levels = global_graph_algo->GetMeshLevels();
+    std::copy(levels.begin(), levels.end(), mesh_level);
+    return global_graph_algo->LocalTimeSteppingMaxLevel();
+    }
+
+extern "C" int engineexport_get_hybrid_partition(
+    int * counts //output : numbers of continuous and stochastic reaction channels, and of continuous and stochastic diffusion channels //size 4
+    )
+    //writes the numbers of channels of each kind at the last partition of the current simulation.
+    //returns -1 if the current simulation does not use the "hybrid" option, 0 otherwise.
+    {
+    std::vector<int> c = global_space_type == 0 ? global_grid_algo->HybridPartition() : global_graph_algo->HybridPartition();
+    if (c.empty())
+      return -1;
+    std::copy(c.begin(), c.end(), counts);
+    return 0;
     }
 
 extern "C" double engineexport_get_progress()
@@ -483,52 +912,72 @@ extern "C" double engineexport_get_progress()
     return progress;
     }
 
-extern "C" int engineexport_get_trajectory(double * trajectory_data)
+extern "C" int engineexport_get_trajectory(void * trajectory_data)
     {
+    //trajectory_data must be an array of the storage data type
+    //of size n_samples*n_species*n_meshes
     if (global_space_type == 0)
       {
-
-      int n_samples = global_grid_algo->NSamples();
       int n_species = global_grid_algo->NSpecies();
       int n_meshes  = global_grid_algo->NMeshes();
-
-      std::vector<std::vector<double>> & trajectory_data_vec = global_grid_algo->GetSampledStates();
-      for(int n=0;n<n_samples;n++)
-          {
-          for(int s=0;s<n_species;s++)
-              {
-              for(int i=0; i<n_meshes; i++)
-                  {
-                  //mesh first to species first
-                  trajectory_data[n*n_meshes*n_species+ s*n_meshes + i] = trajectory_data_vec[n][i*n_species+s];
-                  }
-              }
-          }
+      global_grid_algo->GetSampledStates().Export(trajectory_data, n_meshes, n_species);
       return 0;
       }
     else
       {
-
-      int n_samples = global_graph_algo->NSamples();
       int n_species = global_graph_algo->NSpecies();
       int n_meshes  = global_graph_algo->NMeshes();
-
-      std::vector<std::vector<double>> & trajectory_data_vec = global_graph_algo->GetSampledStates();
-      for(int n=0;n<n_samples;n++)
-          {
-          for(int s=0;s<n_species;s++)
-              {
-              for(int i=0; i<n_meshes; i++)
-                  {
-                  //mesh first to species first
-                  trajectory_data[n*n_meshes*n_species+ s*n_meshes + i] = trajectory_data_vec[n][i*n_species+s];
-                  }
-              }
-          }
+      global_graph_algo->GetSampledStates().Export(trajectory_data, n_meshes, n_species);
       return 0;
       }
     }
 
+extern "C" int engineexport_get_samples(int first, int count, double * t_sample, void * trajectory_data)
+    //writes the sampling times and the sampled states first to first+count-1, for reading
+    //the samples while the simulation is running.
+    //t_sample must be of size count, and trajectory_data an array of the storage data type
+    //of size count*n_species*n_meshes.
+    //return codes :
+    //  0 : success
+    //  1 : invalid range
+    {
+    int n_species, n_meshes, n_sample;
+    if (global_space_type == 0)
+      {
+      n_species = global_grid_algo->NSpecies();
+      n_meshes  = global_grid_algo->NMeshes();
+      n_sample  = global_grid_algo->NSamples();
+      }
+    else
+      {
+      n_species = global_graph_algo->NSpecies();
+      n_meshes  = global_graph_algo->NMeshes();
+      n_sample  = global_graph_algo->NSamples();
+      }
+
+    if (first < 0 || count < 0 || first+count > n_sample)
+      return 1;
+
+    std::vector<double> & t_sample_vec = (global_space_type == 0) ? global_grid_algo->GetSampledT() : global_graph_algo->GetSampledT();
+    for(int i=0; i<count; i++)
+      t_sample[i] = t_sample_vec[first+i];
+
+    if (global_space_type == 0)
+      global_grid_algo->GetSampledStates().ExportRange(trajectory_data, n_meshes, n_species, first, count);
+    else
+      global_graph_algo->GetSampledStates().ExportRange(trajectory_data, n_meshes, n_species, first, count);
+    return 0;
+    }
+
+extern "C" int engineexport_get_storage_overflow()
+    {
+    //returns 1 if a sampled value could not be represented with the storage data type, 0 otherwise.
+    if (global_space_type == 0)
+      return global_grid_algo->GetSampledStates().Overflow();
+    else
+      return global_graph_algo->GetSampledStates().Overflow();
+    }
+
 extern "C" int engineexport_get_state(double * state_data)
     {
     if (global_space_type == 0)
@@ -569,6 +1018,47 @@ extern "C" int engineexport_get_state(double * state_data)
       }
     }
 
+extern "C" double engineexport_get_time_step()
+    //returns the time step of the current simulation (the one chosen at initialization if it was negative).
+    {
+    if (global_space_type == 0)
+      return global_grid_algo->GetTimeStep();
+    else
+      return global_graph_algo->GetTimeStep();
+    }
+
+extern "C" double engineexport_get_stable_time_step()
+    //returns the largest stable time step of the current simulation, estimated at initialization
+    //(-1 if the algorithm has no such bound).
+    {
+    if (global_space_type == 0)
+      return global_grid_algo->StableTimeStep();
+    else
+      return global_graph_algo->StableTimeStep();
+    }
+
+template<typename T> int GetMultiratePartition(T * algo, int * diffusion_group, int * reaction_group)
+    {
+    const std::vector<int> & dg = algo->GetDiffusionGroups();
+    const std::vector<int> & rg = algo->GetReactionGroups();
+    std::copy(dg.begin(), dg.end(), diffusion_group);
+    std::copy(rg.begin(), rg.end(), reaction_group);
+    return algo->NSubsteps();
+    }
+
+extern "C" int engineexport_get_multirate_partition(
+    int * diffusion_group, //output : 1 if the diffusion of the species is fast, 0 otherwise //size N
+    int * reaction_group   //output : 1 if the reaction is fast, 0 otherwise //size M
+    )
+    //returns the number of sub-steps of the fast processes per time step of the current simulation,
+    //and writes the partition of the processes into slow and fast ones (see SetMultirate).
+    {
+    if (global_space_type == 0)
+      return GetMultiratePartition(global_grid_algo, diffusion_group, reaction_group);
+    else
+      return GetMultiratePartition(global_graph_algo, diffusion_group, reaction_group);
+    }
+
 extern "C" double engineexport_get_time()
     {
     if (global_space_type == 0)
@@ -625,6 +1115,69 @@ extern "C" int engineexport_sample()
     return 0;
     }
 
+extern "C" int engineexport_is_complete()
+    {
+    if (global_stop_conditions.Fired() >= 0)
+      return 1;
+    if (global_space_type == 0)
+      return global_grid_algo->IsComplete();
+    else
+      return global_graph_algo->IsComplete();
+    }
+
+extern "C" int engineexport_save_checkpoint(const char * path)
+    //saves the dynamic state of the current simulation, including the state of
+    //the stop conditions, in a checkpoint file.
+    //return codes :
+    //  0 : success
+    //  1 : the file could not be written
+    {
+    std::ofstream out(path, std::ios::binary);
+    if(!out)
+      return 1;
+
+    WriteString(out, "strengths_checkpoint");
+    WriteValue(out, global_space_type);
+
+    if (global_space_type == 0)
+      global_grid_algo->SaveState(out);
+    else
+      global_graph_algo->SaveState(out);
+    global_stop_conditions.SaveState(out);
+
+    out.flush();
+    return out ? 0 : 1;
+    }
+
+extern "C" int engineexport_load_checkpoint(const char * path)
+    //restores the dynamic state of the current simulation from a checkpoint file.
+    //the simulation must have been initialized with the same system and script.
+    //return codes :
+    //  0 : success
+    //  1 : the file could not be read
+    //  2 : the checkpoint does not match the current simulation
+    {
+    std::ifstream in(path, std::ios::binary);
+    if(!in)
+      return 1;
+
+    std::string header;
+    int space_type;
+    if(!ReadString(in, header) || header != "strengths_checkpoint" || !ReadValue(in, space_type))
+      return 2;
+    if(space_type != global_space_type)
+      return 2;
+
+    bool ok;
+    if (global_space_type == 0)
+      ok = global_grid_algo->LoadState(in);
+    else
+      ok = global_graph_algo->LoadState(in);
+    ok = ok && global_stop_conditions.LoadState(in);
+
+    return ok ? 0 : 2;
+    }
+
 extern "C" int engineexport_finalize ()
     {
     if(global_algo_freed)
@@ -634,6 +1187,7 @@ extern "C" int engineexport_finalize ()
       delete global_grid_algo;
     else
       delete global_graph_algo;
+    global_algo_freed = true;
 
     return 0;
     }
@@ -38,6 +38,8 @@ class KineticsRDEngine(RDEngineBase) :
         system = script.system
         t_sample = script.t_sample
         time_step = script.time_step
+        if time_step == "auto" :
+            raise ValueError("time_step=\"auto\" is not supported by this engine.")
         t_max = script.t_max
         sampling_policy = script.sampling_policy
         sampling_interval = script.sampling_interval
@@ -1,12 +1,14 @@
 from strengths.units import *
 from strengths.rdsystem import RDSystem
 from strengths.rdengine import RDEngineBase
-from strengths.rdoutput import  RDTrajectory
+from strengths.rdoutput import  RDTrajectory, RDTrajectoryEnsemble, cast_trajectory_data
 from strengths.rdspace import RDGridSpace, RDGraphSpace
 from strengths.typechecking import *
+from strengths.parameters import apply_parameters
 
 import numpy as np
 import ctypes
+import os
 
 def build_reaction_rate_constant_matrix(reactions, environments, units_system) :
     """
@@ -142,14 +144,18 @@ class LibRDEngine(RDEngineBase) :
         self._lib = lib
         self._requires_molecules = requires_molecules
         self._simulation_unfinished = 1
+        self._interrupted = False
         
         lib.engineexport_get_progress.restype = ctypes.c_double
         lib.engineexport_get_time.restype = ctypes.c_double
+        lib.engineexport_get_time_step.restype = ctypes.c_double
+        lib.engineexport_get_stable_time_step.restype = ctypes.c_double
         super(LibRDEngine, self).__init__(option, description)
 
     def setup(self, script) :
         
         self._script = script.copy()
+        self._interrupted = False
         
         units_system = script.units_system.copy()
 
@@ -177,6 +183,183 @@ class LibRDEngine(RDEngineBase) :
         else :
             raise TypeError("unsupported space type.")
         
+        self._set_stop_conditions(script, units_system)
+        
+        self._lib.engineexport_set_tolerances(
+            ctypes.c_double(script.rtol),
+            ctypes.c_double(script.atol.convert(units_system).value)
+            )
+        
+        self._lib.engineexport_set_hybrid_thresholds(
+            ctypes.c_double(script.hybrid_population_threshold),
+            ctypes.c_double(script.hybrid_propensity_threshold)
+            )
+        
+        self._set_hybrid_region(script)
+        self._set_multirate(script)
+        self._set_local_time_stepping(script)
+        self._check_time_step(units_system)
+    
+    def _set_multirate(self, script) :
+        
+        if script.multirate is None :
+            mode, fast_species = 0, []
+        elif script.multirate is False :
+            mode, fast_species = 3, []
+        elif script.multirate == "auto" :
+            mode, fast_species = 1, []
+        else :
+            mode = 2
+            fast_species = [1 if s.label in script.multirate else 0 for s in script.system.network.species]
+        
+        self._lib.engineexport_set_multirate(
+            ctypes.c_int(mode),
+            make_ctypes_array(fast_species, ctypes.c_int)
+            )
+        
+        # the default diffusion sub-cycling changes the results of the time step, and is reported
+        local_time_stepping = script.local_time_stepping and type(script.system.space) == RDGraphSpace
+        if mode == 0 and self.option in ["euler", "tauleap"] and not local_time_stepping :
+            n_substeps = self.get_multirate_partition()["substeps"]
+            if n_substeps > 1 :
+                print("warning : the time step exceeds the stability bound of the diffusion, which is integrated with " + 
+                      str(n_substeps) + " sub-steps per time step (set multirate to False to integrate it with the time step).")
+    
+    def _set_hybrid_region(self, script) :
+        
+        region = script.hybrid_stochastic_region
+        if region is None :
+            enabled, mesh_stochastic = 0, []
+        elif all(isstr(v) for v in region) :
+            environments = script.system.network.environments
+            enabled = 1
+            mesh_stochastic = [1 if environments[e] in region else 0 for e in script.system.space.get_cell_env_array()]
+        else :
+            enabled, mesh_stochastic = 1, region
+        
+        self._lib.engineexport_set_hybrid_region(
+            ctypes.c_int(enabled),
+            make_ctypes_array(mesh_stochastic, ctypes.c_int)
+            )
+    
+    def _set_local_time_stepping(self, script) :
+        
+        if not script.local_time_stepping :
+            return
+        if type(script.system.space) != RDGraphSpace :
+            print("warning : the local time stepping is only available on graph spaces, and is ignored.")
+            return
+        if script.multirate is not None and script.multirate is not False :
+            print("warning : multirate is ignored with the local time stepping.")
+        self._lib.engineexport_set_local_time_stepping(ctypes.c_int(1))
+    
+    def get_local_time_stepping_levels(self) :
+        """
+        Returns the local time stepping level of each node of the graph space (see RDScript.local_time_stepping),
+        the nodes of level L being integrated with 2^L steps of time_step/2^L,
+        or None if the local time stepping is not used.
+        
+        :rtype: list of int or None
+        """
+        
+        n_meshes = self._script.system.space.size()
+        levels = (ctypes.c_int*n_meshes)()
+        if self._lib.engineexport_get_local_time_stepping_levels(levels) < 0 :
+            return None
+        return list(levels)
+    
+    def get_hybrid_partition(self) :
+        """
+        Returns the numbers of reaction and diffusion channels (one per mesh and reaction, or per mesh, species and neighbor)
+        integrated deterministically ("continuous") or stochastically ("stochastic") at the last time step of the hybrid engine,
+        the diffusion from the deterministic region to the stochastic region being counted as continuous (see RDScript.hybrid_stochastic_region),
+        as a dict with the keys "continuous_reactions", "stochastic_reactions", "continuous_diffusion" and "stochastic_diffusion",
+        or None if the engine is not the hybrid engine.
+        
+        :rtype: dict or None
+        """
+        
+        counts = (ctypes.c_int*4)()
+        if self._lib.engineexport_get_hybrid_partition(counts) < 0 :
+            return None
+        return {
+            "continuous_reactions" : counts[0],
+            "stochastic_reactions" : counts[1],
+            "continuous_diffusion" : counts[2],
+            "stochastic_diffusion" : counts[3]
+            }
+    
+    def get_multirate_partition(self) :
+        """
+        Returns the partition of the processes into slow ones, integrated with the time step,
+        and fast ones, sub-stepped (see RDScript.multirate), as a dict with the following keys :
+            
+        * "substeps" : number of sub-steps of the fast processes per time step (1 if there is no fast process)
+        * "fast_species" : labels of the species of which the diffusion is sub-stepped
+        * "fast_reactions" : indices of the reactions (in the network reactions) of which at least one direction is sub-stepped
+        
+        :rtype: dict
+        """
+        
+        species = self._script.system.network.species
+        n_reactions = len(self._script.system.network.reactions)
+        diffusion_group = (ctypes.c_int*len(species))()
+        reaction_group = (ctypes.c_int*(2*n_reactions))()
+        n_substeps = self._lib.engineexport_get_multirate_partition(diffusion_group, reaction_group)
+        return {
+            "substeps" : n_substeps,
+            "fast_species" : [species[i].label for i in range(len(species)) if diffusion_group[i]],
+            "fast_reactions" : [j for j in range(n_reactions) if reaction_group[2*j] or reaction_group[2*j+1]]
+            }
+    
+    def _check_time_step(self, units_system) :
+        
+        # the time step chosen by the engine replaces "auto"
+        # (units_system only differs from the script's one by its quantity units)
+        time_step = self._lib.engineexport_get_time_step()
+        if self._script.time_step == "auto" :
+            self._script.time_step = time_step
+        
+        stable_time_step = self._lib.engineexport_get_stable_time_step()
+        if stable_time_step > 0 and time_step > stable_time_step :
+            print("warning : the time step (" + str(self._script.time_step) + ") exceeds the explicit stability bound of the processes integrated with the full time step at the initial state (" + 
+                  str(UnitValue(stable_time_step, Units(sys=units_system, dim=time_units_dimensions()))) + ").")
+    
+    def _set_stop_conditions(self, script, units_system) :
+        
+        conditions = [] if script.stop_conditions is None else script.stop_conditions
+        types, species, values, atols, intervals, cells_offsets, cells = [], [], [], [], [], [0], []
+        for c in conditions :
+            types.append({"above" : 0, "below" : 1, "rel_change" : 2, "steady_state" : 3}[c["type"]])
+            species.append(-1 if c["species"] is None else script.system.network.get_species_index(c["species"]))
+            if c["type"] == "steady_state" :
+                values.append(c["rtol"])
+                atols.append(c["atol"].convert(units_system).value)
+                intervals.append(c["interval"].convert(units_system).value)
+            elif c["type"] == "rel_change" :
+                values.append(c["value"])
+                atols.append(0)
+                intervals.append(c["interval"].convert(units_system).value)
+            else :
+                values.append(c["value"].convert(units_system).value)
+                atols.append(0)
+                intervals.append(0)
+            if c["cells"] is not None :
+                cells += c["cells"]
+            cells_offsets.append(len(cells))
+        
+        self._lib.engineexport_set_stop_conditions(
+            ctypes.c_int(len(conditions)),
+            make_ctypes_array(types, ctypes.c_int),
+            make_ctypes_array(species, ctypes.c_int),
+            make_ctypes_array(values, ctypes.c_double),
+            make_ctypes_array(atols, ctypes.c_double),
+            make_ctypes_array(intervals, ctypes.c_double),
+            make_ctypes_array(cells_offsets, ctypes.c_int),
+            make_ctypes_array(cells, ctypes.c_int),
+            ctypes.c_int(script.stop_check_interval)
+            )
+        
     def _setup_graph(self, script, units_system, species, reactions, environments) :
 
         res = self._lib.engineexport_initialize_graph(
@@ -253,11 +436,26 @@ class LibRDEngine(RDEngineBase) :
             #sampling_interval
                 ctypes.c_double(script.sampling_interval.convert(units_system).value),
 
+            #sampling_rtol
+                ctypes.c_double(script.sampling_rtol),
+
+            #sampling_atol
+                ctypes.c_double(script.sampling_atol.convert(units_system).value),
+
+            #sampling_max_gap
+                ctypes.c_double(-1 if script.sampling_max_gap is None else script.sampling_max_gap.convert(units_system).value),
+
+            #n_sampling_observables
+                ctypes.c_int(len(script.get_sampling_observables_indices())),
+
+            #sampling_observables
+                make_ctypes_array(script.get_sampling_observables_indices(), ctypes.c_int),
+
             #t_max
                 ctypes.c_double(script.t_max.convert(units_system).value),                
 
             #time_step
-                ctypes.c_double(script.time_step.convert(units_system).value),
+                ctypes.c_double(-1 if script.time_step == "auto" else script.time_step.convert(units_system).value),
                 
             #seed
                 ctypes.c_int(script.rng_seed),
@@ -265,6 +463,9 @@ class LibRDEngine(RDEngineBase) :
             #init_state_processing
                 ctypes.c_char_p(script.init_state_processing.encode()),
 
+            #storage_dtype
+                ctypes.c_char_p(script.storage_dtype.encode()),
+
             #option
                 ctypes.c_char_p(self.option.encode())
                 )
@@ -273,6 +474,8 @@ class LibRDEngine(RDEngineBase) :
             raise Exception("Invalid option argument : \""+engine.get_option()+"\".")
         elif res == 2 :
             raise Exception("Invalid boundary conditions.")
+        elif res == 5 :
+            raise ValueError("Invalid storage data type : \""+script.storage_dtype+"\".")
             
     def _setup_grid(self, script, units_system, species, reactions, environments) :
         
@@ -340,17 +543,35 @@ class LibRDEngine(RDEngineBase) :
             #sampling_interval
                 ctypes.c_double(script.sampling_interval.convert(units_system).value),
 
+            #sampling_rtol
+                ctypes.c_double(script.sampling_rtol),
+
+            #sampling_atol
+                ctypes.c_double(script.sampling_atol.convert(units_system).value),
+
+            #sampling_max_gap
+                ctypes.c_double(-1 if script.sampling_max_gap is None else script.sampling_max_gap.convert(units_system).value),
+
+            #n_sampling_observables
+                ctypes.c_int(len(script.get_sampling_observables_indices())),
+
+            #sampling_observables
+                make_ctypes_array(script.get_sampling_observables_indices(), ctypes.c_int),
+
             #t_max
                 ctypes.c_double(script.t_max.convert(units_system).value),                
                 
             #time_step
-                ctypes.c_double(script.time_step.convert(units_system).value),
+                ctypes.c_double(-1 if script.time_step == "auto" else script.time_step.convert(units_system).value),
                 
             #seed
                 ctypes.c_int(script.rng_seed),
 
             #init_state_processing
                 ctypes.c_char_p(script.init_state_processing.encode()),
+
+            #storage_dtype
+                ctypes.c_char_p(script.storage_dtype.encode()),
                                 
             #option
                 ctypes.c_char_p(self.option.encode())
@@ -360,11 +581,28 @@ class LibRDEngine(RDEngineBase) :
             raise Exception("Invalid option argument : \""+engine.get_option()+"\".")
         elif res == 2 :
             raise Exception("Invalid boundary conditions.")
+        elif res == 5 :
+            raise ValueError("Invalid storage data type : \""+script.storage_dtype+"\".")
             
     def run(self, breathe_dt) :
         
-        self._simulation_unfinished = self._lib.engineexport_run(breathe_dt)
+        res = self._lib.engineexport_run(breathe_dt)
+        # 2 : cancelled, 3 : deadline reached
+        self._interrupted = res in (2, 3)
+        self._simulation_unfinished = int(res != 0)
         return bool(self._simulation_unfinished)
+    
+    def cancel(self) :
+        
+        self._lib.engineexport_cancel()
+    
+    def set_wall_time_limit(self, limit) :
+        
+        self._lib.engineexport_set_wall_time_limit(ctypes.c_double(-1 if limit is None else max(limit, 0)))
+    
+    def is_interrupted(self) :
+        
+        return self._interrupted
 
     def iterate(self) :
         
@@ -383,6 +621,34 @@ class LibRDEngine(RDEngineBase) :
         progress = self._lib.engineexport_get_progress()
         return float(progress)
 
+    def get_time(self) :
+        
+        return UnitValue(self._lib.engineexport_get_time(), Units(sys=self._units_system, dim=time_units_dimensions())).convert(self._script.units_system)
+    
+    def get_samples(self, first=0) :
+        
+        n_sample = max(self._count_samples()-first, 0)
+        t_sample = np.zeros(n_sample)
+        data = np.zeros(n_sample*self._script.system.state_size(), dtype=self._script.storage_dtype)
+        res = self._lib.engineexport_get_samples(
+            ctypes.c_int(first), 
+            ctypes.c_int(n_sample), 
+            t_sample.ctypes.data_as(ctypes.POINTER(ctypes.c_double)), 
+            data.ctypes.data_as(ctypes.c_void_p)
+            )
+        if res == 1 :
+            raise IndexError("invalid sample index : "+str(first)+".")
+        if self._lib.engineexport_get_storage_overflow() :
+            raise OverflowError("a sampled value cannot be represented with the storage data type \""+self._script.storage_dtype+"\".")
+        
+        t_sample = UnitArray(value=t_sample, 
+                             units=Units(
+                                 sys=self._units_system ,
+                                 dim=time_units_dimensions()),
+                             check_value=False
+                             ).convert(self._script.units_system)
+        return t_sample, self._convert_data(data)
+    
     def sample(self) :
         
         self._lib.engineexport_sample()
@@ -391,6 +657,131 @@ class LibRDEngine(RDEngineBase) :
         
         return not bool(self._simulation_unfinished)
     
+    def reset(self, rng_seed=None, state=None) :
+        
+        if rng_seed is not None :
+            self._script.rng_seed = rng_seed
+        
+        if state is None :
+            state_ = None
+        else :
+            self._script.system.state = state
+            if len(self._script.system.state) != self._script.system.state_size() :
+                raise ValueError("the state size does not match the system.")
+            state_ = make_ctypes_array(self._script.system.state.convert(self._units_system).value, ctypes.c_double)
+        
+        res = self._lib.engineexport_reset(ctypes.c_int(self._script.rng_seed), state_)
+        if res == 4 :
+            raise ValueError("Invalid init state processing : \""+self._script.init_state_processing+"\".")
+        self._simulation_unfinished = 1
+        self._interrupted = False
+        
+    def run_ensemble(self, seeds, n_threads=None) :
+        
+        if self._script.sampling_policy != "on_t_sample" :
+            raise ValueError("ensembles require the \"on_t_sample\" sampling policy.")
+        if self._script.stop_conditions is not None :
+            raise NotImplementedError("ensembles do not support stop conditions.")
+        
+        n_replicates = len(seeds)
+        n_sample = len(self._script.t_sample)
+        data = np.zeros(n_replicates*n_sample*self._script.system.state_size(), dtype=self._script.storage_dtype)
+        
+        res = self._lib.engineexport_run_ensemble(
+            ctypes.c_int(n_replicates),
+            ctypes.c_int(0 if n_threads is None else n_threads),
+            make_ctypes_array([int(seed) for seed in seeds], ctypes.c_int),
+            ctypes.c_int(n_sample),
+            data.ctypes.data_as(ctypes.c_void_p)
+            )
+        if res == 1 :
+            raise RuntimeError("a replicate did not produce the expected number of samples.")
+        elif res == 2 :
+            raise OverflowError("a sampled value cannot be represented with the storage data type \""+self._script.storage_dtype+"\".")
+        
+        return RDTrajectoryEnsemble(
+            data = self._convert_data(data), 
+            t_sample = self._script.t_sample, 
+            system = self._script.system,
+            seeds = seeds,
+            script = self._script,
+            engine_description = self.description, 
+            engine_option = self.option
+            )
+        
+    def run_batch(self, parameters) :
+        
+        if self.option != "euler" :
+            raise NotImplementedError("batches are only supported with the \"euler\" option.")
+        if self._script.stop_conditions is not None :
+            raise NotImplementedError("batches do not support stop conditions.")
+        if self._script.sampling_policy != "on_t_sample" :
+            raise ValueError("batches require the \"on_t_sample\" sampling policy.")
+        
+        environments = self._script.system.network.environments
+        k, D, state = [], [], []
+        for p in parameters :
+            system = apply_parameters(self._script.system, p)
+            reactions = []
+            for r in system.network.reactions :
+                rf, rr = r.split()
+                reactions.append(rf)
+                reactions.append(rr)
+            k.append(build_reaction_rate_constant_matrix(reactions, environments, self._units_system))
+            D.append(build_diff_coef_environment_matrix(system.network.species, environments, self._units_system))
+            state.append(system.state.convert(self._units_system).value)
+        
+        n_sets = len(parameters)
+        n_sample = len(self._script.t_sample)
+        state_size = self._script.system.state_size()
+        t_sampled = np.zeros(n_sample)
+        data = np.zeros(n_sets*n_sample*state_size)
+        
+        res = self._lib.engineexport_run_batch(
+            ctypes.c_int(n_sets),
+            make_ctypes_array(np.concatenate(k), ctypes.c_double),
+            make_ctypes_array(np.concatenate(D), ctypes.c_double),
+            make_ctypes_array(np.concatenate(state), ctypes.c_double),
+            t_sampled.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+            data.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+            )
+        if res == -2 :
+            raise ValueError("Invalid init state processing : \""+self._script.init_state_processing+"\".")
+        
+        data = data.reshape((n_sets, n_sample, state_size))[:, :res, :].flatten()
+        data = cast_trajectory_data(data, self._script.storage_dtype)
+        
+        return RDTrajectoryEnsemble(
+            data = self._convert_data(data), 
+            t_sample = UnitArray(t_sampled[:res], Units(sys=self._units_system, dim=time_units_dimensions()), check_value=False).convert(self._script.units_system), 
+            system = self._script.system,
+            script = self._script,
+            engine_description = self.description, 
+            engine_option = self.option,
+            parameters = parameters
+            )
+        
+    def checkpoint(self, path) :
+        
+        # the checkpoint is written in a temporary file first, so that an interruption
+        # while writing does not corrupt a previous checkpoint.
+        path = str(path)
+        tmp_path = path + ".tmp"
+        res = self._lib.engineexport_save_checkpoint(ctypes.c_char_p(tmp_path.encode()))
+        if res != 0 :
+            raise IOError("cannot write the checkpoint file \""+path+"\".")
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path) :
+        
+        path = str(path)
+        res = self._lib.engineexport_load_checkpoint(ctypes.c_char_p(path.encode()))
+        if res == 1 :
+            raise IOError("cannot read the checkpoint file \""+path+"\".")
+        elif res == 2 :
+            raise ValueError("the checkpoint file \""+path+"\" does not match the simulation.")
+        self._simulation_unfinished = int(not self._lib.engineexport_is_complete())
+    
     def _count_samples(self) :
         return self._lib.engineexport_get_nsamples()
 
@@ -413,27 +804,60 @@ class LibRDEngine(RDEngineBase) :
         n_sample = self._count_samples()
         data_len = n_sample*self._script.system.state_size()
         
-        data_ = (data_len*ctypes.c_double)()
-        self._lib.engineexport_get_trajectory(data_)
-        data = np.zeros(data_len)
-        for i in range(data_len):
-            data[i] = data_[i]
-            
-        return UnitArray(value=data, 
+        # the engine directly writes the samples with the storage data type
+        data = np.zeros(data_len, dtype=self._script.storage_dtype)
+        self._lib.engineexport_get_trajectory(data.ctypes.data_as(ctypes.c_void_p))
+        if self._lib.engineexport_get_storage_overflow() :
+            raise OverflowError("a sampled value cannot be represented with the storage data type \""+self._script.storage_dtype+"\".")
+        
+        return self._convert_data(data)
+    
+    def _convert_data(self, data) :
+        
+        if self._units_system.quantity == self._script.units_system.quantity :
+            return UnitArray(value=data, 
+                             units=Units(
+                                 sys=self._script.units_system,
+                                 dim=quantity_units_dimensions()),
+                             check_value=False,
+                             dtype=data.dtype
+                             )
+        
+        data = UnitArray(value=data, 
                          units=Units(
                              sys=self._units_system ,
                              dim=quantity_units_dimensions()),
                          check_value=False
                          ).convert(self._script.units_system)
+        
+        if self._script.storage_dtype == "float32" :
+            data = UnitArray(value=cast_trajectory_data(data.value, "float32"), units=data.units, check_value=False, dtype="float32")
+            
+        return data
+    
+    def get_shared_state_key(self) :
+        
+        # the engine state is held by the library, hence shared by all the engines loading it.
+        return ("lib", self._lib._handle)
+    
+    def _get_stop_condition(self) :
+        t = ctypes.c_double(0)
+        index = self._lib.engineexport_get_stop_condition(ctypes.byref(t))
+        if index < 0 :
+            return None, None
+        return index, UnitValue(t.value, Units(sys=self._units_system, dim=time_units_dimensions())).convert(self._script.units_system)
     
     def get_output(self) :
+        stop_condition, t_stop = self._get_stop_condition()
         return RDTrajectory(
             data = self._get_data(), 
             t_sample = self._get_t_sample(), 
             system = self._script.system,
             script = self._script,
             engine_description = self.description, 
-            engine_option = self.option
+            engine_option = self.option,
+            stop_condition = stop_condition,
+            t_stop = t_stop
             )
         
     def finalize(self) :
@@ -1,24 +1,71 @@
-import copy
 import numpy as np
-from scipy.integrate import LSODA
+import scipy.sparse
 from strengths.rdspace import RDGridSpace, RDGraphSpace
-from strengths.value_processing import get_value_in_env
-from strengths.coarsegrain import grid_to_graph
+from strengths.librdengine import (
+    build_reaction_rate_constant_matrix, 
+    build_substrate_stoechiometric_matrix, 
+    build_stoechiometric_difference_matrix, 
+    build_diff_coef_environment_matrix
+    )
 from strengths.units import *
 
-def _get_diffusion_edges(system):
-    graph = None
-    if type(system.space)==RDGridSpace:
-        graph = grid_to_graph(system.space)
+def _space_unitvalues_to_array(values, dim, units_system):
+    # converts a list of UnitValues with the (space only) units dimensions dim to units_system,
+    # the conversion factor being computed once per space units.
+    factors = {}
+    for v in values:
+        space_units = v.units.sys.space
+        if space_units not in factors:
+            factors[space_units] = compute_conversion_factor(v.units.sys, units_system, dim)
+    if len(factors) == 1:
+        return np.array([v.value for v in values], dtype=float)*factors[space_units]
+    return np.array([v.value*factors[v.units.sys.space] for v in values], dtype=float)
+
+def _get_space_arrays(space, units_system):
+    """
+    Returns the cell volumes, the cell environment indices, and the edges 
+    (first node indices, second node indices, surfaces and distances, 
+    the last two being None for grid spaces) of space.
+    Grid spaces edges are those of the equivalent graph (see coarsegrain.grid_to_graph).
+    """
+    
+    L = space.size()
+    if type(space) == RDGridSpace:
+        vol = np.full(L, space.cell_vol.convert(units_system).value)
+        env = np.array(space.cell_env, dtype=int)
+        w, h, d = space.w, space.h, space.d
+        index = np.arange(L).reshape((d, h, w)) # index[z, y, x] = x + w*y + w*h*z
+        bc = space.get_boundary_conditions()
+        pairs = [
+            (index[:, :, :-1], index[:, :, 1:]),
+            (index[:, :-1, :], index[:, 1:, :]),
+            (index[:-1, :, :], index[1:, :, :])
+            ]
+        if bc["x"] == "periodical":
+            pairs.append((index[:, :, -1], index[:, :, 0]))
+        if bc["y"] == "periodical":
+            pairs.append((index[:, -1, :], index[:, 0, :]))
+        if bc["z"] == "periodical":
+            pairs.append((index[-1, :, :], index[0, :, :]))
+        edge_i = np.concatenate([i.flatten() for i, j in pairs])
+        edge_j = np.concatenate([j.flatten() for i, j in pairs])
+        return vol, env, edge_i, edge_j, None, None
+    elif type(space) == RDGraphSpace:
+        vol = _space_unitvalues_to_array([node.volume for node in space.nodes], volume_units_dimensions(), units_system)
+        env = np.array([node.environment for node in space.nodes], dtype=int)
+        edge_i = np.array([edge.i for edge in space.edges], dtype=int)
+        edge_j = np.array([edge.j for edge in space.edges], dtype=int)
+        sfc = _space_unitvalues_to_array([edge.surface for edge in space.edges], surface_units_dimensions(), units_system)
+        dst = _space_unitvalues_to_array([edge.distance for edge in space.edges], space_units_dimensions(), units_system)
+        return vol, env, edge_i, edge_j, sfc, dst
     else:
-        graph = system.space
-    return copy.deepcopy(graph.edges)
+        raise TypeError("unsupported space type.")
 
-def _compute_kd(system, s, i, j, units_system):
+def _compute_kd(D, vol, env, edge_i, edge_j, sfc, dst):
     """
-    Compute diffusion rate constants from 
+    Compute diffusion rate constants [edge, species] from 
     node i to node j according to reference 1 
-    for grid spaces or with an extended method 
+    for grid spaces (sfc and dst are None) or with an extended method 
     based on this same reference for graph spaces.
     References:
     [1] Bernstein, D. (2005). Simulating mesoscopic 
@@ -26,101 +73,188 @@ def _compute_kd(system, s, i, j, units_system):
     Physical Review E, 71(4), Article 041103. 
     https://doi.org/10.1103/PhysRevE.71.041103
     """
-    vi = system.space.get_cell_vol(i).convert(units_system).value
-    vj = system.space.get_cell_vol(j).convert(units_system).value
-    ei = system.network.environments[system.space.get_cell_env(i)]
-    ej = system.network.environments[system.space.get_cell_env(j)]
-    Di = get_value_in_env(system.network.species[s].D, ei, UnitValue("0 m2/s")).convert(units_system).value
-    Dj = get_value_in_env(system.network.species[s].D, ej, UnitValue("0 m2/s")).convert(units_system).value
+    vi = vol[edge_i][:, np.newaxis]
+    vj = vol[edge_j][:, np.newaxis]
+    Di = D[:, env[edge_i]].T
+    Dj = D[:, env[edge_j]].T
     li = vi**(1./3.)
     lj = vj**(1./3.)
     
-    if Di == 0 or Dj == 0:
-        return 0.
-    
-    Dij = (li+lj)/((li/Di)+(lj/Dj))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Dij = np.where((Di == 0) | (Dj == 0), 0., (li+lj)/((li/Di)+(lj/Dj)))
     
-    if type(system.space) == RDGridSpace:
+    if sfc is None:
         return Dij/(li**2)
     else:
-        edge = system.space.get_edge(i, j)
-        sij = edge.surface.convert(units_system).value
-        dij = edge.distance.convert(units_system).value
-        return Dij*sij/(vi*dij)
+        return Dij*sfc[:, np.newaxis]/(vi*dst[:, np.newaxis])
     
-def build_ode_function(system, units_system):
+def build_ode_function(system, units_system, jacobian=False):
     """
     returns an ODE function with the argument format 
-    expected by SciPy's integration functions and classes
+    expected by SciPy's integration functions and classes.
+    If jacobian is True, returns the tuple (ode_function, jac, jac_sparsity), 
+    where jac(t, x) returns the analytic Jacobian of ode_function as a 
+    scipy.sparse CSR matrix, and jac_sparsity is its sparsity structure 
+    (the rows of chemostats are zero).
     """
     
-    # diffusion edges
-    edges = _get_diffusion_edges(system)
+    species = system.network.species
+    environments = system.network.environments
+    reactions = [r.split() for r in system.network.reactions]
+    reactions_fwd = [r[0] for r in reactions]
+    reactions_rev = [r[1] for r in reactions]
+    
+    # space arrays
+    vol, env, edges_i, edges_j, sfc, dst = _get_space_arrays(system.space, units_system)
     
     # dimensions
     L = system.space.size()
-    N = len(system.network.species)
-    M = len(system.network.reactions)
-    O = len(edges)
+    N = len(species)
+    M = len(reactions)
+    E = len(environments)
     
-    # reaction rate constants 
+    # reaction rate constants [node, reaction]
     # accounting for node environment and volume
-    k_fwd = np.zeros(L*M)
-    k_rev = np.zeros(L*M)
-    for i in range(L):
-        for j in range(M):
-            r = system.network.reactions[j]
-            v = system.space.get_cell_vol(i).convert(units_system).value
-            e = system.network.environments[system.space.get_cell_env(i)]
-            k_fwd[i*M+j] = get_value_in_env(r.kf, e, UnitValue(0, Units(units_system, r.kf_units_dimensions()))).convert(units_system).value * v**(1-r.order())
-            k_rev[i*M+j] = get_value_in_env(r.kr, e, UnitValue(0, Units(units_system, r.kr_units_dimensions()))).convert(units_system).value * v**(1-r.rorder())
-    
-    # diffusion edges    
-    kd_fwd = np.zeros(O*N)
-    kd_rev = np.zeros(O*N)
-    for i in range(O):
-        for s in range(N):
-            kd_fwd[i*N+s] = _compute_kd(system, s, edges[i].i, edges[i].j, units_system)
-            kd_rev[i*N+s] = _compute_kd(system, s, edges[i].j, edges[i].i, units_system)
+    order_fwd = np.array([r.order() for r in reactions_fwd], dtype=float)
+    order_rev = np.array([r.order() for r in reactions_rev], dtype=float)
+    kf_env = np.array(build_reaction_rate_constant_matrix(reactions_fwd, environments, units_system), dtype=float).reshape((E, M))
+    kr_env = np.array(build_reaction_rate_constant_matrix(reactions_rev, environments, units_system), dtype=float).reshape((E, M))
+    k_fwd = (kf_env[env] * vol[:, np.newaxis]**(1-order_fwd)).flatten()
+    k_rev = (kr_env[env] * vol[:, np.newaxis]**(1-order_rev)).flatten()
+    
+    # diffusion rate constants [edge, species]
+    D = np.array(build_diff_coef_environment_matrix(species, environments, units_system), dtype=float).reshape((N, E))
+    kd_fwd = _compute_kd(D, vol, env, edges_i, edges_j, sfc, dst).flatten()
+    kd_rev = _compute_kd(D, vol, env, edges_j, edges_i, sfc, dst).flatten()
             
-    # stoichiometry
-    ssto = [r.ssto(system.network.species_labels()) for r in system.network.reactions]
-    psto = [r.psto(system.network.species_labels()) for r in system.network.reactions]
-    dsto = [r.dsto(system.network.species_labels()) for r in system.network.reactions]
+    # stoichiometry [reaction, species]
+    ssto = build_substrate_stoechiometric_matrix(species, reactions_fwd).reshape((N, M)).T
+    psto = build_substrate_stoechiometric_matrix(species, reactions_rev).reshape((N, M)).T
+    dsto = build_stoechiometric_difference_matrix(species, reactions_fwd).reshape((N, M)).T
     
     # chemostats
     chstts = 1-system.chemostats
     
+    # reactant and product terms (reaction, species, exponent),
+    # in the species order used by the reference loops for identical rounding
+    fwd_terms = [(j, s, ssto[j][s]) for j in range(M) for s in range(N) if ssto[j][s] != 0]
+    rev_terms = [(j, s, psto[j][s]) for j in range(M) for s in range(N) if psto[j][s] != 0]
+    
+    # net stoichiometry matrix [species, reaction]
+    stoichiometry = scipy.sparse.csr_matrix(np.array(dsto, dtype=float).reshape((M, N)).T)
+    
+    # diffusion operator acting on the species first state : 
+    # each edge flux -kd_fwd*x_i + kd_rev*x_j is added to node i and subtracted from node j.
+    offsets = (np.arange(N)*L)[np.newaxis, :] # [edge, species]
+    rows_i = (edges_i[:, np.newaxis] + offsets).flatten()
+    rows_j = (edges_j[:, np.newaxis] + offsets).flatten()
+    diffusion = scipy.sparse.coo_matrix(
+        (
+            np.concatenate([-kd_fwd, kd_rev, kd_fwd, -kd_rev]),
+            (np.concatenate([rows_i, rows_i, rows_j, rows_j]), np.concatenate([rows_i, rows_j, rows_i, rows_j]))
+        ),
+        shape=(L*N, L*N)
+        ).tocsr()
+    
+    # rate constants [reaction, node]
+    k_fwd = np.ascontiguousarray(k_fwd.reshape((L, M)).T)
+    k_rev = np.ascontiguousarray(k_rev.reshape((L, M)).T)
+    
+    # scratch buffers
+    rates_fwd = np.empty((M, L))
+    rates_rev = np.empty((M, L))
+    power = np.empty(L)
+    
     def ode_function(t, x): # x is the state
-        dxdt = np.zeros(L*N) # output = state time derivative
-        rates = np.zeros(L*M)
-        d_rates = np.zeros(O*N)
+        x = np.asarray(x, dtype=float)
+        X = x.reshape((N, L))
         
         # compute reaction rates
-        for i in range(L):
-            for j in range(M):
-                rate_fwd = k_fwd[i*M+j]
-                rate_rev = k_rev[i*M+j]
-                for s in range(N):
-                    rate_fwd *= x[s*L+i]**ssto[j][s]
-                    rate_rev *= x[s*L+i]**psto[j][s]
-                rates[i*M+j] = rate_fwd - rate_rev
-        
-        for i in range(O):
-            for s in range(N):
-                d_rates[i*N+s] = -kd_fwd[i*N+s]*x[s*L+edges[i].i] + kd_rev[i*N+s]*x[s*L+edges[i].j]
+        np.copyto(rates_fwd, k_fwd)
+        np.copyto(rates_rev, k_rev)
+        for j, s, p in fwd_terms:
+            if p == 1:
+                rates_fwd[j] *= X[s]
+            else:
+                np.power(X[s], p, out=power)
+                rates_fwd[j] *= power
+        for j, s, p in rev_terms:
+            if p == 1:
+                rates_rev[j] *= X[s]
+            else:
+                np.power(X[s], p, out=power)
+                rates_rev[j] *= power
+        np.subtract(rates_fwd, rates_rev, out=rates_fwd)
         
-        # compute dxdt
-        for i in range(L):
-            for j in range(M):
-                for s in range(N):
-                    dxdt[s*L+i] += rates[i*M+j]*dsto[j][s]*chstts[s*L+i]
-
-        for i in range(O):
-            for s in range(N):
-                dxdt[s*L+edges[i].i] += d_rates[i*N+s]*chstts[s*L+edges[i].i]
-                dxdt[s*L+edges[i].j] -= d_rates[i*N+s]*chstts[s*L+edges[i].j]
+        # compute dxdt (output = state time derivative)
+        dxdt = diffusion @ x
+        dxdt += (stoichiometry @ rates_fwd).reshape(L*N)
+        dxdt *= chstts
         
         return dxdt
-                
-    return ode_function
+    
+    if not jacobian:
+        return ode_function
+    
+    # Jacobian structure : for each reaction j and each species s it depends on, 
+    # d(rate_j)/dx_s is computed on all nodes and contributes to the species
+    # s2 for which dsto[j][s2] != 0, on the same node.
+    fwd_factors = [[(s, p) for j2, s, p in fwd_terms if j2 == j] for j in range(M)]
+    rev_factors = [[(s, p) for j2, s, p in rev_terms if j2 == j] for j in range(M)]
+    nodes = np.arange(L)
+    jac_terms = [] # (reaction, species, [(s2, dsto[j][s2]), ...])
+    jac_rows = [np.zeros(0, dtype=int)]
+    jac_cols = [np.zeros(0, dtype=int)]
+    for j in range(M):
+        for s in range(N):
+            if ssto[j][s] == 0 and psto[j][s] == 0:
+                continue
+            targets = [(s2, dsto[j][s2]) for s2 in range(N) if dsto[j][s2] != 0]
+            jac_terms.append((j, s, targets))
+            for s2, sto in targets:
+                jac_rows.append(s2*L+nodes)
+                jac_cols.append(s*L+nodes)
+    jac_rows = np.concatenate(jac_rows)
+    jac_cols = np.concatenate(jac_cols)
+    jac_chstts = np.asarray(chstts, dtype=float)[jac_rows]
+    
+    # diffusion part, constant, with the rows of chemostats zeroed
+    diffusion_jac = (scipy.sparse.diags(np.asarray(chstts, dtype=float)) @ diffusion).tocoo()
+    rows = np.concatenate([diffusion_jac.row, jac_rows])
+    cols = np.concatenate([diffusion_jac.col, jac_cols])
+    jac_data = np.empty(len(jac_rows))
+    
+    def rate_derivative(k, factors, X, s):
+        # derivative of k*prod(X[s2]**p) with respect to X[s], on all nodes
+        d = k.copy()
+        found = False
+        for s2, p in factors:
+            if s2 == s:
+                found = True
+                if p != 1:
+                    d *= p*X[s2]**(p-1)
+            else:
+                d *= X[s2] if p == 1 else X[s2]**p
+        return d if found else np.zeros(L)
+    
+    def jac(t, x):
+        X = np.asarray(x, dtype=float).reshape((N, L))
+        n = 0
+        for j, s, targets in jac_terms:
+            d = rate_derivative(k_fwd[j], fwd_factors[j], X, s) - rate_derivative(k_rev[j], rev_factors[j], X, s)
+            for s2, sto in targets:
+                jac_data[n:n+L] = sto*d
+                n += L
+        return scipy.sparse.coo_matrix(
+            (np.concatenate([diffusion_jac.data, jac_data*jac_chstts]), (rows, cols)),
+            shape=(L*N, L*N)
+            ).tocsr()
+    
+    jac_sparsity = scipy.sparse.coo_matrix(
+        (np.concatenate([diffusion_jac.data != 0, jac_chstts != 0]).astype(float), (rows, cols)),
+        shape=(L*N, L*N)
+        ).tocsr()
+    jac_sparsity.eliminate_zeros()
+    jac_sparsity.data[:] = 1
+    
+    return ode_function, jac, jac_sparsity
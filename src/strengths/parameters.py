@@ -0,0 +1,83 @@
+from strengths.units import *
+from strengths.rdsystem import RDSystem, generate_species_state
+from strengths.typechecking import *
+
+"""
+Module that contains the functions used to apply parameter values to reaction-diffusion systems, as done in parameter scans.
+"""
+
+def _split_parameter_name(name) :
+    if not isstr(name) :
+        raise TypeError("parameter names must be strings.")
+    if ":" in name :
+        kind, target = name.split(":", 1)
+        return kind.strip(), target.strip()
+    return name.strip(), None
+
+def _get_target_index(target, get_index, kind) :
+    index = get_index(int(target) if target.isdigit() else target)
+    if isnone(index) :
+        raise ValueError("undefined target \""+target+"\" for the parameter \""+kind+"\".")
+    return index
+
+def apply_parameters(system, parameters) :
+    """
+    Returns a copy of a reaction-diffusion system to which some parameter values are applied.
+    The parameters are given as a dict, which keys can be :
+    
+    * "kf:<reaction>" : forward rate constant of a reaction, given by its label or index (see Reaction.kf).
+    * "kr:<reaction>" : reverse rate constant of a reaction, given by its label or index (see Reaction.kr).
+    * "D:<species>" : diffusion coefficient of a species, given by its label or index (see Species.D).
+    * "density:<species>" : density of a species (see Species.density). The state of the species is regenerated from it.
+    * "state" : state of the system (see RDSystem.state).
+    
+    ie.
+    
+    .. code:: python
+    
+        apply_parameters(system, {"kf:0" : 2, "D:A" : {"env1" : 0.5, "env2" : 1}, "density:B" : "1 µM"})
+    
+    :param system: system to which the parameters are applied. it is left unchanged.
+    :type system: RDSystem
+    :param parameters: parameter values.
+    :type parameters: dict
+    :returns: system with the parameter values applied.
+    :rtype: RDSystem
+    """
+    
+    if not isdict(parameters) :
+        raise TypeError("parameters must be a dict.")
+    
+    system = system.copy()
+    network = system.network
+    
+    for name in parameters :
+        kind, target = _split_parameter_name(name)
+        value = parameters[name]
+        
+        if kind == "state" and isnone(target) :
+            system.state = value
+            if len(system.state) != system.state_size() :
+                raise ValueError("the state size does not match the system.")
+        elif kind in ["kf", "kr"] and not isnone(target) :
+            reaction = network.reactions[_get_target_index(target, network.get_reaction_index, kind)]
+            if kind == "kf" :
+                reaction.kf = value
+            else :
+                reaction.kr = value
+        elif kind in ["D", "density"] and not isnone(target) :
+            s = _get_target_index(target, network.get_species_index, kind)
+            species = network.species[s]
+            if kind == "D" :
+                species.D = value
+            else :
+                species.density = value
+                species_state = generate_species_state(species, network, system.space, system.state.units.sys).value
+                state = system.state.value.copy()
+                n = system.space.size()
+                state[s*n:(s+1)*n] = species_state
+                system.state = UnitArray(state, system.state.units, check_value=False)
+        else :
+            raise ValueError("unknown parameter \""+name+"\".")
+    
+    return system
@@ -85,6 +85,34 @@ class RDEngineBase :
         
         raise NotImplementedError("")
 
+    def cancel(self) :
+        """
+        Requests the current or next run call to stop as soon as possible (see is_interrupted).
+        Can be called from another thread. The request holds until the simulation is set up or reset again.
+        """
+        
+        raise NotImplementedError("cancellation is not supported by this engine.")
+    
+    def set_wall_time_limit(self, limit) :
+        """
+        Sets a wall clock deadline *limit* seconds from now, after which run calls stop (see is_interrupted).
+        
+        :param limit: time limit in seconds, or None to remove the deadline.
+        :type limit: number or None
+        """
+        
+        raise NotImplementedError("wall time limits are not supported by this engine.")
+    
+    def is_interrupted(self) :
+        """
+        Returns True if the last run call was stopped by a cancellation (see cancel) or by
+        the wall time limit (see set_wall_time_limit) before the simulation was complete.
+        
+        :rtype: bool
+        """
+        
+        return False
+    
     def get_progress(self) :
         """
         Returns the percentage of simulation progress.
@@ -95,6 +123,34 @@ class RDEngineBase :
         
         raise NotImplementedError("")
 
+    def get_time(self) :
+        """
+        Returns the current simulation time.
+        
+        :rtype: UnitValue
+        """
+        
+        raise NotImplementedError("")
+    
+    def get_samples(self, first=0) :
+        """
+        Returns the samples gathered so far, from the sample of index *first*.
+        Can be called between two run calls, to read the samples while the simulation is running.
+        
+        :param first: index of the first sample to be returned.
+        :type first: int
+        :returns: sampling times, and sampled states [sample index, species index, cell index]
+            (with the same layout and data type as RDTrajectory.data).
+        :rtype: tuple of UnitArray
+        """
+        
+        output = self.get_output()
+        size = output.system.state_size()
+        return (
+            UnitArray(output.t.value[first:], output.t.units, check_value=False),
+            UnitArray(output.data.value[first*size:], output.data.units, check_value=False, dtype=output.data.value.dtype)
+            )
+    
     def sample(self) :
         """
         sample the current system state.
@@ -112,6 +168,87 @@ class RDEngineBase :
         
         raise NotImplementedError("")
     
+    def reset(self, rng_seed=None, state=None) :
+        """
+        Resets the simulation to its initial conditions, so that it can be run again
+        without going through setup. The system topology and the rate tables are kept,
+        the samples gathered so far are discarded.
+        Should be called after setup and before finalize.
+
+        :param rng_seed: seed of the random number generator for the new run.
+            if None, the seed of the script is used.
+        :type rng_seed: int or None
+        :param state: new initial state of the system (see RDSystem.state).
+            if None, the initial state of the script is used.
+        :type state: UnitArray, array or None
+        """
+        
+        raise NotImplementedError("")
+
+    def run_ensemble(self, seeds, n_threads=None) :
+        """
+        Runs independent replicates of the simulation, from its initial conditions,
+        with one rng seed per replicate. Requires the "on_t_sample" sampling policy.
+        Should be called after setup and before finalize.
+
+        :param seeds: rng seed of each replicate.
+        :type seeds: list of int
+        :param n_threads: number of threads used to run the replicates.
+            if None, the number of hardware threads is used.
+        :type n_threads: int or None
+        :rtype: RDTrajectoryEnsemble
+        """
+        
+        raise NotImplementedError("")
+
+    def run_batch(self, parameters) :
+        """
+        Integrates several parameter sets of the simulation in lockstep.
+        Each parameter set is applied to the system of the simulation (see apply_parameters),
+        and may change rate constants, diffusion coefficients and initial states.
+        Requires the "on_t_sample" sampling policy.
+        Should be called after setup and before finalize.
+
+        :param parameters: parameter sets.
+        :type parameters: list of dict
+        :rtype: RDTrajectoryEnsemble
+        """
+        
+        raise NotImplementedError("")
+
+    def checkpoint(self, path) :
+        """
+        Saves the current state of the simulation (system state, time, sampling state,
+        random number generator state and samples gathered so far) in a checkpoint file.
+        Should be called after setup and before finalize.
+
+        :param path: path of the checkpoint file.
+        :type path: str
+        """
+        
+        raise NotImplementedError("checkpoints are not supported by this engine.")
+
+    def load_checkpoint(self, path) :
+        """
+        Restores the state of the simulation from a checkpoint file written by checkpoint.
+        Should be called right after setup, with the script used for the checkpointed simulation.
+        The simulation then continues exactly as if it had never been interrupted.
+
+        :param path: path of the checkpoint file.
+        :type path: str
+        """
+        
+        raise NotImplementedError("checkpoints are not supported by this engine.")
+    
+    def get_shared_state_key(self) :
+        """
+        Returns a key identifying a simulation state shared by several engine instances
+        (ie. the state of a shared library), or None if the engine instance has its own state.
+        Engines returning the same key cannot run simulations concurrently.
+        """
+        
+        return None
+    
     def get_output(self) :
         """
         Returns the system trajectory data array.
@@ -2,6 +2,7 @@ from strengths.units import *
 from strengths.rdsystem import RDSystem, rdsystem_from_dict, rdsystem_to_dict
 from strengths.rdscript import RDScript, rdscript_from_dict, rdscript_to_dict
 from strengths.rdspace import RDGridSpace, RDGraphSpace
+from strengths.parameters import apply_parameters
 from strengths.typechecking import *
 
 import json
@@ -12,7 +13,8 @@ class RDTrajectory :
     """
     Trajectory of a reaction-diffusion system.
 
-    :param data: trajectory data [sample index, species index, cell index]
+    :param data: trajectory data [sample index, species index, cell index].
+        its values keep their data type (see RDScript.storage_dtype).
     :type data: UnitArray with quantity units dimensions
     :param t_sample: system time associated with each sample of the trajectory
     :type t_sample: UnitArray with time units dimensions
@@ -28,6 +30,12 @@ class RDTrajectory :
     :param cg_map: coarse graining index map or None. if not None, it means
         that the data results from an uncoarsegraining operation, with cgmap.
     :type cg_map: array of int or None
+    :param stop_condition: index of the stop condition (see RDScript.stop_conditions) that ended the simulation, if any.
+    :type stop_condition: int or None
+    :param t_stop: time at which the stop condition was met, if any.
+    :type t_stop: UnitValue with time units dimensions or None
+    :param diagnostics: solver diagnostics provided by the engine, if any (see SteadyStateEngine).
+    :type diagnostics: dict or None
     """
 
     def __init__ (self, 
@@ -38,7 +46,10 @@ class RDTrajectory :
                   script = None, 
                   engine_description = None, 
                   engine_option = None,
-                  cgmap = None
+                  cgmap = None,
+                  stop_condition = None,
+                  t_stop = None,
+                  diagnostics = None
                   ):
         """
         constructor
@@ -55,6 +66,9 @@ class RDTrajectory :
         self._engine_description = engine_description
         self._engine_option = engine_option
         self._cgmap = cgmap
+        self._stop_condition = stop_condition
+        self._t_stop = None if t_stop is None else t_stop.copy()
+        self._diagnostics = None if diagnostics is None else dict(diagnostics)
 
     @property
     def t(self) :
@@ -112,6 +126,31 @@ class RDTrajectory :
         
         return self._cgmap
     
+    @property
+    def stop_condition(self) :
+        """
+        Index of the stop condition (see RDScript.stop_conditions) that ended the simulation,
+        or None if the simulation was not ended by a stop condition.
+        """
+        
+        return self._stop_condition
+    
+    @property
+    def t_stop(self) :
+        """
+        Time at which the stop condition that ended the simulation was met, or None.
+        """
+        
+        return self._t_stop
+    
+    @property
+    def diagnostics(self) :
+        """
+        Solver diagnostics provided by the engine (see SteadyStateEngine), or None.
+        """
+        
+        return self._diagnostics
+    
     def ncells(self):
         """
         Returns the number of species.
@@ -282,6 +321,301 @@ class RDTrajectory :
         if policy=="infeq"   : return self._get_sample_index_infeq(t)
         if policy=="supeq"   : return self._get_sample_index_supeq(t)
         
+class RDTrajectoryEnsemble :
+    """
+    Trajectories of several replicates of the simulation of a reaction-diffusion system,
+    sampled at the same time points. The replicates may differ by their rng seed
+    or by their parameter values.
+
+    :param data: trajectories data [replicate index, sample index, species index, cell index].
+    :type data: UnitArray with quantity units dimensions
+    :param t_sample: time points at which the replicates are sampled.
+    :type t_sample: UnitArray with time units dimensions
+    :param system: reaction diffusion system associated with the trajectories
+    :type system: RDSystem
+    :param seeds: rng seed of each replicate, or None if they share the seed of the script.
+    :type seeds: list of int or None
+
+    :param script: simulation script associated with the trajectories.
+    :type script: RDScript ot None
+    :param engine_description: description of the engine used for the simulation.
+    :type engine_description: str or None
+    :param engine_option: option used with the engine used for the simulation.
+    :type engine_option: str or None
+    :param parameters: parameter values applied to system for each replicate (see apply_parameters),
+        or None if they share the parameters of system.
+    :type parameters: list of dict or None
+    """
+
+    def __init__ (self, 
+                  data, 
+                  t_sample, 
+                  system,
+                  seeds = None,
+                  
+                  script = None, 
+                  engine_description = None, 
+                  engine_option = None,
+                  parameters = None
+                  ):
+        """
+        constructor
+        """
+        self._data = data.copy()
+        self._t = t_sample.copy()
+        self._system = system.copy()
+        self._seeds = None if isnone(seeds) else [int(seed) for seed in seeds]
+        self._parameters = None if isnone(parameters) else [dict(p) for p in parameters]
+        
+        if isnone(script) :
+            self._script = None
+        else :            
+            self._script = script.copy()
+            
+        self._engine_description = engine_description
+        self._engine_option = engine_option
+
+    @property
+    def t(self) :
+        """
+        sampling time points.
+        """
+
+        return self._t
+
+    @property
+    def data(self) :
+        """
+        array of the sampled system states of each replicate.
+        """
+
+        return self._data
+
+    @property
+    def system(self) :
+        """
+        reaction diffusion system.
+        """
+
+        return self._system
+    
+    @property
+    def script(self) :
+        """
+        reaction diffusion simulation script.
+        """
+
+        return self._script
+
+    @property
+    def seeds(self) :
+        """
+        rng seed of each replicate (None if they share the seed of the script).
+        """
+
+        return self._seeds
+
+    @property
+    def parameters(self) :
+        """
+        parameter values applied to the system for each replicate (None if they share the parameters of the system).
+        """
+
+        return self._parameters
+
+    @property
+    def engine_description(self) :
+        """
+        Description of the engine used for the simulation.
+        """
+        
+        return self._engine_description
+
+    @property
+    def engine_option(self) :
+        """
+        Option used for the engine used for the simulation.
+        """
+        
+        return self._engine_option
+    
+    def nreplicates(self) :
+        """
+        Returns the number of replicates.
+        """
+
+        return len(self.data) // (self.nsamples()*self.nspecies()*self.ncells())
+    
+    def ncells(self):
+        """
+        Returns the number of cells.
+        """
+
+        return self.system.space.size()
+
+    def nspecies(self) :
+        """
+        Returns the number of species.
+        """
+
+        return self.system.network.nspecies()
+
+    def nsamples(self) :
+        """
+        Returns the number of samples.
+        """
+
+        return len(self.t)
+
+    def get_array(self) :
+        """
+        Returns the trajectories data as an array of shape (replicates, samples, species, cells).
+
+        :rtype: numpy.ndarray
+        """
+        
+        return self.data.value.reshape((self.nreplicates(), self.nsamples(), self.nspecies(), self.ncells()))
+
+    def get_replicate(self, replicate) :
+        """
+        Returns the trajectory of a given replicate.
+
+        :param replicate: replicate index
+        :type replicate: int
+        :rtype: RDTrajectory
+        """
+        
+        system = self.system
+        if not isnone(self.parameters) :
+            system = apply_parameters(system, self.parameters[replicate])
+        
+        script = self.script
+        if not isnone(script) :
+            script = script.copy()
+            script.system = system
+            if not isnone(self.seeds) :
+                script.rng_seed = self.seeds[replicate]
+        
+        return RDTrajectory(
+            data = UnitArray(self.get_array()[replicate].flatten(), self.data.units, check_value=False, dtype=self.data.value.dtype),
+            t_sample = self.t,
+            system = system,
+            script = script,
+            engine_description = self.engine_description,
+            engine_option = self.engine_option
+            )
+
+    def __len__(self) :
+        return self.nreplicates()
+
+    def __getitem__(self, replicate) :
+        return self.get_replicate(replicate)
+
+def cast_trajectory_data(value, dtype) :
+    """
+    Returns a copy of the array value with the storage data type dtype (see RDScript.storage_dtype).
+    For integer data types, values are rounded to the nearest integer.
+    An OverflowError is raised if a value cannot be represented with dtype.
+
+    :param value: trajectory data values.
+    :type value: array of numbers
+    :param dtype: storage data type ("float64", "float32", "uint16", "uint32" or "int32").
+    :type dtype: str
+    :rtype: numpy.ndarray
+    """
+    
+    value = np.asarray(value)
+    dtype = np.dtype(dtype)
+    
+    if np.issubdtype(dtype, np.integer) :
+        if not np.issubdtype(value.dtype, np.integer) :
+            value = np.floor(value + 0.5)
+        info = np.iinfo(dtype)
+        if not np.all((value >= info.min) & (value <= info.max)) :
+            raise OverflowError("a value cannot be represented with the data type \""+str(dtype)+"\".")
+    else :
+        info = np.finfo(dtype)
+        if np.any(np.isfinite(value) & (np.abs(value) > info.max)) :
+            raise OverflowError("a value cannot be represented with the data type \""+str(dtype)+"\".")
+    
+    return value.astype(dtype)
+
+def _rdtrajectory_to_dict(so, data) :
+    d = {
+        "script" : rdscript_to_dict(so.script),
+        "system" : rdsystem_to_dict(so.system),
+        "data" : data,
+        "data_dtype" : str(so.data.value.dtype),
+        "t_sample" : unitarray_to_dict(so.t),
+        "engine_description" : so.engine_description,
+        "engine_option" : so.engine_option
+        }
+    
+    if so.cgmap is not None :
+        d["cgmap"] = list(so.cgmap)
+    
+    if so.stop_condition is not None :
+        d["stop_condition"] = so.stop_condition
+        d["t_stop"] = str(so.t_stop)
+    
+    if so.diagnostics is not None :
+        d["diagnostics"] = dict(so.diagnostics)
+    
+    return d
+
+def rdtrajectory_to_dict(so) :
+    """
+    Converts a trajectory to a dictionary, in the format used by save_rdtrajectory,
+    with the trajectory data included in the dictionary.
+
+    :param so: trajectory to be converted.
+    :type so: RDTrajectory
+    :rtype: dict
+    """
+    
+    if type(so) != RDTrajectory :
+        raise TypeError("so must be a RDTrajectory.")
+    
+    return _rdtrajectory_to_dict(so, unitarray_to_dict(so.data))
+
+def rdtrajectory_from_dict(d, base_path=None) :
+    """
+    Creates a trajectory from a dictionary (see rdtrajectory_to_dict and save_rdtrajectory).
+
+    :param d: dictionary describing the trajectory.
+    :type d: dict
+    :param base_path: base path of the files the dictionary may refer to.
+    :type base_path: str or None
+    :rtype: RDTrajectory
+    """
+
+    script = rdscript_from_dict(d["script"], base_path=base_path)
+    system = rdsystem_from_dict(d["system"], base_path=base_path)
+    data = unitarray_from_dict(d["data"], base_path=base_path)
+    data_dtype = d.get("data_dtype", None)
+    if data_dtype is not None and data.value.dtype != np.dtype(data_dtype) :
+        # the data are loaded as float64 (see unitarray_from_dict)
+        data = UnitArray(cast_trajectory_data(data.value, data_dtype), data.units, check_value=False, dtype=data_dtype)
+    t_sample = unitarray_from_dict(d["t_sample"])
+    engine_description = d["engine_description"]
+    engine_option = d["engine_option"]
+    cgmap = d.get("cgmap", None)
+    stop_condition = d.get("stop_condition", None)
+    t_stop = None if stop_condition is None else UnitValue(d["t_stop"])
+        
+    return RDTrajectory(
+        data = data, 
+        t_sample = t_sample, 
+        system = system,
+        script = script,
+        engine_description = engine_description,
+        engine_option = engine_option,
+        cgmap = cgmap,
+        stop_condition = stop_condition,
+        t_stop = t_stop,
+        diagnostics = d.get("diagnostics", None)
+        )
+
 def save_rdtrajectory(so, path, separate_data=True) :
     """
     Saves a simulation output as a file.
@@ -295,7 +629,8 @@ def save_rdtrajectory(so, path, separate_data=True) :
         if true, the trajectory data are saved in a different file using the numpy.save function [#numpy_save]_.
         This makes the saving and loading faster, especially for large simulation outputs.
         if filename.json is the name of the json file,
-        the data are saved as filename_data.npy (NPY format [#numpy_npy]_).
+        the data are saved as filename_data.npy (NPY format [#numpy_npy]_),
+        with the data type of the trajectory data (see RDScript.storage_dtype).
     :type separate_data: bool
     """
     # references :
@@ -310,24 +645,11 @@ def save_rdtrajectory(so, path, separate_data=True) :
     data_path = filepath.remove_extension_if_existing(path, ".json") + "_data.npy"
 
 
-    d = {
-        "script" : rdscript_to_dict(so.script),
-        "system" : rdsystem_to_dict(so.system),
-        "data" : {"value" : filepath.get_last_element(data_path), "units" : str(so.data.units)},
-        "t_sample" : unitarray_to_dict(so.t),
-        "engine_description" : so.engine_description,
-        "engine_option" : so.engine_option
-        }
-    
-    if so.cgmap is not None :
-        d["cgmap"] = list(so.cgmap)
-    
     if separate_data :
-        d["data"] = {"value" : filepath.get_last_element(data_path), "units" : str(so.data.units)}
+        d = _rdtrajectory_to_dict(so, {"value" : filepath.get_last_element(data_path), "units" : str(so.data.units)})
         np.save(data_path, so.data.value)
-
     else :
-        d["data"] = unitarray_to_dict(so.data)
+        d = _rdtrajectory_to_dict(so, unitarray_to_dict(so.data))
         
     f = open(json_path, "w", encoding="utf-8")
     json.dump(d, f, indent = 4)
@@ -345,20 +667,4 @@ def load_rdtrajectory(path) :
     f = open(path, "r", encoding="utf-8")
     d = json.load(f)
 
-    script = rdscript_from_dict(d["script"], base_path=filepath.get_base_path(path))
-    system = rdsystem_from_dict(d["system"], base_path=filepath.get_base_path(path))
-    data = unitarray_from_dict(d["data"], base_path=filepath.get_base_path(path))
-    t_sample = unitarray_from_dict(d["t_sample"])
-    engine_description = d["engine_description"]
-    engine_option = d["engine_option"]
-    cgmap = d.get("cgmap", None)
-        
-    return RDTrajectory(
-        data = data, 
-        t_sample = t_sample, 
-        system = system,
-        script = script,
-        engine_description = engine_description,
-        engine_option = engine_option,
-        cgmap = cgmap
-        )
+    return rdtrajectory_from_dict(d, base_path=filepath.get_base_path(path))
@@ -13,11 +13,25 @@ class RDScript :
     Default values are : 
         
     * time_step : 1e-3,
+    * rtol : 1e-3,
+    * atol : 1e-6,
+    * multirate : None,
+    * local_time_stepping : False,
+    * hybrid_population_threshold : 100,
+    * hybrid_propensity_threshold : 10,
+    * hybrid_stochastic_region : None,
     * t_max : "default",
     * sampling_policy : "on_t_sample",
     * sampling_interval : 1,
+    * sampling_rtol : 0.01,
+    * sampling_atol : 0,
+    * sampling_max_gap : None,
+    * sampling_observables : None,
+    * stop_conditions : None,
+    * stop_check_interval : 1,
     * rng_seed : None,
     * init_state_processing : "auto",
+    * storage_dtype : "float64",
     * units_system : UnitsSystem()
     """
     
@@ -25,11 +39,25 @@ class RDScript :
                 system,
                 t_sample,
                 time_step = 1e-3,
+                rtol = 1e-3,
+                atol = 1e-6,
+                multirate = None,
+                local_time_stepping = False,
+                hybrid_population_threshold = 100,
+                hybrid_propensity_threshold = 10,
+                hybrid_stochastic_region = None,
                 t_max = "default",
                 sampling_policy = "on_t_sample",
                 sampling_interval = 1,
+                sampling_rtol = 0.01,
+                sampling_atol = 0,
+                sampling_max_gap = None,
+                sampling_observables = None,
+                stop_conditions = None,
+                stop_check_interval = 1,
                 rng_seed = None,
                 init_state_processing = "auto",
+                storage_dtype = "float64",
                 units_system = UnitsSystem()
                 ) :
         
@@ -37,11 +65,25 @@ class RDScript :
             self.system = system
             self.t_sample = t_sample
             self.time_step = time_step
+            self.rtol = rtol
+            self.atol = atol
+            self.multirate = multirate
+            self.local_time_stepping = local_time_stepping
+            self.hybrid_population_threshold = hybrid_population_threshold
+            self.hybrid_propensity_threshold = hybrid_propensity_threshold
+            self.hybrid_stochastic_region = hybrid_stochastic_region
             self.t_max = t_max
             self.sampling_policy = sampling_policy
             self.sampling_interval = sampling_interval
+            self.sampling_rtol = sampling_rtol
+            self.sampling_atol = sampling_atol
+            self.sampling_max_gap = sampling_max_gap
+            self.sampling_observables = sampling_observables
+            self.stop_conditions = stop_conditions
+            self.stop_check_interval = stop_check_interval
             self.rng_seed = rng_seed
             self.init_state_processing = init_state_processing
+            self.storage_dtype = storage_dtype
 
     @property
     def system(self) :
@@ -74,14 +116,174 @@ class RDScript :
     def time_step(self) :
         """
         Time step to be used, if necessary.
+        If "auto", the engines with a static time step choose it from the explicit stability bound
+        of the system at its initial state.
         """
         
         return self._time_step
 
     @time_step.setter
     def time_step(self, time_step) :        
-        self._time_step = UnitValue(time_step, Units(sys=self.units_system, dim=time_units_dimensions()), convert=False)
+        if isstr(time_step) and time_step == "auto" :
+            self._time_step = "auto"
+        else :
+            self._time_step = UnitValue(time_step, Units(sys=self.units_system, dim=time_units_dimensions()), convert=False)
+        
+    @property
+    def rtol(self) :
+        """
+        Relative tolerance on the local error, used by the engines with an adaptive time step (number).
+        """
+        
+        return self._rtol
+
+    @rtol.setter
+    def rtol(self, rtol) :
+        if not isnumber(rtol) :
+            raise TypeError("rtol must be a number.")
+        if rtol < 0 :
+            raise ValueError("rtol must be positive.")
+        self._rtol = float(rtol)
+
+    @property
+    def atol(self) :
+        """
+        Absolute tolerance (in quantity units) on the local error, used by the engines with an adaptive time step.
+        """
+        
+        return self._atol
+
+    @atol.setter
+    def atol(self, atol) :
+        atol = UnitValue(atol, Units(sys=self.units_system, dim=quantity_units_dimensions()), convert=False)
+        if atol.value < 0 :
+            raise ValueError("atol must be positive.")
+        self._atol = atol
+
+    @property
+    def multirate(self) :
+        """
+        Partition of the processes into slow ones, integrated with the time step, and fast ones,
+        sub-stepped, used by the Euler and tau leap engines :
+            
+        * None : (default) only the diffusion is sub-stepped, if the time step exceeds its stability bound
+          (a warning then gives the number of sub-steps).
+        * False : no process is sub-stepped, all of them being integrated with the time step.
+        * "auto" : the fast species are the ones of which the stability bound (accounting for their diffusion
+          and their consumption by the reactions) at the initial state is lower than the time step.
+        * array of species labels : the fast species.
+        
+        The diffusion of the fast species and the reactions changing their quantities are sub-stepped,
+        with the number of sub-steps for which they are integrated within their stability bound at the initial state.
+        """
+        
+        return self._multirate
+
+    @multirate.setter
+    def multirate(self, multirate) :
+        if multirate is None or multirate is False or (isstr(multirate) and multirate == "auto") :
+            self._multirate = multirate
+            return
+        if isstr(multirate) :
+            multirate = [multirate]
+        if not isarray(multirate) :
+            raise TypeError("multirate must be None, False, \"auto\" or an array of species labels.")
+        for label in multirate :
+            if self.system.network.get_species_index(label) is None :
+                raise ValueError("undefined species \""+str(label)+"\" in multirate.")
+        self._multirate = [str(label) for label in multirate]
+
+    @property
+    def local_time_stepping(self) :
+        """
+        If True, the Euler and tau leap engines integrate each node of a graph space with its own time step (bool).
+        The nodes are binned in levels, the nodes of level L being integrated with 2^L steps of time_step/2^L,
+        where L is the lowest level for which time_step/2^L is within the stability bound of the node at the initial state.
+        The diffusion along an edge is integrated at the finest level of its two nodes, and is applied to both of them at once,
+        so that the fluxes between levels are conservative.
+        This is useful for coarse grained spaces, of which the node volumes span several orders of magnitude.
+        The local time stepping is not available on grid spaces, and multirate is ignored when it is used.
+        """
+        
+        return self._local_time_stepping
+
+    @local_time_stepping.setter
+    def local_time_stepping(self, local_time_stepping) :
+        if type(local_time_stepping) != bool :
+            raise TypeError("local_time_stepping must be a bool.")
+        self._local_time_stepping = local_time_stepping
+
+    @property
+    def hybrid_population_threshold(self) :
+        """
+        Minimal quantity, in molecules, of the species changed by a reaction or diffusion channel
+        for this channel to be integrated deterministically by the hybrid engine (number).
+        """
+        
+        return self._hybrid_population_threshold
+
+    @hybrid_population_threshold.setter
+    def hybrid_population_threshold(self, hybrid_population_threshold) :
+        if not isnumber(hybrid_population_threshold) :
+            raise TypeError("hybrid_population_threshold must be a number.")
+        if hybrid_population_threshold < 0 :
+            raise ValueError("hybrid_population_threshold must be positive.")
+        self._hybrid_population_threshold = float(hybrid_population_threshold)
+
+    @property
+    def hybrid_propensity_threshold(self) :
+        """
+        Minimal expected number of events of a reaction or diffusion channel during a time step
+        for this channel to be integrated deterministically by the hybrid engine (number).
+        """
         
+        return self._hybrid_propensity_threshold
+
+    @hybrid_propensity_threshold.setter
+    def hybrid_propensity_threshold(self, hybrid_propensity_threshold) :
+        if not isnumber(hybrid_propensity_threshold) :
+            raise TypeError("hybrid_propensity_threshold must be a number.")
+        if hybrid_propensity_threshold < 0 :
+            raise ValueError("hybrid_propensity_threshold must be positive.")
+        self._hybrid_propensity_threshold = float(hybrid_propensity_threshold)
+
+    @property
+    def hybrid_stochastic_region(self) :
+        """
+        Spatial partition of the system used by the hybrid engine :
+            
+        * None : (default) the reaction and diffusion channels are partitioned at each time step
+          according to hybrid_population_threshold and hybrid_propensity_threshold.
+        * array of environment labels : the cells of these environments form the stochastic region.
+        * array of bool or int, with one value per cell : the cells of nonzero value form the stochastic region.
+        
+        When a stochastic region is given, the reactions of the other cells and the diffusion between them are integrated
+        deterministically, while the reactions of the stochastic cells and the diffusion from them are simulated stochastically.
+        The diffusion from the deterministic cells to the stochastic ones is transferred at each time step as whole molecules,
+        the flux being rounded randomly, so that the quantities of the stochastic cells remain integers.
+        """
+        
+        return self._hybrid_stochastic_region
+
+    @hybrid_stochastic_region.setter
+    def hybrid_stochastic_region(self, hybrid_stochastic_region) :
+        if hybrid_stochastic_region is None :
+            self._hybrid_stochastic_region = None
+            return
+        if isstr(hybrid_stochastic_region) :
+            hybrid_stochastic_region = [hybrid_stochastic_region]
+        if not isarray(hybrid_stochastic_region) :
+            raise TypeError("hybrid_stochastic_region must be None, an array of environment labels or an array with one value per cell.")
+        if all(isstr(v) for v in hybrid_stochastic_region) :
+            for label in hybrid_stochastic_region :
+                if label not in self.system.network.environments :
+                    raise ValueError("undefined environment \""+str(label)+"\" in hybrid_stochastic_region.")
+            self._hybrid_stochastic_region = [str(label) for label in hybrid_stochastic_region]
+        else :
+            if len(hybrid_stochastic_region) != self.system.space.size() :
+                raise ValueError("hybrid_stochastic_region size must match the system size.")
+            self._hybrid_stochastic_region = [int(bool(v)) for v in hybrid_stochastic_region]
+
     @property
     def t_max(self) :
         """
@@ -110,6 +312,9 @@ class RDScript :
         * "on_t_sample" : (default) sampling is done accorging to t_sample (as close as possible).
         * "on_iteration" : sampling is done at t=0, then at every iteration.
         * "on_interval" : sampling is done at t=0, then at the given time interval.
+        * "on_change" : sampling is done at t=0, then whenever the tracked observables (see sampling_observables)
+          have changed by more than sampling_atol + sampling_rtol * |value at the last sample| since the last sample,
+          or when sampling_max_gap has elapsed since the last sample.
         * "no_sampling" : no sampling is managed by the engine. the sample() method should be used for manual sampling.
         """
         
@@ -124,8 +329,9 @@ class RDScript :
         if sampling_policy not in ["on_t_sample" , 
                                    "on_iteration", 
                                    "on_interval" , 
+                                   "on_change"   , 
                                    "no_sampling" ] :
-            raise ValueError("\""+sampling_policy+"\" is not a valid sampling policy. accepted values are : \"on_t_sample\", \"on_iteration\", \"on_interval\" and \"no_sampling\".")
+            raise ValueError("\""+sampling_policy+"\" is not a valid sampling policy. accepted values are : \"on_t_sample\", \"on_iteration\", \"on_interval\", \"on_change\" and \"no_sampling\".")
         
         self._sampling_policy = sampling_policy
 
@@ -141,7 +347,201 @@ class RDScript :
     @sampling_interval.setter
     def sampling_interval(self, sampling_interval) :
         self._sampling_interval = UnitValue(sampling_interval, Units(sys=self.units_system, dim=time_units_dimensions()), convert=False)
+
+    @property
+    def sampling_rtol(self) :
+        """
+        Relative change threshold used if the sampling policy is "on_change" (number).
+        """
+        
+        return self._sampling_rtol
+
+    @sampling_rtol.setter
+    def sampling_rtol(self, sampling_rtol) :
+        if not isnumber(sampling_rtol) :
+            raise TypeError("sampling_rtol must be a number.")
+        if sampling_rtol < 0 :
+            raise ValueError("sampling_rtol must be positive.")
+        self._sampling_rtol = float(sampling_rtol)
+
+    @property
+    def sampling_atol(self) :
+        """
+        Absolute change threshold (in quantity units) used if the sampling policy is "on_change".
+        """
+        
+        return self._sampling_atol
+
+    @sampling_atol.setter
+    def sampling_atol(self, sampling_atol) :
+        sampling_atol = UnitValue(sampling_atol, Units(sys=self.units_system, dim=quantity_units_dimensions()), convert=False)
+        if sampling_atol.value < 0 :
+            raise ValueError("sampling_atol must be positive.")
+        self._sampling_atol = sampling_atol
+
+    @property
+    def sampling_max_gap(self) :
+        """
+        Maximal in-simulation time interval between two samples if the sampling policy is "on_change".
+        If None, there is no such maximal interval.
+        """
+        
+        if self._sampling_max_gap is None :
+            return None
+        return self._sampling_max_gap.copy()
+
+    @sampling_max_gap.setter
+    def sampling_max_gap(self, sampling_max_gap) :
+        if sampling_max_gap is None :
+            self._sampling_max_gap = None
+        else :
+            sampling_max_gap = UnitValue(sampling_max_gap, Units(sys=self.units_system, dim=time_units_dimensions()), convert=False)
+            if sampling_max_gap.value <= 0 :
+                raise ValueError("sampling_max_gap must be strictly positive.")
+            self._sampling_max_gap = sampling_max_gap
+
+    @property
+    def sampling_observables(self) :
+        """
+        Labels of the species which total quantity in the system is tracked if the sampling policy is "on_change".
+        If None, the change is measured as the norm of the difference between the current system state 
+        and the last sampled state.
+        """
+        
+        return self._sampling_observables
+
+    @sampling_observables.setter
+    def sampling_observables(self, sampling_observables) :
+        if sampling_observables is None :
+            self._sampling_observables = None
+            return
+        if isstr(sampling_observables) :
+            sampling_observables = [sampling_observables]
+        if not isarray(sampling_observables) :
+            raise TypeError("sampling_observables must be None, a species label or an array of species labels.")
+        for label in sampling_observables :
+            if self.system.network.get_species_index(label) is None :
+                raise ValueError("undefined species \""+str(label)+"\" in sampling_observables.")
+        self._sampling_observables = [str(label) for label in sampling_observables]
+    
+    def get_sampling_observables_indices(self) :
+        """
+        Returns the indices of the species listed in sampling_observables
+        (an empty list if sampling_observables is None).
+        """
+        
+        if self.sampling_observables is None :
+            return []
+        indices = []
+        for label in self.sampling_observables :
+            index = self.system.network.get_species_index(label)
+            if index is None :
+                raise ValueError("undefined species \""+label+"\" in sampling_observables.")
+            indices.append(index)
+        return indices
+    
+    
+    @property
+    def stop_conditions(self) :
+        """
+        Conditions ending the simulation before t_max as soon as one of them is met
+        (None or list of conditions). The index of the condition that was met and the time at
+        which it was met are recorded in the trajectory (see RDTrajectory.stop_condition and RDTrajectory.t_stop).
+        Each condition is a dict with the following keys :
+            
+        * "type" : "above" (the observable reaches "value" or more), "below" (the observable reaches "value" or less),
+          "rel_change" (the relative change of the observable over "interval" is "value" or less)
+          or "steady_state" (the whole system is stationary, see below).
+        * "species" : label of the species of which the total quantity is observed, or None (default) for all the species.
+        * "cells" : indices of the cells of the region in which the quantity is observed, or None (default) for the whole system.
+        * "value" : threshold, in quantity units for "above" and "below", as a number for "rel_change".
+        * "interval" : in-simulation time interval over which the relative change is measured ("rel_change" and "steady_state").
+        * "rtol", "atol" : relative tolerance (number, default 1e-4) and absolute tolerance (quantity, default 0) of a "steady_state" condition.
+        
+        For a "steady_state" condition, with deterministic engines, the system is considered stationary when the
+        maximal rate of change of its state over a window of "interval", times "interval", is lower than atol + rtol*max|state|.
+        With stochastic engines, it is considered stationary when the time averaged species totals of two successive windows
+        of "interval" differ by less than atol + rtol*max|averaged species totals|.
+        
+        The conditions are evaluated every stop_check_interval iterations.
+        """
+        
+        return self._stop_conditions
+
+    @stop_conditions.setter
+    def stop_conditions(self, stop_conditions) :
+        if stop_conditions is None :
+            self._stop_conditions = None
+            return
+        if isdict(stop_conditions) :
+            stop_conditions = [stop_conditions]
+        if not isarray(stop_conditions) :
+            raise TypeError("stop_conditions must be None, a dict or an array of dicts.")
+        self._stop_conditions = [self._process_stop_condition(c) for c in stop_conditions]
     
+    def _process_stop_condition(self, c) :
+        if not isdict(c) :
+            raise TypeError("a stop condition must be a dict.")
+        for key in c :
+            if key not in ["type", "species", "cells", "value", "interval", "rtol", "atol"] :
+                raise ValueError("unexpected key \""+str(key)+"\" in stop condition.")
+        if "type" not in c :
+            raise ValueError("a stop condition must have a type.")
+        if "value" not in c and c["type"] != "steady_state" :
+            raise ValueError("a stop condition must have a value.")
+        
+        pc = {"type" : c["type"], "species" : c.get("species", None), "cells" : c.get("cells", None)}
+        
+        if pc["type"] == "steady_state" :
+            if pc["species"] is not None or pc["cells"] is not None :
+                raise ValueError("a \"steady_state\" stop condition applies to the whole system, and cannot have species or cells.")
+            if "interval" not in c :
+                raise ValueError("a \"steady_state\" stop condition must have an interval.")
+            rtol = c.get("rtol", 1e-4)
+            if not isnumber(rtol) or rtol < 0 :
+                raise ValueError("the rtol of a \"steady_state\" stop condition must be a positive number.")
+            pc["rtol"] = float(rtol)
+            pc["atol"] = UnitValue(c.get("atol", 0), Units(sys=self.units_system, dim=quantity_units_dimensions()), convert=False)
+            pc["interval"] = UnitValue(c["interval"], Units(sys=self.units_system, dim=time_units_dimensions()), convert=False)
+        elif pc["type"] in ["above", "below"] :
+            pc["value"] = UnitValue(c["value"], Units(sys=self.units_system, dim=quantity_units_dimensions()), convert=False)
+        elif pc["type"] == "rel_change" :
+            if not isnumber(c["value"]) or c["value"] < 0 :
+                raise ValueError("the value of a \"rel_change\" stop condition must be a positive number.")
+            if "interval" not in c :
+                raise ValueError("a \"rel_change\" stop condition must have an interval.")
+            pc["value"] = float(c["value"])
+            pc["interval"] = UnitValue(c["interval"], Units(sys=self.units_system, dim=time_units_dimensions()), convert=False)
+        else :
+            raise ValueError("\""+str(pc["type"])+"\" is not a valid stop condition type. accepted values are : \"above\", \"below\", \"rel_change\" and \"steady_state\".")
+        
+        if pc["species"] is not None and self.system.network.get_species_index(pc["species"]) is None :
+            raise ValueError("undefined species \""+str(pc["species"])+"\" in stop condition.")
+        if pc["cells"] is not None :
+            if not isarray(pc["cells"]) :
+                raise TypeError("the cells of a stop condition must be an array of cell indices.")
+            pc["cells"] = [int(i) for i in pc["cells"]]
+            for i in pc["cells"] :
+                if i < 0 or i >= self.system.space.size() :
+                    raise ValueError("cell index "+str(i)+" out of range in stop condition.")
+        
+        return pc
+    
+    @property
+    def stop_check_interval(self) :
+        """
+        Number of iterations between two evaluations of the stop conditions (int).
+        """
+        
+        return self._stop_check_interval
+    
+    @stop_check_interval.setter
+    def stop_check_interval(self, stop_check_interval) :
+        if not isnumber(stop_check_interval) or int(stop_check_interval) != stop_check_interval :
+            raise TypeError("stop_check_interval must be an integer.")
+        if stop_check_interval < 1 :
+            raise ValueError("stop_check_interval must be strictly positive.")
+        self._stop_check_interval = int(stop_check_interval)
     
     @property
     def rng_seed(self) : 
@@ -190,6 +590,32 @@ class RDScript :
             raise ValueError("Accepted values for init_state_processing are \"auto\", \"none\", \"Poisson\" and \"redist\".")
         self._init_state_processing = init_state_processing
 
+    @property 
+    def storage_dtype(self) :
+        """
+        Data type used to store the sampled system states. It can be set with a string with one of the following values:
+
+        * "float64" : (default) double precision floating point numbers.
+        * "float32" : single precision floating point numbers.
+        * "uint16", "uint32", "int32" : integers. Sampled values are rounded to the nearest integer, 
+          which is lossless for stochastic engines (which work with molecule counts).
+        
+        An OverflowError is raised when the trajectory is retrieved if a sampled value 
+        could not be represented with the storage data type.
+        For integer data types, if the trajectory has to be converted to a units system with a quantity
+        units other than the engine's one, the converted values are stored as float64.
+        """
+
+        return self._storage_dtype
+    
+    @storage_dtype.setter
+    def storage_dtype(self, storage_dtype) :
+        if not isstr(storage_dtype) :
+            raise TypeError("storage_dtype must be a string.")
+        if not storage_dtype in ["float64", "float32", "uint16", "uint32", "int32"] :
+            raise ValueError("Accepted values for storage_dtype are \"float64\", \"float32\", \"uint16\", \"uint32\" and \"int32\".")
+        self._storage_dtype = storage_dtype
+
     @property
     def units_system(self) :
         """
@@ -225,10 +651,24 @@ def rdscript_from_dict(d, base_path=None) :
         ["system"],
         ["t_sample"],
         ["time_step", "time step", "dt"],
+        ["rtol"],
+        ["atol"],
+        ["multirate"],
+        ["local_time_stepping", "local time stepping"],
+        ["hybrid_population_threshold", "hybrid population threshold"],
+        ["hybrid_propensity_threshold", "hybrid propensity threshold"],
+        ["hybrid_stochastic_region", "hybrid stochastic region"],
         ["t_max", "tmax"],
         ["sampling_policy", "sampling policy"],
         ["sampling_interval", "sampling interval"],
+        ["sampling_rtol", "sampling rtol"],
+        ["sampling_atol", "sampling atol"],
+        ["sampling_max_gap", "sampling max gap"],
+        ["sampling_observables", "sampling observables"],
+        ["stop_conditions", "stop conditions"],
+        ["stop_check_interval", "stop check interval"],
         ["rng_seed", "rng seed", "seed"],
+        ["storage_dtype", "storage dtype", "dtype"],
         ["units", "units_system", "units system", "u"]
         ])
     
@@ -264,13 +704,34 @@ def rdscript_from_dict(d, base_path=None) :
         raise ValueError("script t_sample is missing")
 
     if "time_step"         in d : da["time_step"]         = d["time_step"]
+    if "rtol"              in d : da["rtol"]              = d["rtol"]
+    if "atol"              in d : da["atol"]              = d["atol"]
+    if "multirate"         in d : da["multirate"]         = d["multirate"]
+    if "local_time_stepping" in d : da["local_time_stepping"] = d["local_time_stepping"]
+    if "hybrid_population_threshold" in d : da["hybrid_population_threshold"] = d["hybrid_population_threshold"]
+    if "hybrid_propensity_threshold" in d : da["hybrid_propensity_threshold"] = d["hybrid_propensity_threshold"]
+    if "hybrid_stochastic_region" in d : da["hybrid_stochastic_region"] = d["hybrid_stochastic_region"]
     if "t_max"             in d : da["t_max"]             = d["t_max"]
     if "sampling_policy"   in d : da["sampling_policy"]   = d["sampling_policy"]
     if "sampling_interval" in d : da["sampling_interval"] = d["sampling_interval"]
+    if "sampling_rtol"     in d : da["sampling_rtol"]     = d["sampling_rtol"]
+    if "sampling_atol"     in d : da["sampling_atol"]     = d["sampling_atol"]
+    if "sampling_max_gap"  in d : da["sampling_max_gap"]  = d["sampling_max_gap"]
+    if "sampling_observables" in d : da["sampling_observables"] = d["sampling_observables"]
+    if "stop_conditions"   in d : da["stop_conditions"]   = d["stop_conditions"]
+    if "stop_check_interval" in d : da["stop_check_interval"] = d["stop_check_interval"]
     if "rng_seed"          in d : da["rng_seed"]          = d["rng_seed"]
+    if "storage_dtype"     in d : da["storage_dtype"]     = d["storage_dtype"]
     
     return RDScript(**da)
         
+def _stop_condition_to_dict(c) :
+    d = dict(c)
+    for key in ["value", "interval", "atol"] :
+        if key in d and type(d[key]) == UnitValue :
+            d[key] = str(d[key])
+    return d
+
 def rdscript_to_dict(script) :
     """
     Creates a dictionary from a RDScript object.
@@ -280,10 +741,24 @@ def rdscript_to_dict(script) :
         "system"            : rdsystem_to_dict(script.system),
         "t_sample"          : unitarray_to_dict(script.t_sample),
         "time_step"         : str(script.time_step),
+        "rtol"              : script.rtol,
+        "atol"              : str(script.atol),
+        "multirate"         : script.multirate,
+        "local_time_stepping" : script.local_time_stepping,
+        "hybrid_population_threshold" : script.hybrid_population_threshold,
+        "hybrid_propensity_threshold" : script.hybrid_propensity_threshold,
+        "hybrid_stochastic_region" : script.hybrid_stochastic_region,
         "t_max"             : str(script.t_max),
         "sampling_policy"   : script.sampling_policy,
         "sampling_interval" : str(script.sampling_interval),
+        "sampling_rtol"     : script.sampling_rtol,
+        "sampling_atol"     : str(script.sampling_atol),
+        "sampling_max_gap"  : None if script.sampling_max_gap is None else str(script.sampling_max_gap),
+        "sampling_observables" : script.sampling_observables,
+        "stop_conditions"   : None if script.stop_conditions is None else [_stop_condition_to_dict(c) for c in script.stop_conditions],
+        "stop_check_interval" : script.stop_check_interval,
         "rng_seed"          : script.rng_seed,
+        "storage_dtype"     : script.storage_dtype,
         "units"             : unitssystem_to_dict(script.units_system)
         }
     
@@ -1,11 +1,18 @@
+import numpy as np
+
 class SamplerBase:
     def __init__(self):
         self.t = []
         self.x = []
         
-    def requires_sample(self, t):
+    def requires_sample(self, t, state=None):
         return NotImplementedError()
     
+    def get_due_times(self, t):
+        # returns the sampling times lower or equal to t that have not been sampled yet,
+        # or None if the sampling times are not known in advance (see requires_sample).
+        return None
+    
     def sample(self, t, state):
         self.t.append(t)
         self.x.append(state)
@@ -16,7 +23,7 @@ class OnTimeSampler(SamplerBase):
         self.t_sample = t_sample
         self.pos = 0
     
-    def requires_sample(self, t):
+    def requires_sample(self, t, state=None):
         if self.pos == len(self.t_sample):
             return False
         sampling_is_required = False
@@ -26,6 +33,13 @@ class OnTimeSampler(SamplerBase):
             if self.pos == len(self.t_sample):
                 break
         return sampling_is_required
+    
+    def get_due_times(self, t):
+        due = []
+        while self.pos < len(self.t_sample) and t >= self.t_sample[self.pos]:
+            due.append(self.t_sample[self.pos])
+            self.pos += 1
+        return due
 
 class OnIntervalSampler(SamplerBase):
     def __init__(self, interval):
@@ -33,34 +47,76 @@ class OnIntervalSampler(SamplerBase):
         self.interval = interval
         self.pos = -1
     
-    def requires_sample(self, t):
+    def requires_sample(self, t, state=None):
         current_pos = int(t/self.interval)
         if current_pos>self.pos:
             self.pos = current_pos
             return True
         return False
+    
+    def get_due_times(self, t):
+        current_pos = int(t/self.interval)
+        due = [k*self.interval for k in range(self.pos+1, current_pos+1)]
+        self.pos = max(self.pos, current_pos)
+        return due
         
 class OnIterationSampler(SamplerBase):
     def __init__(self):
         SamplerBase.__init__(self)
     
-    def requires_sample(self, t):
+    def requires_sample(self, t, state=None):
         return True
         
 class ManualSampler(SamplerBase):
     def __init__(self):
         SamplerBase.__init__(self)
     
-    def requires_sample(self, t):
+    def requires_sample(self, t, state=None):
         return False
 
+class OnChangeSampler(SamplerBase):
+    def __init__(self, rtol, atol, max_gap=None, observables=None, n_cells=1):
+        SamplerBase.__init__(self)
+        self.rtol = rtol
+        self.atol = atol
+        self.max_gap = max_gap
+        self.observables = [] if observables is None else list(observables)
+        self.n_cells = n_cells
+    
+    def _observables_values(self, state):
+        state = np.asarray(state)
+        return np.array([np.sum(state[s*self.n_cells:(s+1)*self.n_cells]) for s in self.observables])
+    
+    def requires_sample(self, t, state=None):
+        if len(self.t) == 0:
+            return True
+        if self.max_gap is not None and t-self.t[-1] >= self.max_gap:
+            return True
+        if state is None:
+            return False
+        if len(self.observables) == 0:
+            diff = np.linalg.norm(np.asarray(state)-self.x[-1])
+            return diff > self.atol + self.rtol*np.linalg.norm(self.x[-1])
+        current = self._observables_values(state)
+        last = self._observables_values(self.x[-1])
+        return bool(np.any(np.abs(current-last) > self.atol + self.rtol*np.abs(last)))
+
+    def sample(self, t, state):
+        SamplerBase.sample(self, t, np.array(state))
+
 def create_sampler(
     policy,
     t_sample,
     interval,
-    t_max
+    t_max,
+    rtol = 0.01,
+    atol = 0,
+    max_gap = None,
+    observables = None,
+    n_cells = 1
     ):
     if policy == "on_t_sample":  return OnTimeSampler(t_sample)
     if policy == "on_interval":  return OnIntervalSampler(interval)
     if policy == "on_iteration": return OnIterationSampler()
+    if policy == "on_change":    return OnChangeSampler(rtol, atol, max_gap, observables, n_cells)
     if policy == "no_sampling":  return ManualSampler()
@@ -1,22 +1,115 @@
 import scipy
+import inspect
 import time as python_time
 from strengths.sampler import create_sampler
 from strengths.ode import build_ode_function
 from strengths.units import *
 from strengths.rdengine import *
-from strengths.rdoutput import RDTrajectory
+from strengths.rdoutput import RDTrajectory, cast_trajectory_data
+
+class _StopConditions:
+    # evaluates the stop conditions of a script (see RDScript.stop_conditions) on species first states.
+    def __init__(self, script, units_system):
+        self._n_species = len(script.system.network.species)
+        self._n_cells = script.system.space.size()
+        self._check_interval = script.stop_check_interval
+        self._n_iterations = 0
+        self.fired = None
+        self.t_fired = None
+        self._conditions = []
+        for c in ([] if script.stop_conditions is None else script.stop_conditions):
+            if c["type"] == "steady_state":
+                value = c["rtol"]
+            elif c["type"] == "rel_change":
+                value = c["value"]
+            else:
+                value = c["value"].convert(units_system).value
+            self._conditions.append({
+                "type" : c["type"],
+                "species" : slice(None) if c["species"] is None else script.system.network.get_species_index(c["species"]),
+                "cells" : slice(None) if c["cells"] is None else np.array(c["cells"], dtype=int),
+                "value" : value,
+                "atol" : c["atol"].convert(units_system).value if c["type"] == "steady_state" else 0,
+                "interval" : c["interval"].convert(units_system).value if c["type"] in ["rel_change", "steady_state"] else 0,
+                "ref" : None,
+                "ref_t" : 0
+                })
+
+    def _evaluate_steady_state(self, c, x, t):
+        # the system is stationary if the maximal norm of its rate of change over
+        # a window of c["interval"], times c["interval"], is lower than atol + rtol*|x|.
+        if c["ref"] is None:
+            c["ref"], c["ref_t"], c["last_x"], c["last_t"], c["max_rate"] = True, t, x.copy(), t, 0
+            return False
+        if t > c["last_t"]:
+            c["max_rate"] = max(c["max_rate"], np.max(np.abs(x - c["last_x"]))/(t - c["last_t"]))
+        c["last_x"], c["last_t"] = x.copy(), t
+        window = t - c["ref_t"]
+        if window < c["interval"] or window <= 0:
+            return False
+        stationary = c["max_rate"]*window <= c["atol"] + c["value"]*np.max(np.abs(x))
+        c["ref_t"], c["max_rate"] = t, 0
+        return stationary
+
+    def _evaluate(self, c, x, t):
+        if c["type"] == "steady_state":
+            return self._evaluate_steady_state(c, x, t)
+        v = np.sum(x[c["species"], c["cells"]])
+        if c["type"] == "above":
+            return v >= c["value"]
+        if c["type"] == "below":
+            return v <= c["value"]
+        if c["ref"] is None:
+            c["ref"], c["ref_t"] = v, t
+            return False
+        if t - c["ref_t"] >= c["interval"]:
+            scale = max(abs(v), abs(c["ref"]))
+            if (abs(v - c["ref"])/scale if scale > 0 else 0) <= c["value"]:
+                return True
+            c["ref"], c["ref_t"] = v, t
+        return False
+
+    def check(self, y, t):
+        # to be called after each iteration, returns True if a condition is met (now or before).
+        if self.fired is not None:
+            return True
+        if len(self._conditions) == 0:
+            return False
+        self._n_iterations += 1
+        if self._n_iterations < self._check_interval:
+            return False
+        self._n_iterations = 0
+        x = np.reshape(y, (self._n_species, self._n_cells))
+        for i, c in enumerate(self._conditions):
+            if self._evaluate(c, x, t):
+                self.fired, self.t_fired = i, t
+                return True
+        return False
 
 class ScipyRDEngine(RDEngineBase):
     """
-    Engine relying on SciPy's ODE solvers
+    Engine relying on SciPy's ODE solvers.
+    The solver's local error tolerances are the script ones (RDScript.rtol and RDScript.atol).
+    With the "on_t_sample" and "on_interval" sampling policies, the state is sampled at exactly 
+    the requested times, by interpolation with the dense output of the solver, 
+    so that the sampling does not constrain the solver steps.
+
+    :param integrator_class: SciPy's ODE solver class (see scipy.integrate.OdeSolver).
+    :param jacobian: Jacobian information passed to the solvers which accept it :
+        "analytic" for the analytic Jacobian (sparse for BDF and Radau, dense for LSODA) along with its sparsity structure,
+        "sparsity" for the sparsity structure only (BDF and Radau), or None to let the solver estimate a dense Jacobian.
+    :type jacobian: str or None
     """
-    def __init__(self, integrator_class=scipy.integrate.LSODA):
+    def __init__(self, integrator_class=scipy.integrate.LSODA, jacobian="analytic"):
         RDEngineBase.__init__(
             self,
             "",
             "IntegrateEngine"
             )
+        if jacobian not in ["analytic", "sparsity", None]:
+            raise ValueError("jacobian must be \"analytic\", \"sparsity\" or None.")
         self.integrator_class = integrator_class
+        self.jacobian = jacobian
         
     def setup(self, script):
         self._terminated = False
@@ -27,21 +120,43 @@ class ScipyRDEngine(RDEngineBase):
             self._script.sampling_policy,
             self._script.t_sample.convert(self._units_system).value,
             self._script.sampling_interval.convert(self._units_system).value,
-            self._t_max
+            self._t_max,
+            rtol = self._script.sampling_rtol,
+            atol = self._script.sampling_atol.convert(self._units_system).value,
+            max_gap = None if self._script.sampling_max_gap is None else self._script.sampling_max_gap.convert(self._units_system).value,
+            observables = self._script.get_sampling_observables_indices(),
+            n_cells = self._script.system.space.size()
             )
         system = self._script.system.copy()
-        ode_function = build_ode_function(
+        ode_function, jac, jac_sparsity = build_ode_function(
             system, 
-            self._units_system
+            self._units_system,
+            jacobian = True
             )
         self.integrator = self.integrator_class(
             ode_function,
             t0 = 0,
             y0 = system.state.convert(self._units_system).value,
-            t_bound = self._t_max
+            t_bound = self._t_max,
+            rtol = self._script.rtol,
+            atol = self._script.atol.convert(self._units_system).value,
+            **self._get_jacobian_arguments(jac, jac_sparsity)
             )
-        if self.sampler.requires_sample(0):
-            self.sampler.sample(self.integrator.t, self.integrator.y)
+        self._sample_step()
+        self._stop_conditions = _StopConditions(self._script, self._units_system)
+
+    def _get_jacobian_arguments(self, jac, jac_sparsity):
+        # only the arguments supported by the integrator class are passed
+        parameters = inspect.signature(self.integrator_class).parameters
+        arguments = {}
+        if self.jacobian is not None and "jac_sparsity" in parameters:
+            arguments["jac_sparsity"] = jac_sparsity
+        if self.jacobian == "analytic" and "jac" in parameters:
+            if "jac_sparsity" in parameters:
+                arguments["jac"] = jac
+            else:
+                arguments["jac"] = lambda t, y: jac(t, y).toarray()
+        return arguments
 
     def run(self, breathe_dt):
         t_start = python_time.time_ns()
@@ -59,12 +174,31 @@ class ScipyRDEngine(RDEngineBase):
             print(s)
             self._terminated = True
             return False
-        if self.sampler.requires_sample(self.integrator.t):
-            self.sampler.sample(self.integrator.t, self.integrator.y)
+        self._sample_step()
         if self.integrator.status == "finished":
             self._terminated = True
+        if self._stop_conditions.check(self.integrator.y, self.integrator.t):
+            self._terminated = True
         return self._ongoing()
         
+    def _sample_step(self):
+        # samples the states required since the last step, interpolated with the solver dense output
+        # when the sampling times are known in advance.
+        due = self.sampler.get_due_times(self.integrator.t)
+        if due is None:
+            if self.sampler.requires_sample(self.integrator.t, self.integrator.y):
+                self.sampler.sample(self.integrator.t, self.integrator.y)
+            return
+        dense_output = None
+        for t in due:
+            if t == self.integrator.t or self.integrator.t_old is None:
+                y = np.array(self.integrator.y)
+            else:
+                if dense_output is None:
+                    dense_output = self.integrator.dense_output()
+                y = dense_output(t)
+            self.sampler.sample(t, y)
+        
     def iterate_n(self, n_iterations):
         for i in range(n_iterations):
             self.iteration()
@@ -73,13 +207,18 @@ class ScipyRDEngine(RDEngineBase):
     def get_progress(self):
         return 100*self.integrator.t/self._t_max
 
+    def get_time(self):
+        return UnitValue(self.integrator.t, Units(self._units_system, time_units_dimensions())).convert(self._script.units_system)
+
     def sample(self):
         self.sampler.sample(self.integrator.t, self.integrator.y)
 
     def get_output(self):
         data = UnitArray(
-            np.array(self.sampler.x).flatten(), 
-            Units(self._units_system, quantity_units_dimensions())
+            cast_trajectory_data(np.array(self.sampler.x).flatten(), self._script.storage_dtype), 
+            Units(self._units_system, quantity_units_dimensions()),
+            check_value=False,
+            dtype=self._script.storage_dtype
             )
         output = RDTrajectory(
             data = data,
@@ -90,7 +229,9 @@ class ScipyRDEngine(RDEngineBase):
             system = self._script.system.copy(),
             script = self._script.copy(),
             engine_description = self.description,
-            engine_option = self.option
+            engine_option = self.option,
+            stop_condition = self._stop_conditions.fired,
+            t_stop = None if self._stop_conditions.fired is None else UnitValue(self._stop_conditions.t_fired, Units(self._units_system, time_units_dimensions()))
             )
         return output
         
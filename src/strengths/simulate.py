@@ -1,20 +1,113 @@
 from strengths.rdsystem import RDSystem, rdsystem_from_dict, rdsystem_to_dict
 from strengths.units import *
 from strengths.rdscript import RDScript
+from strengths.rdoutput import RDTrajectoryEnsemble
+from strengths.parameters import apply_parameters
+from strengths.typechecking import *
 from strengths import engine_collection
 from strengths.coarsegrain import coarsegrain_system, uncoarsegrain_trajectory
 
+import numpy as np
+import asyncio
+import time
+import weakref
+
 def _print_progress(v) :
     v = min(v, 100)
     if   v<10  : print(f"\r00{v:.6f} %", end="")
     elif v<100 : print(f"\r0{v:.6f} %", end="")
     else       : print(f"\r{v:.6f} %", end="")
+
+class SimulationObserver :
+    """
+    Base class for the observers of a simulation (see simulate_script), which are notified
+    between two run slices (see RDEngineBase.run) of the progress of the simulation and of the
+    samples gathered since the last notification. Derived classes override on_progress and/or on_samples.
+    Any of them may return True to stop the simulation, in which case the trajectory sampled so far is returned.
+
+    :param breathe_dt: real time duration of a run slice, in ms, ie. the interval at which the observer is notified.
+    :type breathe_dt: int
+    """
+    
+    def __init__(self, breathe_dt=1000) :
+        """
+        constructor
+        """
+        
+        self.breathe_dt = breathe_dt
+    
+    def on_progress(self, t, progress) :
+        """
+        Called with the current simulation time and progress (percentage).
+        
+        :param t: simulation time.
+        :type t: UnitValue
+        :param progress: progress of the simulation (percentage).
+        :type progress: float
+        :returns: True to stop the simulation.
+        """
+        
+        return False
+    
+    def on_samples(self, t_chunk, data_chunk) :
+        """
+        Called with the samples gathered since the last call (see RDEngineBase.get_samples),
+        if there are any.
+        
+        :param t_chunk: sampling times.
+        :type t_chunk: UnitArray
+        :param data_chunk: sampled states [sample index, species index, cell index], 
+            with the same layout and data type as RDTrajectory.data.
+        :type data_chunk: UnitArray
+        :returns: True to stop the simulation.
+        """
+        
+        return False
+
+def _notify_observers(script, engine, observers, n_read) :
+    # notifies the observers of the progress and of the samples from index n_read.
+    # returns the new number of samples read, and True if an observer requested the simulation to stop.
+    progress = min(engine.get_progress(), 100)
+    try :
+        t = engine.get_time()
+    except NotImplementedError :
+        t = script.t_max*progress/100
+    t_chunk, data_chunk = engine.get_samples(n_read)
+    stop = False
+    for observer in observers :
+        stop = bool(observer.on_progress(t, progress)) or stop
+        if len(t_chunk) > 0 :
+            stop = bool(observer.on_samples(t_chunk, data_chunk)) or stop
+    return n_read+len(t_chunk), stop
+            
+def _check_setup(engine, res) :
+    # raises an exception if the engine setup failed, res being the value returned by engine.setup.
+    if res == 1 :
+        raise Exception("Invalid option argument : \""+engine.option+"\".")
+    elif res == 2 :
+        raise Exception("Invalid boundary conditions.")
             
+def _coarsegrain_script(script, cgmap) :
+    cgscript = script.copy()
+    cgscript.system = coarsegrain_system(cgscript.system, cgmap)
+    if script.stop_conditions is not None :
+        # the regions of the stop conditions are mapped to the coarse grained cells containing them
+        cgscript.stop_conditions = [
+            c if c["cells"] is None else dict(c, cells=sorted(set(int(cgmap[i]) for i in c["cells"]))) 
+            for c in script.stop_conditions
+            ]
+    return cgscript
+
 def simulate_script(
         script,
         engine,
         print_progress = False,
-        cgmap = None
+        cgmap = None,
+        checkpoint = None,
+        checkpoint_interval = 600,
+        resume = None,
+        wall_time_limit = None,
+        observer = None
         ) :
     """
     Simulates the trajectory of a reaction diffusion system, using a given engine.
@@ -34,41 +127,100 @@ def simulate_script(
     :param cgmap: optionnal coarse graining index map.
     :type cgmap: array of int or None
     
+    :param checkpoint: optional path of a checkpoint file, periodically overwritten
+        with the current state of the simulation (see RDEngineBase.checkpoint).
+        It is also written when the simulation is stopped by the wall time limit or cancelled.
+    :type checkpoint: str or None
+    
+    :param checkpoint_interval: wall clock time interval between two checkpoints, in seconds.
+    :type checkpoint_interval: number
+    
+    :param resume: optional path of a checkpoint file the simulation should be resumed from.
+        The script must be the one of the checkpointed simulation. The returned trajectory
+        includes the samples gathered before the checkpoint.
+    :type resume: str or None
+    
+    :param wall_time_limit: optional wall clock time limit of the simulation, in seconds.
+        When it is reached, the simulation stops and the trajectory sampled so far is returned.
+        The simulation also stops if it is cancelled from another thread (see RDEngineBase.cancel).
+    :type wall_time_limit: number or None
+    
+    :param observer: optional observer(s) notified between two run slices, which
+        set the real time duration of the slices (the shortest one is used).
+        With cgmap, the observers receive the samples of the coarse grained system.
+    :type observer: SimulationObserver or list of SimulationObserver or None
+    
     :return: system trajectory.
     :rtype: RDTrajectory
     """
     if cgmap is None :
+        t_start = time.time()
+        
         #initialization phase
         res = engine.setup(script)
-    
-        if res == 1 :
-            raise Exception("Invalid option argument : \""+engine.get_option()+"\".")
-        elif res == 2 :
-            raise Exception("Invalid boundary conditions.")
+        _check_setup(engine, res)
+        
+        try :
+            if resume is not None :
+                engine.load_checkpoint(resume)
             
-        if print_progress :
-            _print_progress(0)
-    
-        # loop phase
-        continue_simulation = True
-        while continue_simulation :
-            continue_simulation = engine.run(1000)
+            if wall_time_limit is not None :
+                try :
+                    engine.set_wall_time_limit(wall_time_limit - (time.time()-t_start))
+                except NotImplementedError :
+                    # the limit is only checked between two run calls
+                    pass
+                
             if print_progress :
-                _print_progress(engine.get_progress())
-                    
-        if print_progress: print("")
-    
-        # output phase
-        output = engine.get_output()
-    
-        # finalize
-        engine.finalize()
+                _print_progress(engine.get_progress() if resume is not None else 0)
+            
+            if observer is None :
+                observers = []
+            elif isinstance(observer, SimulationObserver) :
+                observers = [observer]
+            else :
+                observers = list(observer)
+            breathe_dt = min([o.breathe_dt for o in observers], default=1000)
+        
+            # loop phase
+            continue_simulation = resume is None or not engine.is_complete()
+            interrupted = False
+            n_read = 0
+            if len(observers) > 0 :
+                n_read, stop = _notify_observers(script, engine, observers, n_read)
+                continue_simulation = continue_simulation and not stop
+            last_checkpoint_time = time.time()
+            while continue_simulation :
+                continue_simulation = engine.run(breathe_dt)
+                if engine.is_interrupted() or (wall_time_limit is not None and time.time()-t_start >= wall_time_limit) :
+                    interrupted = continue_simulation or engine.is_interrupted()
+                    continue_simulation = False
+                if len(observers) > 0 :
+                    n_read, stop = _notify_observers(script, engine, observers, n_read)
+                    continue_simulation = continue_simulation and not stop
+                if print_progress :
+                    _print_progress(engine.get_progress())
+                if checkpoint is not None and continue_simulation and time.time()-last_checkpoint_time >= checkpoint_interval :
+                    engine.checkpoint(checkpoint)
+                    last_checkpoint_time = time.time()
+            
+            # the state of a stopped simulation is saved so that it can be resumed
+            if checkpoint is not None and interrupted :
+                engine.checkpoint(checkpoint)
+                        
+            if print_progress: print("")
+        
+            # output phase
+            output = engine.get_output()
+        
+        finally :
+            # finalize
+            engine.finalize()
             
         return output
     else : 
-        cgscript = script.copy()
-        cgscript.system = coarsegrain_system(cgscript.system, cgmap)
-        cgoutput = simulate_script(cgscript, engine, print_progress, None)
+        cgscript = _coarsegrain_script(script, cgmap)
+        cgoutput = simulate_script(cgscript, engine, print_progress, None, checkpoint, checkpoint_interval, resume, wall_time_limit, observer)
         output = uncoarsegrain_trajectory(cgoutput, script.system, cgmap)
         
         return output
@@ -80,6 +232,8 @@ def simulate(
         engine = None,
         print_progress = False,
         cgmap = None,
+        wall_time_limit = None,
+        observer = None,
         **script_keyword_arguments
         ) :
     """
@@ -98,15 +252,34 @@ def simulate(
     :param cgmap: optionnal coarse graining index map.
     :type cgmap: array of int or None
     
+    :param wall_time_limit: optional wall clock time limit of the simulation, in seconds,
+        after which the trajectory sampled so far is returned (see simulate_script).
+    :type wall_time_limit: number or None
+    
+    :param observer: optional observer(s) notified during the simulation (see simulate_script).
+    :type observer: SimulationObserver or list of SimulationObserver or None
+    
     Other parameters corresond to the remaining RDScript properties, and have the same default values :
         
     * time_step = 1e-3
+    * rtol = 1e-3
+    * atol = 1e-6
+    * multirate = None
+    * local_time_stepping = False
+    * hybrid_population_threshold = 100
+    * hybrid_propensity_threshold = 10
+    * hybrid_stochastic_region = None
     * sampling_policy = "on_t_sample"
     * sampling_interval = 1
+    * sampling_rtol = 0.01
+    * sampling_atol = 0
+    * sampling_max_gap = None
+    * sampling_observables = None
     * t_max = "default"
     * rng_seed = None
     * units_system = UnitsSystem()
     * init_state_processing = "auto"
+    * storage_dtype = "float64"
 
     :return: system trajectory
     :rtype: RDTrajectory
@@ -124,6 +297,394 @@ def simulate(
     output = simulate_script(script = script, 
                              engine = engine, 
                              print_progress = print_progress,
-                             cgmap = cgmap)
+                             cgmap = cgmap,
+                             wall_time_limit = wall_time_limit,
+                             observer = observer)
         
     return output
+
+def _derive_seeds(rng_seed, n_replicates) :
+    # independent seeds derived from the script seed
+    seeds = np.random.SeedSequence(rng_seed).generate_state(n_replicates, dtype=np.uint32)
+    return [int(seed) & 0x7fffffff for seed in seeds]
+
+def simulate_ensemble(
+        system,
+        t_sample,
+        n_replicates,
+        engine = None,
+        n_threads = None,
+        **script_keyword_arguments
+        ) :
+    """
+    Simulates independent replicates of the trajectory of a reaction diffusion system.
+    The rng seed of each replicate is derived from the script rng_seed.
+    With engines supporting it (see RDEngineBase.run_ensemble), the system is set up once
+    and the replicates are run concurrently on n_threads threads. Otherwise, the replicates
+    are simulated one after the other.
+
+    :param n_replicates: number of replicates.
+    :type n_replicates: int
+
+    :param engine: the simulation engine that should handle the simulation.
+        if None (default), engine_collection.default_engine() is used.
+    :type engine: RDSimulationEngineBase derived class
+
+    :param n_threads: number of threads used to run the replicates.
+        if None, the number of hardware threads is used.
+    :type n_threads: int or None
+    
+    Other parameters corresond to the remaining RDScript properties, and have the same default values
+    as for simulate. The sampling_policy must be "on_t_sample".
+
+    :return: trajectories of the replicates
+    :rtype: RDTrajectoryEnsemble
+    """
+
+    if engine is None :
+        engine = engine_collection.default_engine() 
+
+    d = dict(script_keyword_arguments)
+    d["system"] = system
+    d["t_sample"] = t_sample
+    
+    script = RDScript(**d)
+    
+    if script.sampling_policy != "on_t_sample" :
+        raise ValueError("ensembles require the \"on_t_sample\" sampling policy.")
+    
+    seeds = _derive_seeds(script.rng_seed, n_replicates)
+
+    res = engine.setup(script)
+    _check_setup(engine, res)
+    try :
+        output = engine.run_ensemble(seeds, n_threads)
+    except NotImplementedError :
+        output = None
+    engine.finalize()
+    
+    if output is not None :
+        return output
+    
+    # fallback for engines that cannot run ensembles
+    outputs = []
+    for seed in seeds :
+        replicate_script = script.copy()
+        replicate_script.rng_seed = seed
+        outputs.append(simulate_script(replicate_script, engine))
+        if outputs[-1].nsamples() != outputs[0].nsamples() :
+            raise RuntimeError("the replicates do not have the same number of samples.")
+    
+    data = [output.data for output in outputs]
+    return RDTrajectoryEnsemble(
+        data = UnitArray(np.concatenate([x.value for x in data]), data[0].units, check_value=False, dtype=data[0].value.dtype),
+        t_sample = outputs[0].t,
+        system = script.system,
+        seeds = seeds,
+        script = script,
+        engine_description = engine.description,
+        engine_option = engine.option
+        )
+
+def _param_table_to_list(param_table) :
+    # a table given as a dict of columns is converted to a list of rows
+    if isdict(param_table) :
+        names = list(param_table)
+        n = len(param_table[names[0]]) if len(names) > 0 else 0
+        for name in names :
+            if len(param_table[name]) != n :
+                raise ValueError("the columns of param_table must have the same length.")
+        return [{name : param_table[name][i] for name in names} for i in range(n)]
+    return [dict(p) for p in param_table]
+
+def simulate_batch(
+        system,
+        param_table,
+        t_sample,
+        engine = None,
+        **script_keyword_arguments
+        ) :
+    """
+    Simulates the trajectory of a reaction diffusion system for several parameter sets.
+    With engines supporting it (see RDEngineBase.run_batch), the system is set up once
+    and the parameter sets are integrated in lockstep. Otherwise, they are simulated
+    one after the other.
+    
+    .. code:: python
+    
+        simulate_batch(system, [{"kf:0" : 1}, {"kf:0" : 2}], t_sample)
+        
+        # is equivalent to
+        
+        simulate_batch(system, {"kf:0" : [1, 2]}, t_sample)
+
+    :param param_table: parameter sets (see apply_parameters), given as a list of rows
+        or as a dict of columns.
+    :type param_table: list of dict or dict of lists
+
+    :param engine: the simulation engine that should handle the simulation.
+        if None (default), engine_collection.euler_engine() is used.
+    :type engine: RDSimulationEngineBase derived class
+    
+    Other parameters corresond to the remaining RDScript properties, and have the same default values
+    as for simulate. The sampling_policy must be "on_t_sample".
+
+    :return: trajectories of the parameter sets
+    :rtype: RDTrajectoryEnsemble
+    """
+
+    if engine is None :
+        engine = engine_collection.euler_engine() 
+
+    parameters = _param_table_to_list(param_table)
+
+    d = dict(script_keyword_arguments)
+    d["system"] = system
+    d["t_sample"] = t_sample
+    
+    script = RDScript(**d)
+    
+    if script.sampling_policy != "on_t_sample" :
+        raise ValueError("batches require the \"on_t_sample\" sampling policy.")
+    
+    res = engine.setup(script)
+    _check_setup(engine, res)
+    try :
+        output = engine.run_batch(parameters)
+    except NotImplementedError :
+        output = None
+    engine.finalize()
+    
+    if output is not None :
+        return output
+    
+    # fallback for engines that cannot run batches
+    outputs = []
+    for p in parameters :
+        set_script = script.copy()
+        set_script.system = apply_parameters(script.system, p)
+        outputs.append(simulate_script(set_script, engine))
+        if outputs[-1].nsamples() != outputs[0].nsamples() :
+            raise RuntimeError("the parameter sets do not have the same number of samples.")
+    
+    data = [output.data for output in outputs]
+    return RDTrajectoryEnsemble(
+        data = UnitArray(np.concatenate([x.value for x in data]), data[0].units, check_value=False, dtype=data[0].value.dtype),
+        t_sample = outputs[0].t,
+        system = script.system,
+        script = script,
+        engine_description = engine.description,
+        engine_option = engine.option,
+        parameters = parameters
+        )
+
+class SimulationProgress :
+    """
+    Asynchronous iterator over the progress (percentage) of a simulation run with
+    simulate_script_async or simulate_async, which ends with the simulation.
+    
+    .. code:: python
+    
+        progress = SimulationProgress()
+        task = asyncio.create_task(simulate_async(system, t_sample, progress=progress))
+        async for p in progress :
+            print(p)
+        output = await task
+    """
+    
+    def __init__(self) :
+        """
+        constructor
+        """
+        
+        self._queue = asyncio.Queue()
+        self._value = 0
+        self._closed = False
+    
+    @property
+    def value(self) :
+        """
+        last reported progress (percentage).
+        """
+        
+        return self._value
+    
+    @property
+    def closed(self) :
+        """
+        True if the simulation is over (finished, failed or cancelled).
+        """
+        
+        return self._closed
+    
+    def push(self, value) :
+        """
+        Reports a new progress value. Should be called from the event loop thread.
+        """
+        
+        self._value = float(value)
+        self._queue.put_nowait(self._value)
+    
+    def close(self) :
+        """
+        Ends the iteration. Should be called from the event loop thread.
+        """
+        
+        if not self._closed :
+            self._closed = True
+            self._queue.put_nowait(None)
+    
+    def __aiter__(self) :
+        return self
+    
+    async def __anext__(self) :
+        value = await self._queue.get()
+        if value is None :
+            self._queue.put_nowait(None)
+            raise StopAsyncIteration
+        return value
+
+# asyncio locks of the engines sharing a state, per event loop
+_engine_locks = weakref.WeakKeyDictionary()
+
+def _get_engine_lock(loop, engine) :
+    key = engine.get_shared_state_key()
+    if key is None :
+        return asyncio.Lock()
+    locks = _engine_locks.setdefault(loop, {})
+    if key not in locks :
+        locks[key] = asyncio.Lock()
+    return locks[key]
+
+async def _run_in_executor(loop, executor, engine, function, *args) :
+    future = loop.run_in_executor(executor, function, *args)
+    try :
+        return await asyncio.shield(future)
+    except asyncio.CancelledError :
+        # the engine call must be over before the engine is finalized.
+        try :
+            engine.cancel()
+        except NotImplementedError :
+            pass
+        while not future.done() :
+            try :
+                await asyncio.shield(future)
+            except asyncio.CancelledError :
+                pass
+            except Exception :
+                pass
+        raise
+
+async def simulate_script_async(
+        script,
+        engine,
+        cgmap = None,
+        breathe_dt = 1000,
+        executor = None,
+        progress = None
+        ) :
+    """
+    Asynchronous version of simulate_script. The simulation is run by slices of *breathe_dt* ms
+    (see RDEngineBase.run) in an executor, so that the event loop keeps running between slices.
+    Cancelling the coroutine stops the simulation (see RDEngineBase.cancel), or at least at the end of the current slice.
+    Simulations with engines sharing a state (see RDEngineBase.get_shared_state_key), such as
+    the engines of engine_collection within a process, are run one after the other.
+
+    :param script: the script of the simulation to be run.
+    :type script: RDScript
+
+    :param engine: the simulation engine that should handle the simulation.
+    :type engine: RDSimulationEngineBase derived class
+    
+    :param cgmap: optionnal coarse graining index map.
+    :type cgmap: array of int or None
+    
+    :param breathe_dt: real time duration of a slice, in ms.
+    :type breathe_dt: int
+    
+    :param executor: executor in which the slices are run (None for the default executor of the event loop).
+    :type executor: concurrent.futures.Executor or None
+    
+    :param progress: optional object through which the progress is reported after each slice.
+    :type progress: SimulationProgress or None
+    
+    :return: system trajectory.
+    :rtype: RDTrajectory
+    """
+    
+    try :
+        if cgmap is not None :
+            cgscript = _coarsegrain_script(script, cgmap)
+            cgoutput = await simulate_script_async(cgscript, engine, None, breathe_dt, executor, progress)
+            return uncoarsegrain_trajectory(cgoutput, script.system, cgmap)
+        
+        loop = asyncio.get_running_loop()
+        async with _get_engine_lock(loop, engine) :
+            #initialization phase
+            res = await _run_in_executor(loop, executor, engine, engine.setup, script)
+            _check_setup(engine, res)
+            
+            try :
+                # loop phase
+                continue_simulation = True
+                while continue_simulation :
+                    continue_simulation = await _run_in_executor(loop, executor, engine, engine.run, breathe_dt)
+                    if progress is not None :
+                        progress.push(min(engine.get_progress(), 100))
+                
+                # output phase
+                output = await _run_in_executor(loop, executor, engine, engine.get_output)
+            finally :
+                engine.finalize()
+        
+        return output
+    finally :
+        if progress is not None :
+            progress.close()
+
+async def simulate_async(
+        system,
+        t_sample,
+        engine = None,
+        cgmap = None,
+        breathe_dt = 1000,
+        executor = None,
+        progress = None,
+        **script_keyword_arguments
+        ) :
+    """
+    Asynchronous version of simulate (see simulate_script_async).
+
+    :param engine: the simulation engine that should handle the simulation.
+        if None (default), engine_collection.default_engine() is used.
+    :type engine: RDSimulationEngineBase derived class
+    
+    :param cgmap: optionnal coarse graining index map.
+    :type cgmap: array of int or None
+    
+    :param breathe_dt: real time duration of a slice, in ms.
+    :type breathe_dt: int
+    
+    :param executor: executor in which the slices are run (None for the default executor of the event loop).
+    :type executor: concurrent.futures.Executor or None
+    
+    :param progress: optional object through which the progress is reported after each slice.
+    :type progress: SimulationProgress or None
+    
+    Other parameters corresond to the remaining RDScript properties, and have the same default values
+    as for simulate.
+
+    :return: system trajectory
+    :rtype: RDTrajectory
+    """
+
+    if engine is None :
+        engine = engine_collection.default_engine() 
+
+    d = dict(script_keyword_arguments)
+    d["system"] = system
+    d["t_sample"] = t_sample
+    
+    script = RDScript(**d)
+
+    return await simulate_script_async(script, engine, cgmap, breathe_dt, executor, progress)
@@ -0,0 +1,242 @@
+import time as python_time
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+from strengths.ode import build_ode_function
+from strengths.units import *
+from strengths.rdengine import *
+from strengths.rdoutput import RDTrajectory, cast_trajectory_data
+
+class SteadyStateEngine(RDEngineBase):
+    """
+    Engine computing the steady state of a deterministic reaction-diffusion system
+    instead of integrating its trajectory.
+
+    The stationary state is found by pseudo-transient continuation [1] on the right hand side *f*
+    of the system ODE (see strengths.ode.build_ode_function) : each iteration solves the linear system
+    (I/dtau - J) dx = f(x), J being the Jacobian of *f*, either with a sparse direct solver and the analytic
+    Jacobian of *f*, or with a Jacobian-free Krylov method [2] (GMRES). The pseudo time step dtau is increased
+    as the residual norm |f(x)| decreases, so that the method turns into Newton's method close to the solution.
+    Since each iteration is an implicit Euler step in pseudo-time, the quantities conserved by the
+    reactions and the diffusion are preserved, as well as the chemostats (whose derivatives are zero).
+
+    The output is a one-sample trajectory, sampled at t_max, with the convergence
+    diagnostics as RDTrajectory.diagnostics.
+    The sampling settings and stop conditions of the script are ignored.
+
+    :param rtol: relative tolerance on the residual norm, with respect to the initial residual norm.
+    :type rtol: float
+    :param atol: absolute tolerance on the residual norm, in quantity units per time units of the script units system.
+    :type atol: float
+    :param max_iterations: maximal number of iterations.
+    :type max_iterations: int
+    :param dtau0: initial pseudo time step, in time units of the script units system.
+        If None, it is chosen so that the first step changes the state by about 1%.
+    :type dtau0: float or None
+    :param linear_solver: "direct" for a sparse LU factorization of the analytic Jacobian,
+        or "gmres" for the Jacobian-free Newton-Krylov method.
+    :type linear_solver: str
+
+    References:
+
+    [1] Kelley, C. T., & Keyes, D. E. (1998). Convergence analysis of pseudo-transient continuation.
+    SIAM Journal on Numerical Analysis, 35(2), 508-523. https://doi.org/10.1137/S0036142996304796
+
+    [2] Knoll, D. A., & Keyes, D. E. (2004). Jacobian-free Newton-Krylov methods: a survey of approaches and applications.
+    Journal of Computational Physics, 193(2), 357-397. https://doi.org/10.1016/j.jcp.2003.08.010
+    """
+    def __init__(self, rtol=1e-10, atol=0, max_iterations=200, dtau0=None, linear_solver="direct"):
+        RDEngineBase.__init__(
+            self,
+            "",
+            "SteadyStateEngine"
+            )
+        self.rtol = rtol
+        self.atol = atol
+        self.max_iterations = max_iterations
+        self.dtau0 = dtau0
+        if linear_solver not in ["direct", "gmres"]:
+            raise ValueError("linear_solver must be \"direct\" or \"gmres\".")
+        self.linear_solver = linear_solver
+        self._cancel_requested = False
+        self._interrupted = False
+
+    def setup(self, script):
+        self._script = script.copy()
+        self._units_system = self._script.units_system.copy()
+        self._t_max = self._script.t_max.convert(self._units_system).value
+        self._ode_function, self._jac, jac_sparsity = build_ode_function(
+            self._script.system.copy(),
+            self._units_system,
+            jacobian = True
+            )
+        self._x = np.array(self._script.system.state.convert(self._units_system).value, dtype=float)
+        self._f = self._ode_function(0, self._x)
+        self._n_evaluations = 1
+        self._n_iterations = 0
+        self._n_rejected = 0
+        self._n_linear_iterations = 0
+        self._r0 = np.linalg.norm(self._f)
+        self._r = self._r0
+        self._pseudo_time = 0.
+        if self.dtau0 is not None:
+            self._dtau = self.dtau0
+        elif self._r0 > 0:
+            self._dtau = 1e-2*max(np.linalg.norm(self._x), 1e-12)/self._r0
+        else:
+            self._dtau = 1.
+        self._converged = self._r0 <= self._target()
+        self._cancel_requested = False
+        self._interrupted = False
+
+    def _target(self):
+        return self.atol + self.rtol*self._r0
+
+    def _jacobian_operator(self):
+        # finite difference approximation of J.v [2]
+        x = self._x
+        f = self._f
+        x_norm = np.linalg.norm(x)
+        def matvec(v):
+            v = np.ravel(v)
+            v_norm = np.linalg.norm(v)
+            if v_norm == 0:
+                return np.zeros_like(v)
+            eps = np.sqrt(np.finfo(float).eps)*(1 + x_norm)/v_norm
+            self._n_evaluations += 1
+            return (self._ode_function(0, x + eps*v) - f)/eps
+        return matvec
+
+    def _solve(self, dtau):
+        # solves (I/dtau - J) dx = f
+        n = len(self._x)
+        if self.linear_solver == "direct":
+            A = scipy.sparse.identity(n, format="csc")/dtau - self._jac(0, self._x).tocsc()
+            return scipy.sparse.linalg.spsolve(A, self._f)
+        jv = self._jacobian_operator()
+        counter = [0]
+        def callback(pr_norm):
+            counter[0] += 1
+        A = scipy.sparse.linalg.LinearOperator((n, n), matvec=lambda v: v/dtau - jv(v), dtype=float)
+        dx, info = scipy.sparse.linalg.gmres(A, self._f, callback=callback, callback_type="pr_norm")
+        self._n_linear_iterations += counter[0]
+        return dx
+
+    def _step(self):
+        dtau = self._dtau
+        x = self._x + np.atleast_1d(self._solve(dtau))
+        # steps leading to negative quantities are rejected
+        x_scale = np.max(np.abs(self._x)) if len(self._x) > 0 else 0
+        if not np.all(np.isfinite(x)) or np.min(x, initial=0) < -1e-12*x_scale:
+            self._n_rejected += 1
+            self._dtau /= 4
+            return
+        x = np.maximum(x, 0)
+        f = self._ode_function(0, x)
+        self._n_evaluations += 1
+        r = np.linalg.norm(f)
+        self._pseudo_time += dtau
+        # switched evolution relaxation, with a minimal growth of dtau
+        self._dtau = dtau*min(max(self._r/r, 2), 1e3) if r > 0 else dtau*1e3
+        self._x, self._f, self._r = x, f, r
+        self._n_iterations += 1
+        self._converged = r <= self._target()
+
+    def _ongoing(self):
+        return not self._converged and self._n_iterations + self._n_rejected < self.max_iterations
+
+    def run(self, breathe_dt):
+        t_start = python_time.time_ns()
+        self._interrupted = False
+        while self._ongoing():
+            if self._cancel_requested:
+                self._interrupted = True
+                return False
+            self._step()
+            if (python_time.time_ns()-t_start)/1e6 >= breathe_dt:
+                break
+        return self._ongoing()
+
+    def iterate(self):
+        if self._ongoing():
+            self._step()
+        return self._ongoing()
+
+    def iterate_n(self, n_iterations):
+        for i in range(n_iterations):
+            self.iterate()
+        return self._ongoing()
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def is_interrupted(self):
+        return self._interrupted
+
+    def is_complete(self):
+        return not self._ongoing()
+
+    def get_progress(self):
+        if not self._ongoing():
+            return 100
+        if self._r >= self._r0 or self._target() <= 0:
+            return 0
+        # fraction of the residual reduction achieved, on a logarithmic scale
+        return min(99, 100*np.log(self._r0/self._r)/np.log(self._r0/self._target()))
+
+    def get_time(self):
+        return UnitValue(self._t_max if self._converged else 0, Units(self._units_system, time_units_dimensions())).convert(self._script.units_system)
+
+    def sample(self):
+        pass
+
+    def get_diagnostics(self):
+        """
+        Returns the convergence diagnostics of the solver :
+
+        * "converged" : True if the residual norm is lower than atol + rtol*initial_residual
+        * "residual" : 2-norm of the system derivative at the returned state
+        * "initial_residual" : 2-norm of the system derivative at the initial state
+        * "iterations" : number of accepted iterations
+        * "rejected_iterations" : number of rejected iterations
+        * "linear_iterations" : total number of GMRES iterations (0 with the direct solver)
+        * "rhs_evaluations" : number of evaluations of the system derivative
+        * "pseudo_time" : pseudo time reached by the continuation (in time units of the script units system)
+
+        :rtype: dict
+        """
+
+        return {
+            "converged" : bool(self._converged),
+            "residual" : float(self._r),
+            "initial_residual" : float(self._r0),
+            "iterations" : self._n_iterations,
+            "rejected_iterations" : self._n_rejected,
+            "linear_iterations" : self._n_linear_iterations,
+            "rhs_evaluations" : self._n_evaluations,
+            "pseudo_time" : float(self._pseudo_time)
+            }
+
+    def get_output(self):
+        data = UnitArray(
+            cast_trajectory_data(self._x.copy(), self._script.storage_dtype),
+            Units(self._units_system, quantity_units_dimensions()),
+            check_value=False,
+            dtype=self._script.storage_dtype
+            )
+        output = RDTrajectory(
+            data = data,
+            t_sample = UnitArray(
+                [self._t_max],
+                Units(self._units_system, time_units_dimensions())
+                ),
+            system = self._script.system.copy(),
+            script = self._script.copy(),
+            engine_description = self.description,
+            engine_option = self.option,
+            diagnostics = self.get_diagnostics()
+            )
+        return output
+
+    def finalize(self):
+        pass
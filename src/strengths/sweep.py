@@ -0,0 +1,283 @@
+from strengths.units import *
+from strengths.rdscript import RDScript
+from strengths.rdoutput import save_rdtrajectory
+from strengths.parameters import apply_parameters, _split_parameter_name
+from strengths.typechecking import *
+from strengths import engine_collection
+
+import concurrent.futures
+import multiprocessing.util
+import itertools
+import os
+
+"""
+Module that implements parameter sweeps, in which variants of a simulation script
+are run concurrently on a pool of processes.
+"""
+
+# script properties that can be overridden in a sweep, in addition to the system parameters (see apply_parameters).
+_script_parameters = ["rng_seed", "time_step"]
+
+# system parameters that only change the initial state, and can thus be applied by resetting the engine.
+_state_parameters = ["state", "density"]
+
+def parameter_grid(grid) :
+    """
+    Returns the list of all the combinations of the parameter values of a grid.
+    
+    .. code:: python
+    
+        parameter_grid({"kf:0" : [1, 2], "rng_seed" : [0, 1]})
+        
+        # returns
+        
+        [{"kf:0" : 1, "rng_seed" : 0}, 
+         {"kf:0" : 1, "rng_seed" : 1}, 
+         {"kf:0" : 2, "rng_seed" : 0}, 
+         {"kf:0" : 2, "rng_seed" : 1}]
+    
+    :param grid: values taken by each parameter.
+    :type grid: dict of lists
+    :rtype: list of dict
+    """
+    
+    if not isdict(grid) :
+        raise TypeError("grid must be a dict.")
+    
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+def estimate_cost(script) :
+    """
+    Returns a rough estimate of the computational cost of a script (arbitrary units),
+    used to start the longest runs first in a sweep.
+    It is proportional to the number of time steps and to the size of the system state.
+    
+    :param script: simulation script.
+    :type script: RDScript
+    :rtype: float
+    """
+    
+    t_max = script.t_max.convert(script.units_system).value
+    time_step = 0 if script.time_step == "auto" else script.time_step.convert(script.units_system).value
+    n_steps = t_max/time_step if time_step > 0 else 1
+    return float(max(n_steps, 1)*script.system.state_size())
+
+def make_sweep_script(script, overrides) :
+    """
+    Returns a copy of a script to which parameter overrides are applied.
+    overrides can contain the "rng_seed" and "time_step" script properties as well as 
+    any system parameter accepted by apply_parameters.
+    
+    :param script: base simulation script. it is left unchanged.
+    :type script: RDScript
+    :param overrides: parameter values.
+    :type overrides: dict
+    :rtype: RDScript
+    """
+    
+    if not isdict(overrides) :
+        raise TypeError("overrides must be a dict.")
+    
+    script = script.copy()
+    system_parameters = {}
+    for name in overrides :
+        if name in _script_parameters :
+            setattr(script, name, overrides[name])
+        else :
+            system_parameters[name] = overrides[name]
+    
+    if len(system_parameters) > 0 :
+        script.system = apply_parameters(script.system, system_parameters)
+    return script
+
+class SweepResult :
+    """
+    Results of a parameter sweep, indexed as the overrides given to run_sweep.
+    
+    :param overrides: parameter values of each run.
+    :type overrides: list of dict
+    :param outputs: trajectory of each run, or the path of the file it has been saved to.
+    :type outputs: list of RDTrajectory or list of str
+    """
+    
+    def __init__(self, overrides, outputs) :
+        """
+        constructor
+        """
+        
+        self._overrides = [dict(o) for o in overrides]
+        self._outputs = list(outputs)
+    
+    @property
+    def overrides(self) :
+        """
+        parameter values of each run.
+        """
+        
+        return self._overrides
+    
+    @property
+    def outputs(self) :
+        """
+        trajectory of each run, or the path of the file it has been saved to.
+        """
+        
+        return self._outputs
+    
+    def to_table(self) :
+        """
+        Returns the results as a table (dict of columns), with an "index" column,
+        one column per parameter (None where a run does not override it), and an "output" column.
+        
+        :rtype: dict of lists
+        """
+        
+        names = []
+        for o in self.overrides :
+            for name in o :
+                if name not in names :
+                    names.append(name)
+        
+        table = {"index" : list(range(len(self)))}
+        for name in names :
+            table[name] = [o.get(name, None) for o in self.overrides]
+        table["output"] = list(self.outputs)
+        return table
+    
+    def __len__(self) :
+        return len(self._outputs)
+    
+    def __getitem__(self, index) :
+        return self._overrides[index], self._outputs[index]
+
+# state of a sweep worker process
+_worker = {}
+
+def _init_worker(script, engine_factory) :
+    _worker["script"] = script
+    _worker["engine"] = engine_factory()
+    _worker["setup_key"] = None
+    # the last simulation is freed when the worker process exits
+    multiprocessing.util.Finalize(None, _finalize_worker, exitpriority=10)
+
+def _finalize_worker() :
+    # frees the simulation kept set up by the worker, if any.
+    if _worker.get("setup_key") is not None :
+        _worker["setup_key"] = None
+        _worker["engine"].finalize()
+
+def _setup_key(overrides) :
+    # overrides that require the engine to be set up again (the others can be applied with a reset).
+    key = []
+    for name in sorted(overrides) :
+        kind, target = _split_parameter_name(name)
+        if name != "rng_seed" and kind not in _state_parameters :
+            key.append((name, repr(overrides[name])))
+    return tuple(key)
+
+def _run_worker(index, overrides, output_dir) :
+    engine = _worker["engine"]
+    script = make_sweep_script(_worker["script"], overrides)
+    key = _setup_key(overrides)
+    
+    completed = False
+    try :
+        reset = False
+        if key == _worker["setup_key"] :
+            try :
+                engine.reset(rng_seed=script.rng_seed, state=script.system.state)
+                reset = True
+            except NotImplementedError :
+                pass
+        if not reset :
+            # the simulation of the previous run is freed before the new one is set up
+            _finalize_worker()
+            # set before the setup, so that a partially set up simulation is freed as well
+            _worker["setup_key"] = key
+            res = engine.setup(script)
+            if res is not None and res != 0 :
+                raise RuntimeError("engine setup failed (code "+str(res)+").")
+        
+        while engine.run(1000) :
+            pass
+        output = engine.get_output()
+        completed = True
+    finally :
+        # after a failure, the engine state is not reused by the next runs
+        if not completed :
+            _finalize_worker()
+    
+    if isnone(output_dir) :
+        return index, output
+    
+    path = os.path.join(output_dir, "run_"+str(index)+".json")
+    save_rdtrajectory(output, path)
+    return index, path
+
+def run_sweep(
+        script,
+        overrides,
+        engine = None,
+        max_workers = None,
+        output_dir = None,
+        cost = None
+        ) :
+    """
+    Runs variants of a simulation script on a pool of processes.
+    Each worker process loads the engine once and keeps the simulation set up between 
+    its runs : when two successive runs only differ by their rng seed or initial state,
+    the engine is reset instead of being set up again.
+    The runs are started from the most to the least expensive, so that long runs do not
+    end up alone at the end of the sweep.
+    
+    .. code:: python
+    
+        from strengths.sweep import run_sweep, parameter_grid
+        
+        res = run_sweep(script, parameter_grid({"kf:0" : [1, 2, 4], "rng_seed" : range(10)}), max_workers=4)
+    
+    :param script: base simulation script.
+    :type script: RDScript
+    :param overrides: parameter values of each run (see make_sweep_script).
+    :type overrides: list of dict
+    :param engine: function returning the engine to be used, called once in each worker
+        (ie. engine_collection.euler_engine). if None, engine_collection.default_engine is used.
+    :type engine: callable or None
+    :param max_workers: number of worker processes. if None, the number of processors is used.
+    :type max_workers: int or None
+    :param output_dir: if not None, each trajectory is saved in the directory (as run_<index>.json,
+        see save_rdtrajectory) by the worker, and only its path is returned.
+    :type output_dir: str or None
+    :param cost: function returning the estimated cost of a script. if None, estimate_cost is used.
+    :type cost: callable or None
+    :rtype: SweepResult
+    """
+    
+    if type(script) != RDScript :
+        raise TypeError("script must be a RDScript.")
+    if engine is None :
+        engine = engine_collection.default_engine
+    if cost is None :
+        cost = estimate_cost
+    
+    overrides = [dict(o) for o in overrides]
+    if not isnone(output_dir) :
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # longest runs first
+    costs = [cost(make_sweep_script(script, o)) for o in overrides]
+    order = sorted(range(len(overrides)), key=lambda i : -costs[i])
+    
+    outputs = [None for o in overrides]
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers = max_workers, 
+            initializer = _init_worker, 
+            initargs = (script, engine)
+            ) as executor :
+        futures = [executor.submit(_run_worker, i, overrides[i], output_dir) for i in order]
+        for future in concurrent.futures.as_completed(futures) :
+            index, output = future.result()
+            outputs[index] = output
+    
+    return SweepResult(overrides, outputs)
@@ -1322,9 +1322,11 @@ class UnitArray :
     :type value: array of number and/or UnitArray with the same unit dimensions
     :param units: units of the variable
     :type units: Units or str
+    :param dtype: numpy data type of the values (default = float).
+    :type dtype: numpy dtype or str
     """
 
-    def __init__(self, value, units=None, check_value=True, convert=True) :
+    def __init__(self, value, units=None, check_value=True, convert=True, dtype=float) :
         """
         constructor
         """
@@ -1344,12 +1346,12 @@ class UnitArray :
             else :
                 self.units = units
             
-            self.set_value(value, check=check_value)  
+            self.set_value(value, check=check_value, dtype=dtype)  
          
         elif type(value) == UnitArray :
             if isnone (units): # no units
                 self.units = value.units
-                self.set_value(value.value, check=False)
+                self.set_value(value.value, check=False, dtype=dtype)
             else :
                 if convert : #units compatibility check is done in the conversion
                     value = value.convert(units)
@@ -1357,7 +1359,7 @@ class UnitArray :
                     if value.units.dim != units.dim : 
                         raise ValueError("the value "+str(value)+" and the units " + str(units)+ " have incompatble dimensions.")
                 self.units = value.units
-                self.set_value(value.value, check=False)
+                self.set_value(value.value, check=False, dtype=dtype)
         else :
             raise TypeError("unsupported value type.")
             
@@ -1407,7 +1409,7 @@ class UnitArray :
 
         return str(self.value) + " " + str(self.units)
 
-    def set_value(self, v, check=True) :
+    def set_value(self, v, check=True, dtype=float) :
         """
         Sets the value property of the UnitArray.
 
@@ -1426,10 +1428,12 @@ class UnitArray :
         :param check: tells if v should be checked or not. Can be set to False if one is sure that v is an array
             of numbers, without UnitValues or strings.
         :type check: bool
+        :param dtype: numpy data type of the values (default = float).
+        :type dtype: numpy dtype or str
         """
 
         if not check :
-            self._value = np.array(v, dtype=float)
+            self._value = np.array(v, dtype=dtype)
         else :
             if isarray(v) :
                 self._value = np.array(v)
@@ -1447,7 +1451,7 @@ class UnitArray :
                         self._value[i] = self._value[i].value
                     elif isnumber(self._value[i]) :
                         pass
-                self._value = np.array(self._value, dtype=float)
+                self._value = np.array(self._value, dtype=dtype)
             else :
                 raise ValueError("UnitArray's value must be an array.")
 
@@ -0,0 +1,66 @@
+import sys
+sys.path.append("../src/")
+from strengths import *
+from strengths.cluster import *
+import multiprocessing
+import numpy
+
+def make_script(seed=0) :
+    rds = rdsystem_from_dict({
+        "network" : {
+            "species" : [
+                {"label" : "A", "density" : 1000, "D" : 1}, 
+                {"label" : "B"}
+                ], 
+            "reactions" : [
+                {"eq" : "A -> B", "k+" : 1, "k-" : 1}
+                ]
+            },
+        "space" : {"w" : 3, "h" : 1, "d" : 1}
+        })
+    return RDScript(rds, t_sample=numpy.linspace(0, 10, 11), time_step=0.01, rng_seed=seed)
+
+def run_workers(address, n) :
+    # the engines of a process share the same library state, hence one process per worker.
+    workers = [multiprocessing.Process(target=run_worker, args=(address,), kwargs={"poll_interval" : 0.1}) for i in range(n)]
+    for w in workers :
+        w.start()
+    return workers
+
+def test_cluster() :
+    jobs = [make_script(i) for i in range(4)] + [{"script" : make_script(1), "engine" : "euler"}]
+    coordinator = Coordinator(jobs, "127.0.0.1:0", engine="tauleap")
+    coordinator.start()
+    workers = run_workers(coordinator.address, 2)
+    results = coordinator.wait(timeout=120)
+    for w in workers :
+        w.join()
+    coordinator.stop()
+    
+    assert results is not None
+    assert [r["status"] for r in results] == ["done"]*5
+    for i in range(4) :
+        output = rdtrajectory_from_dict(results[i]["result"])
+        ref = simulate_script(make_script(i), tauleap_engine())
+        assert numpy.array_equal(output.data.value, ref.data.value)
+    output = rdtrajectory_from_dict(results[4]["result"])
+    ref = simulate_script(make_script(1), euler_engine())
+    assert numpy.array_equal(output.data.value, ref.data.value)
+
+def test_cluster_output_dir(tmp_path) :
+    coordinator = Coordinator([make_script(0)], "127.0.0.1:0", engine="euler")
+    coordinator.start()
+    run_worker(coordinator.address, output_dir=str(tmp_path))
+    results = coordinator.wait(timeout=60)
+    coordinator.stop()
+    assert load_rdtrajectory(results[0]["result"]).nsamples() == 11
+
+def test_cluster_retries() :
+    coordinator = Coordinator([{"script" : make_script(0), "engine" : "unknown"}], "127.0.0.1:0", retries=1)
+    coordinator.start()
+    assert run_worker(coordinator.address) == 2
+    results = coordinator.wait(timeout=60)
+    coordinator.stop()
+    assert results[0]["status"] == "failed"
+    assert results[0]["attempts"] == 2
+    assert "unknown engine" in results[0]["error"]
@@ -0,0 +1,39 @@
+import sys
+sys.path.append("../src/")
+from strengths import *
+import numpy
+import pytest
+
+def make_rds() :
+    return rdsystem_from_dict({
+        "network" : {
+            "species" : [
+                {"label" : "A", "density" : 1, "D" : 1}, 
+                {"label" : "B"}
+                ], 
+            "reactions" : [
+                {"eq" : "A -> B", "k+" : 1, "k-" : 1, "label" : "r1"}
+                ]
+            },
+        "space" : {"w" : 3, "h" : 1, "d" : 1}
+        })
+
+def test_apply_parameters() :
+    rds = make_rds()
+    rds2 = apply_parameters(rds, {"kf:r1" : 2, "kr:0" : "3 s-1", "D:A" : 0.5, "density:B" : 2})
+    
+    assert rds.network.reactions[0].kf.value == 1
+    assert rds2.network.reactions[0].kf.value == 2
+    assert rds2.network.reactions[0].kr.value == 3
+    assert rds2.network.species[0].D.value == 0.5
+    assert numpy.allclose(rds2.state.value[3:], 2*rds2.state.value[:3])
+    
+    rds3 = apply_parameters(rds, {"state" : [1, 2, 3, 4, 5, 6]})
+    assert numpy.array_equal(rds3.state.value, [1, 2, 3, 4, 5, 6])
+    
+    with pytest.raises(ValueError) :
+        apply_parameters(rds, {"kf:r2" : 1})
+    with pytest.raises(ValueError) :
+        apply_parameters(rds, {"k:r1" : 1})
+    with pytest.raises(ValueError) :
+        apply_parameters(rds, {"state" : [1, 2]})
@@ -4,6 +4,8 @@ import ctypes
 sys.path.append("../src/")
 from strengths import *
 from strengths.librdengine import *
+from strengths.rdoutput import cast_trajectory_data
+import pytest
 
 def test_get_sample_index() :
     script = RDScript(
@@ -132,3 +134,41 @@ def test_get_sample_index() :
     assert out.get_sample_index("4000 ms", policy="infeq")                    == 2
     assert out.get_sample_index("10010 ms", policy="infeq")                   == 3
     assert out.get_sample_index("10000000000000000 ms", policy="infeq")       == 3
+
+def test_cast_trajectory_data() :
+    a = cast_trajectory_data([0.2, 1.5, 2.7], "uint16")
+    assert a.dtype == numpy.uint16
+    assert list(a) == [0, 2, 3]
+    a = cast_trajectory_data([1, 2, 3], "float32")
+    assert a.dtype == numpy.float32
+    with pytest.raises(OverflowError) :
+        cast_trajectory_data([70000], "uint16")
+    with pytest.raises(OverflowError) :
+        cast_trajectory_data([-1], "uint32")
+    with pytest.raises(OverflowError) :
+        cast_trajectory_data([1e40], "float32")
+
+def test_save_load_rdtrajectory_storage_dtype() :
+    script = RDScript(
+        RDSystem(
+            RDNetwork(
+                species=[Species("A")],
+                reactions=[]
+                )
+            ),
+        [1,2,3,4],
+        storage_dtype = "uint16"
+        )
+    out = RDTrajectory(UnitArray([1,2,3,4], "molecule", dtype="uint16"), UnitArray([1, 2, 3, 10], "s"), system=script.system, script=script, engine_description="", engine_option="")
+    assert out.data.value.dtype == numpy.uint16
+    
+    save_rdtrajectory(out, "test_output_files/out_dtype.json")
+    out2 = load_rdtrajectory("test_output_files/out_dtype.json")
+    assert out2.data.value.dtype == numpy.uint16
+    assert list(out2.data.value) == [1,2,3,4]
+    assert out2.script.storage_dtype == "uint16"
+
+    save_rdtrajectory(out, "test_output_files/out_dtype.json", separate_data=False)
+    out2 = load_rdtrajectory("test_output_files/out_dtype.json")
+    assert out2.data.value.dtype == numpy.uint16
+    assert list(out2.data.value) == [1,2,3,4]
@@ -1,4 +1,5 @@
 import sys
+import numpy
 sys.path.append("../src/")
 from strengths import *
 from strengths.constants import avogadro_number
@@ -361,4 +362,15 @@ def test_rdnetwork_apply_reaction__graph():
     _test_rdnetwork_apply_reaction("graph")
 
 def test_rdnetwork_apply_reaction__grid():
-    _test_rdnetwork_apply_reaction("grid")
\ No newline at end of file
+    _test_rdnetwork_apply_reaction("grid")
+def test_load_state_npy_int(tmp_path) :
+    path = str(tmp_path / "state.npy")
+    numpy.save(path, numpy.array([1, 2, 3], dtype="int64"))
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A"}], "reactions":[]},
+        "space" : {"w" : 3, "h" : 1, "d" : 1},
+        "state" : {"value" : path, "units" : "molecule"}
+        })
+    assert rds.state.value.dtype == numpy.float64
+    rds.set_state("A", 0, 2.7)
+    assert list(rds.state.value) == [2.7, 2.0, 3.0]
@@ -2,6 +2,15 @@ import sys
 import numpy
 sys.path.append("../src/")
 from strengths import *
+from strengths.rdengine import RDEngineBase
+from strengths.scipyrdengine import ScipyRDEngine
+from strengths.steadystateengine import SteadyStateEngine
+from strengths.ode import build_ode_function
+from strengths.coarsegrain import grid_to_graph, coarsegrain_system
+import pytest
+import scipy.integrate
+import asyncio
+import threading
 
 def generate_rds() :
     rds = {
@@ -53,3 +62,734 @@ def test_output_traj_t0_matching_system_state() :
     out = simulate(rds, t_sample=UnitArray(np.linspace(0, 100, 100), "s"), time_step=0.1, units_system=UnitsSystem(quantity="µmol", time="ms", space="m"))
     assert numpy.allclose(list(out.data.value[0:out.system.state_size()]), 
                           list(out.system.state.convert("µmol").value))
+
+def test_on_change_sampling() :
+    rds = generate_rds()
+    for engine in [euler_engine(), ScipyRDEngine()] :
+        out = simulate(rds, t_sample=[0, 100], time_step=0.01, engine=engine, 
+                       sampling_policy="on_change", sampling_rtol=0.05)
+        # sampled at t=0, then only while the system is relaxing
+        assert out.t.value[0] == 0
+        assert out.nsamples() > 2
+        assert out.t.value[-1] < 50
+        x = out.data.value.reshape((out.nsamples(), out.system.state_size()))
+        for n in range(1, out.nsamples()-1) :
+            assert numpy.linalg.norm(x[n+1]-x[n]) > 0.05*numpy.linalg.norm(x[n])
+        
+        out = simulate(rds, t_sample=[0, 100], time_step=0.01, engine=engine, 
+                       sampling_policy="on_change", sampling_rtol=0.05, sampling_max_gap=10)
+        assert out.t.value[-1] > 90
+        
+        out = simulate(rds, t_sample=[0, 100], time_step=0.01, engine=engine, 
+                       sampling_policy="on_change", sampling_rtol=0, sampling_atol=100, sampling_observables=["B"])
+        b = out.get_trajectory("B", merge=True).value
+        assert numpy.all(numpy.abs(numpy.diff(b)) > 100)
+
+def test_on_change_sampling_script_validation() :
+    rds = generate_rds()
+    with pytest.raises(ValueError) :
+        RDScript(rds, [0, 1], sampling_policy="on_change", sampling_observables=["C"])
+    with pytest.raises(ValueError) :
+        RDScript(rds, [0, 1], sampling_policy="on_change", sampling_rtol=-1)
+    with pytest.raises(ValueError) :
+        RDScript(rds, [0, 1], sampling_policy="on_change", sampling_max_gap=0)
+    script = RDScript(rds, [0, 1], sampling_policy="on_change", sampling_max_gap=2, sampling_observables="A")
+    script2 = rdscript_from_dict(rdscript_to_dict(script))
+    assert script2.sampling_policy == "on_change"
+    assert script2.sampling_observables == ["A"]
+    assert script2.sampling_max_gap.value == 2
+
+def test_storage_dtype() :
+    rds = generate_rds()
+    for engine in [euler_engine(), ScipyRDEngine(), tauleap_engine()] :
+        ref = simulate(rds, t_sample=numpy.linspace(0, 10, 11), time_step=0.01, engine=engine, rng_seed=1)
+        for dtype in ["float32", "uint16", "uint32", "int32"] :
+            out = simulate(rds, t_sample=numpy.linspace(0, 10, 11), time_step=0.01, engine=engine, rng_seed=1, storage_dtype=dtype)
+            assert out.data.value.dtype == numpy.dtype(dtype)
+            assert numpy.allclose(out.data.value, ref.data.value, atol=0.5, rtol=1e-6)
+    
+    rds.set_state("A", 0, 100000)
+    with pytest.raises(OverflowError) :
+        simulate(rds, t_sample=[0, 1], engine=tauleap_engine(), storage_dtype="uint16", time_step=0.01)
+
+def test_checkpoint_resume(tmp_path) :
+    rds = generate_rds()
+    path = str(tmp_path / "checkpoint.bin")
+    for engine in [euler_engine(), tauleap_engine(), gillespie_engine(), rk45_engine()] :
+        script = RDScript(rds, t_sample=numpy.linspace(0, 10, 11), time_step=0.01, rng_seed=3)
+        ref = simulate_script(script, engine)
+        
+        # interrupted run
+        engine.setup(script)
+        engine.iterate_n(500)
+        engine.checkpoint(path)
+        engine.finalize()
+        
+        out = simulate_script(script, engine, resume=path)
+        assert numpy.array_equal(out.t.value, ref.t.value)
+        assert numpy.array_equal(out.data.value, ref.data.value)
+    
+    with pytest.raises(ValueError) :
+        other = rdsystem_from_dict({"network" : {"species" : [{"label" : "A"}], "reactions" : []}, "space" : {"w" : 2, "h" : 1, "d" : 1}})
+        simulate_script(RDScript(other, t_sample=[0, 1]), euler_engine(), resume=path)
+
+def test_checkpoint_resume_stop_conditions(tmp_path) :
+    rds = generate_rds()
+    path = str(tmp_path / "checkpoint.bin")
+    conditions = [
+        {"type" : "steady_state", "rtol" : 1e-4, "interval" : 1},
+        {"type" : "rel_change", "species" : "B", "value" : 1e-6, "interval" : 2}
+        ]
+    for engine, t_max, condition in [
+            (euler_engine(), 100, conditions),
+            (tauleap_engine(), 1000, {"type" : "steady_state", "rtol" : 0.05, "interval" : 10})
+            ] :
+        script = RDScript(rds, t_sample=numpy.linspace(0, t_max, 101), time_step=0.01, rng_seed=3, stop_conditions=condition)
+        ref = simulate_script(script, engine)
+        assert ref.stop_condition == 0
+        
+        # interrupted in the middle of a steady state window
+        engine.setup(script)
+        engine.iterate_n(450)
+        engine.checkpoint(path)
+        engine.finalize()
+        
+        out = simulate_script(script, engine, resume=path)
+        assert out.stop_condition == ref.stop_condition
+        assert out.t_stop.value == ref.t_stop.value
+        assert numpy.array_equal(out.data.value, ref.data.value)
+
+def test_engine_reset() :
+    rds = generate_rds()
+    for engine in [euler_engine(), tauleap_engine(), gillespie_engine(), rk45_engine()] :
+        script = RDScript(rds, t_sample=numpy.linspace(0, 10, 11), time_step=0.01, rng_seed=1)
+        engine.setup(script)
+        while engine.run(1000) : pass
+        
+        for seed in [1, 2] :
+            engine.reset(rng_seed=seed)
+            while engine.run(1000) : pass
+            out = engine.get_output()
+            
+            script.rng_seed = seed
+            ref = simulate_script(script, engine)
+            engine.setup(script)
+            assert numpy.array_equal(out.data.value, ref.data.value)
+            assert out.script.rng_seed == seed
+        
+        other = rds.copy()
+        other.set_state("A", 0, 500)
+        engine.reset(rng_seed=1, state=other.state)
+        while engine.run(1000) : pass
+        out = engine.get_output()
+        engine.finalize()
+        ref = simulate_script(RDScript(other, t_sample=numpy.linspace(0, 10, 11), time_step=0.01, rng_seed=1), engine)
+        assert numpy.array_equal(out.data.value, ref.data.value)
+
+def test_simulate_ensemble() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 10, 11)
+    for engine in [tauleap_engine(), gillespie_engine(), ScipyRDEngine()] :
+        ens = simulate_ensemble(rds, t_sample, 6, engine=engine, n_threads=3, time_step=0.01, rng_seed=5)
+        assert len(ens) == 6
+        assert ens.get_array().shape == (6, ens.nsamples(), 2, 1)
+        assert len(set(ens.seeds)) == 6
+        
+        # each replicate matches a simple simulation with its seed
+        for i in [0, 5] :
+            ref = simulate(rds, t_sample, engine=engine, time_step=0.01, rng_seed=ens.seeds[i])
+            assert numpy.array_equal(ens[i].data.value, ref.data.value)
+            assert ens[i].script.rng_seed == ens.seeds[i]
+    
+    with pytest.raises(ValueError) :
+        simulate_ensemble(rds, t_sample, 2, engine=euler_engine(), sampling_policy="on_iteration")
+
+def test_simulate_batch() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 10, 11)
+    table = {"kf:0" : [0.5, 1, 2], "state" : [[1000, 0], [500, 0], [1000, 100]]}
+    
+    for engine in [euler_engine(), tauleap_engine()] :
+        batch = simulate_batch(rds, table, t_sample, engine=engine, time_step=0.01, rng_seed=1)
+        assert len(batch) == 3
+        assert batch.get_array().shape == (3, batch.nsamples(), 2, 1)
+        
+        for i in range(3) :
+            ref = simulate(apply_parameters(rds, batch.parameters[i]), t_sample, engine=engine, time_step=0.01, rng_seed=1)
+            assert numpy.array_equal(batch[i].data.value, ref.data.value)
+            assert numpy.allclose(batch[i].t.value, ref.t.value)
+    
+    with pytest.raises(ValueError) :
+        simulate_batch(rds, table, t_sample, sampling_policy="on_iteration")
+
+class FailingSetupEngine(RDEngineBase) :
+    def __init__(self) :
+        super().__init__("invalid", "FailingSetupEngine")
+    
+    def setup(self, script) :
+        return 1
+
+def test_setup_failure() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 10, 11)
+    
+    with pytest.raises(Exception, match="Invalid option argument") :
+        simulate_ensemble(rds, t_sample, 2, engine=FailingSetupEngine())
+    with pytest.raises(Exception, match="Invalid option argument") :
+        simulate_batch(rds, {"kf:0" : [0.5, 1]}, t_sample, engine=FailingSetupEngine())
+
+def test_simulate_async() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 10, 11)
+    
+    async def run() :
+        progress = SimulationProgress()
+        tasks = [
+            asyncio.create_task(simulate_async(rds, t_sample, engine=euler_engine(), time_step=0.01, breathe_dt=1, progress=progress)),
+            asyncio.create_task(simulate_async(rds, t_sample, engine=tauleap_engine(), time_step=0.01, rng_seed=1)),
+            asyncio.create_task(simulate_async(rds, t_sample, engine=ScipyRDEngine(), time_step=0.01))
+            ]
+        values = [p async for p in progress]
+        return values, await asyncio.gather(*tasks)
+    
+    values, outputs = asyncio.run(run())
+    assert values[-1] == 100
+    assert numpy.array_equal(outputs[0].data.value, simulate(rds, t_sample, engine=euler_engine(), time_step=0.01).data.value)
+    assert numpy.array_equal(outputs[1].data.value, simulate(rds, t_sample, engine=tauleap_engine(), time_step=0.01, rng_seed=1).data.value)
+    assert outputs[2].nsamples() > 0
+    
+def test_simulate_async_cancel() :
+    rds = generate_rds()
+    
+    async def run() :
+        progress = SimulationProgress()
+        task = asyncio.create_task(simulate_async(rds, [0, 1e9], engine=gillespie_engine(), breathe_dt=10, progress=progress))
+        async for p in progress :
+            task.cancel()
+        with pytest.raises(asyncio.CancelledError) :
+            await task
+        assert progress.closed
+        
+    asyncio.run(run())
+    # the engine is left in a usable state
+    out = simulate(rds, [0, 1], engine=gillespie_engine())
+    assert out.nsamples() == 2
+
+def test_wall_time_limit() :
+    rds = generate_rds()
+    
+    # the deadline is reached from the start : the engine stops at its first check, long before t = 1e6
+    out = simulate(rds, numpy.linspace(0, 1e9, 1001), engine=gillespie_engine(), wall_time_limit=0)
+    assert out.nsamples() == 1
+    assert len(out.t) == 1
+    
+    out = simulate(rds, numpy.linspace(0, 10, 11), engine=euler_engine(), time_step=0.01, wall_time_limit=60)
+    assert out.nsamples() == 11
+
+def test_wall_time_limit_checkpoint(tmp_path) :
+    rds = generate_rds()
+    path = str(tmp_path / "checkpoint.bin")
+    
+    for engine in [euler_engine(), tauleap_engine()] :
+        script = RDScript(rds, t_sample=numpy.linspace(0, 1000, 11), time_step=0.01, rng_seed=1)
+        ref = simulate_script(script, engine)
+        
+        # the state of the stopped simulation is saved, even though the checkpoint interval is not reached
+        out = simulate_script(script, engine, checkpoint=path, checkpoint_interval=1e9, wall_time_limit=0)
+        assert out.nsamples() < ref.nsamples()
+        
+        out = simulate_script(script, engine, resume=path)
+        assert numpy.array_equal(out.t.value, ref.t.value)
+        assert numpy.array_equal(out.data.value, ref.data.value)
+
+class CancellingObserver(SimulationObserver) :
+    # requests the cancellation of the engine from another thread when first notified,
+    # ie. before the first run call.
+    def __init__(self, engine) :
+        super().__init__(breathe_dt=1000)
+        self.engine = engine
+    
+    def on_progress(self, t, progress) :
+        thread = threading.Thread(target=self.engine.cancel)
+        thread.start()
+        thread.join()
+        return False
+
+def test_cancel() :
+    rds = generate_rds()
+    engine = gillespie_engine()
+    out = simulate(rds, numpy.linspace(0, 1e9, 1001), engine=engine, observer=CancellingObserver(engine))
+    assert engine.is_interrupted()
+    assert out.nsamples() == 1
+    
+    # the request does not outlive the simulation
+    out = simulate(rds, numpy.linspace(0, 10, 11), engine=engine)
+    assert out.nsamples() == 11
+
+class RecordingObserver(SimulationObserver) :
+    def __init__(self, t_stop=None) :
+        super().__init__(breathe_dt=1)
+        self.t_stop = t_stop
+        self.progress = []
+        self.t = []
+        self.data = []
+        
+    def on_progress(self, t, progress) :
+        self.progress.append(progress)
+        return False
+    
+    def on_samples(self, t_chunk, data_chunk) :
+        self.t.append(t_chunk.value)
+        self.data.append(data_chunk.value)
+        return self.t_stop is not None and t_chunk.value[-1] >= self.t_stop
+
+def stepping_engine(engine, n_iterations) :
+    # makes each run call perform n_iterations iterations instead of running for a real time duration,
+    # so that the observers are notified at the same simulation times whatever the machine speed.
+    engine.run = lambda breathe_dt : engine.iterate_n(n_iterations)
+    return engine
+
+def test_observer() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 100, 1001)
+    
+    for engine in [euler_engine(), tauleap_engine(), ScipyRDEngine()] :
+        observer = RecordingObserver()
+        out = simulate(rds, t_sample, engine=engine, time_step=0.01, rng_seed=1, observer=observer)
+        assert observer.progress[-1] == 100
+        assert numpy.array_equal(numpy.concatenate(observer.t), out.t.value)
+        assert numpy.array_equal(numpy.concatenate(observer.data), out.data.value)
+    
+    # the runs are 0.73 long : the observer stops the simulation after the run ending at t = 14*0.73 = 10.22
+    observer = RecordingObserver(t_stop=10)
+    out = simulate(rds, t_sample, engine=stepping_engine(euler_engine(), 73), time_step=0.01, observer=observer)
+    assert len(observer.progress) == 15
+    assert out.nsamples() == 103
+    assert 10.2 <= out.t.value[-1] <= 10.22+1e-9
+
+def test_stop_conditions() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 100, 1001)
+    
+    # B(t) = 500*(1-exp(-2t)) reaches 400 at t = ln(5)/2
+    conditions = [{"type" : "above", "species" : "A", "value" : 2000}, {"type" : "above", "species" : "B", "value" : 400}]
+    out = simulate(rds, t_sample, engine=euler_engine(), time_step=0.001, stop_conditions=conditions)
+    assert out.stop_condition == 1
+    assert abs(out.t_stop.value - numpy.log(5)/2) < 0.01
+    assert out.nsamples() == 9
+    
+    # the integrator stops at the end of the step during which the condition is met
+    out = simulate(rds, t_sample, engine=ScipyRDEngine(), stop_conditions=conditions)
+    assert out.stop_condition == 1
+    assert abs(out.t_stop.value - numpy.log(5)/2) < 0.1
+    
+    for engine in [tauleap_engine(), gillespie_engine()] :
+        out = simulate(rds, t_sample, engine=engine, time_step=0.001, rng_seed=1, stop_conditions={"type" : "below", "species" : "A", "value" : 600})
+        assert out.stop_condition == 0
+        assert abs(out.t_stop.value - numpy.log(5)/2) < 0.2
+    
+    out = simulate(rds, t_sample, engine=euler_engine(), time_step=0.01, stop_conditions={"type" : "rel_change", "species" : "B", "value" : 1e-3, "interval" : 1})
+    assert out.stop_condition == 0
+    assert out.t_stop.value < 10
+    
+    out = simulate(rds, t_sample, engine=euler_engine(), time_step=0.01, stop_conditions={"type" : "above", "value" : 2000})
+    assert out.stop_condition is None
+    assert out.nsamples() == 1001
+    
+    d = rdtrajectory_to_dict(simulate(rds, t_sample, engine=euler_engine(), stop_conditions=conditions))
+    assert rdtrajectory_from_dict(d).stop_condition == 1
+    
+    with pytest.raises(ValueError) :
+        RDScript(rds, t_sample, stop_conditions={"type" : "above", "species" : "C", "value" : 1})
+
+def test_stop_conditions_region() :
+    rds = rdsystem_from_dict({
+        "network" : {
+            "species" : [{"label" : "A", "D" : 1}],
+            "reactions" : []
+            },
+        "space" : {"w" : 10, "h" : 1, "d" : 1}
+        })
+    rds.state = [1000]+[0]*9
+    condition = {"type" : "above", "species" : "A", "cells" : [9], "value" : 10}
+    script = RDScript(rds, numpy.linspace(0, 1000, 1001), time_step=0.01, stop_conditions=condition)
+    assert rdscript_from_dict(rdscript_to_dict(script)).stop_conditions[0]["cells"] == [9]
+    
+    out = simulate_script(script, euler_engine())
+    assert out.stop_condition == 0
+    assert out.get_trajectory("A", 9).value[-1] < 10
+    assert 0 < out.t_stop.value < 1000
+
+def test_steady_state() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 100, 101)
+    condition = {"type" : "steady_state", "rtol" : 1e-4, "interval" : 1}
+    
+    # the rate of change of B, 1000*exp(-2t), gets lower than 1e-4*500 at t ~ 5
+    for engine in [euler_engine(), ScipyRDEngine()] :
+        out = simulate(rds, t_sample, engine=engine, time_step=0.01, stop_conditions=condition)
+        assert out.stop_condition == 0
+        assert 5 < out.t_stop.value < 10
+        assert abs(out.get_trajectory("B").value[-1] - 500) < 0.1
+    
+    out = simulate(rds, numpy.linspace(0, 1000, 1001), engine=gillespie_engine(), rng_seed=1, stop_conditions={"type" : "steady_state", "rtol" : 0.05, "interval" : 10})
+    assert out.stop_condition == 0
+    assert out.t_stop.value < 1000
+    
+    with pytest.raises(ValueError) :
+        RDScript(rds, t_sample, stop_conditions={"type" : "steady_state", "species" : "A", "interval" : 1})
+
+def test_steady_state_engine(tmp_path) :
+    rds = generate_rds()
+    out = simulate(rds, [0, 100], engine=SteadyStateEngine())
+    assert out.nsamples() == 1
+    assert out.diagnostics["converged"]
+    assert abs(out.get_trajectory("A").value[0] - 500) < 1e-6
+    assert abs(out.get_trajectory("B").value[0] - 500) < 1e-6
+    
+    path = str(tmp_path / "out.json")
+    save_rdtrajectory(out, path)
+    assert load_rdtrajectory(path).diagnostics == out.diagnostics
+    
+    # diffusion with a chemostat in the first cell, the steady state is uniform
+    rds = rdsystem_from_dict({
+        "network" : {
+            "species" : [{"label" : "A", "D" : 1}],
+            "reactions" : []
+            },
+        "space" : {"w" : 10, "h" : 1, "d" : 1}
+        })
+    rds.state = [100]+[0]*9
+    rds.chemostats = [1]+[0]*9
+    for linear_solver in ["direct", "gmres"] :
+        out = simulate(rds, [0, 100], engine=SteadyStateEngine(linear_solver=linear_solver))
+        assert out.diagnostics["converged"]
+        assert numpy.allclose(out.get_state("A", 0).value, 100)
+    
+    out = simulate(rds, [0, 100], engine=SteadyStateEngine(max_iterations=1))
+    assert not out.diagnostics["converged"]
+    assert out.diagnostics["iterations"] == 1
+
+def test_ode_function() :
+    rds = rdsystem_from_dict({
+        "network" : {
+            "species" : [{"label" : "A", "D" : 1}, {"label" : "B"}, {"label" : "C", "D" : 2}],
+            "reactions" : [{"eq" : "2 A + B -> C", "k+" : 0.5, "k-" : 3}]
+            },
+        "space" : {"w" : 2, "h" : 1, "d" : 1}
+        })
+    rds.state = [4, 1, 2, 3, 5, 7] # species first
+    rds.chemostats = [0, 0, 0, 1, 0, 0]
+    f = build_ode_function(rds.copy(), UnitsSystem())
+    
+    A, B, C = numpy.array([4., 1.]), numpy.array([2., 3.]), numpy.array([5., 7.])
+    rates = 0.5*A**2*B - 3*C
+    diffusion_A = numpy.array([A[1]-A[0], A[0]-A[1]])
+    diffusion_C = 2*numpy.array([C[1]-C[0], C[0]-C[1]])
+    expected = numpy.concatenate([-2*rates + diffusion_A, -rates*[1, 0], rates + diffusion_C])
+    assert numpy.allclose(f(0, numpy.array(rds.state.value, dtype=float)), expected, rtol=1e-12, atol=0)
+    
+    f, jac, jac_sparsity = build_ode_function(rds.copy(), UnitsSystem(), jacobian=True)
+    x = numpy.array(rds.state.value, dtype=float)
+    J = jac(0, x).toarray()
+    J_fd = numpy.zeros((6, 6))
+    for k in range(6) :
+        dx = numpy.zeros(6)
+        dx[k] = 1e-6
+        J_fd[:, k] = (f(0, x+dx) - f(0, x-dx))/2e-6
+    assert numpy.allclose(J, J_fd, rtol=1e-6, atol=1e-6)
+    assert numpy.all(J[3] == 0) # chemostat
+    assert numpy.all((jac_sparsity.toarray() != 0) | (J == 0))
+
+def test_ode_function_grid_graph() :
+    # a grid and its equivalent graph have the same ODE function
+    rds = rdsystem_from_dict({
+        "network" : {
+            "environments" : ["a", "b"],
+            "species" : [{"label" : "A", "D" : {"a" : 1, "b" : 3}}, {"label" : "B", "D" : {"a" : 0, "b" : 2}}],
+            "reactions" : [{"eq" : "2 A -> B", "k+" : {"a" : 1, "b" : 5}, "k-" : 1}]
+            },
+        "space" : {
+            "w" : 4, "h" : 3, "d" : 2, 
+            "cell_env" : [i%2 for i in range(24)],
+            "boundary_conditions" : {"x" : "periodical", "y" : "reflecting", "z" : "periodical"}
+            }
+        })
+    rds.state = [(i*37)%11 for i in range(48)]
+    graph = rds.copy()
+    graph.space = grid_to_graph(rds.space)
+    x = numpy.array(rds.state.value, dtype=float)
+    f_grid = build_ode_function(rds, UnitsSystem())
+    f_graph = build_ode_function(graph, UnitsSystem())
+    assert numpy.allclose(f_grid(0, x), f_graph(0, x), rtol=1e-12, atol=1e-12)
+
+def test_scipy_engine_jacobian() :
+    rds = generate_rds()
+    for integrator_class in [scipy.integrate.LSODA, scipy.integrate.BDF, scipy.integrate.Radau] :
+        for jacobian in ["analytic", "sparsity", None] :
+            out = simulate(rds, numpy.linspace(0, 10, 11), engine=ScipyRDEngine(integrator_class, jacobian=jacobian))
+            assert abs(out.get_trajectory("B").value[-1] - 500) < 1
+    
+    with pytest.raises(ValueError) :
+        ScipyRDEngine(jacobian="dense")
+
+def test_scipy_engine_dense_output() :
+    # samples are interpolated at exactly the requested times
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 10, 1001)
+    out = simulate(rds, t_sample, engine=ScipyRDEngine())
+    assert numpy.array_equal(out.t.value, t_sample)
+    expected = 500*(1-numpy.exp(-2*t_sample))
+    assert numpy.allclose(out.get_trajectory("B").value, expected, rtol=0, atol=1)
+    
+    out = simulate(rds, [0, 10], engine=ScipyRDEngine(), sampling_policy="on_interval", sampling_interval=0.5)
+    assert numpy.allclose(out.t.value, numpy.arange(21)*0.5)
+
+def test_imex_engine() :
+    rds = generate_rds()
+    out = simulate(rds, numpy.linspace(0, 10, 11), engine=imex_engine(), time_step=0.01)
+    assert abs(out.get_trajectory("B").value[-1] - 500) < 1
+    
+    # diffusion dominated system, stable with a time step far above the Euler stability limit (dt < 1/(2*D*3) = 0.0017)
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A", "D" : 100}, {"label" : "B", "D" : 1}], "reactions" : [{"eq" : "A -> B", "k+" : 0.1, "k-" : 0.05}]},
+        "space" : {"w" : 30, "h" : 1, "d" : 1}
+        })
+    rds.state = [1000]+[0]*59
+    reference = simulate(rds, [0, 20], engine=euler_engine(), time_step=0.001).data.value.reshape((2, -1))[-1]
+    for space in [rds.space, grid_to_graph(rds.space)] :
+        rds.space = space
+        data = simulate(rds, [0, 20], engine=imex_engine(), time_step=0.05).data.value.reshape((2, -1))
+        assert numpy.allclose(numpy.sum(data, axis=1), 1000)
+        assert numpy.allclose(data[-1], reference, rtol=0, atol=0.5)
+    
+    # chemostats are preserved
+    rds.chemostats = [1]+[0]*59
+    out = simulate(rds, [0, 20], engine=imex_engine(), time_step=0.05)
+    assert out.get_trajectory("A", position=0).value[-1] == 1000
+
+def test_rk_engines() :
+    rds = generate_rds()
+    t_sample = numpy.linspace(0, 10, 101)
+    expected = 500*(1-numpy.exp(-2*t_sample))
+    for engine in [rk45_engine(), rk23_engine()] :
+        # states are sampled at exactly the requested times, with an error controlled by the tolerances
+        out = simulate(rds, t_sample, engine=engine, rtol=1e-8, atol=1e-8)
+        assert numpy.array_equal(out.t.value, t_sample)
+        assert numpy.allclose(out.get_trajectory("B").value, expected, rtol=0, atol=1e-3)
+        
+        out = simulate(rds, [0, 10], engine=engine, sampling_policy="on_interval", sampling_interval=0.5)
+        assert numpy.allclose(out.t.value, numpy.arange(21)*0.5)
+        
+        n_steps = [len(simulate(rds, [0, 10], engine=engine, sampling_policy="on_iteration", rtol=rtol).t.value) for rtol in [1e-3, 1e-8]]
+        assert n_steps[0] < n_steps[1]
+    
+    # reaction-diffusion in grid and graph spaces, compared to the SciPy solvers
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A", "D" : 100}, {"label" : "B", "D" : 1}], "reactions" : [{"eq" : "2 A -> B", "k+" : 0.001, "k-" : 0.05}]},
+        "space" : {"w" : 10, "h" : 2, "d" : 1}
+        })
+    rds.state = [1000]+[0]*39
+    reference = simulate(rds, [0, 1, 5], engine=ScipyRDEngine(), rtol=1e-10, atol=1e-10).data.value
+    for space in [rds.space, grid_to_graph(rds.space)] :
+        rds.space = space
+        out = simulate(rds, [0, 1, 5], engine=rk45_engine(), rtol=1e-8, atol=1e-8)
+        assert numpy.allclose(out.data.value, reference, rtol=0, atol=1e-3)
+    
+    rds.chemostats = [1]+[0]*39
+    out = simulate(rds, [0, 1, 5], engine=rk23_engine())
+    assert numpy.all(out.get_trajectory("A", position=0).value == 1000)
+    
+    script = RDScript(rds, [0, 1], rtol=1e-5, atol=1e-4)
+    script2 = rdscript_from_dict(rdscript_to_dict(script))
+    assert script2.rtol == 1e-5 and script2.atol.value == 1e-4
+    with pytest.raises(ValueError) :
+        RDScript(rds, [0, 1], rtol=-1)
+
+def test_time_step_stability(capsys) :
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A", "D" : 100}, {"label" : "B", "D" : 1}], "reactions" : [{"eq" : "A -> B", "k+" : 0.1, "k-" : 0.05}]},
+        "space" : {"w" : 30, "h" : 1, "d" : 1}
+        })
+    rds.state = [1000]+[0]*59
+    t_sample = [0, 1, 5, 20]
+    reference = simulate(rds, t_sample, engine=euler_engine(), time_step=1e-4).data.value
+    
+    # the diffusion stability bound is 1/(2*100) = 0.005, the diffusion is sub-cycled above it
+    for space in [rds.space, grid_to_graph(rds.space)] :
+        rds.space = space
+        out = simulate(rds, t_sample, engine=euler_engine(), time_step=0.05)
+        assert numpy.allclose(out.data.value, reference, rtol=0, atol=2)
+        
+        out = simulate(rds, t_sample, engine=tauleap_engine(), time_step=0.05, rng_seed=1)
+        assert numpy.allclose(numpy.sum(out.data.value.reshape((4, -1)), axis=1), 1000)
+    
+    # the time step is chosen at initialization
+    out = simulate(rds, t_sample, engine=euler_engine(), time_step="auto")
+    assert out.script.time_step.value == 0.0025
+    assert numpy.allclose(out.data.value, reference, rtol=0, atol=0.5)
+    out = simulate(rds, t_sample, engine=imex_engine(), time_step="auto")
+    assert out.script.time_step.value == 1
+    script = RDScript(rds, t_sample, time_step="auto")
+    assert rdscript_from_dict(rdscript_to_dict(script)).time_step == "auto"
+    
+    # the reactions stability bound is 1/0.1 = 10 (the sub-cycling of the diffusion is only reported)
+    capsys.readouterr()
+    simulate(rds, t_sample, engine=euler_engine(), time_step=1)
+    printed = capsys.readouterr().out
+    assert "explicit stability bound" not in printed and "sub-steps" in printed
+    simulate(rds, t_sample, engine=euler_engine(), time_step=20)
+    assert "explicit stability bound" in capsys.readouterr().out
+
+def test_multirate(capsys) :
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A", "D" : 100}, {"label" : "B", "D" : 1}], "reactions" : [{"eq" : "A -> B", "k+" : 0.1, "k-" : 0.05}]},
+        "space" : {"w" : 30, "h" : 1, "d" : 1}
+        })
+    rds.state = [1000]+[0]*30+[100]+[0]*28
+    t_sample = [0, 1, 5, 20]
+    reference = simulate(rds, t_sample, engine=euler_engine(), time_step=1e-4).data.value
+    
+    # A is 100 times faster than B : its diffusion and the reaction consuming it are sub-stepped
+    grid = rds.space
+    for space in [grid, grid_to_graph(grid)] :
+        rds.space = space
+        for multirate in ["auto", ["A"]] :
+            engine = euler_engine()
+            engine.setup(RDScript(rds, t_sample, time_step=0.05, multirate=multirate))
+            assert engine.get_multirate_partition() == {"substeps" : 11, "fast_species" : ["A"], "fast_reactions" : [0]}
+            
+            out = simulate(rds, t_sample, engine=euler_engine(), time_step=0.05, multirate=multirate)
+            assert numpy.allclose(out.data.value, reference, rtol=0, atol=1)
+            
+            out = simulate(rds, t_sample, engine=tauleap_engine(), time_step=0.05, multirate=multirate, rng_seed=1)
+            assert numpy.allclose(numpy.sum(out.data.value.reshape((4, -1)), axis=1), 1100)
+    
+    # without multirate, only the diffusion is sub-cycled, which is reported
+    capsys.readouterr()
+    engine = euler_engine()
+    engine.setup(RDScript(rds, t_sample, time_step=0.05))
+    assert engine.get_multirate_partition() == {"substeps" : 10, "fast_species" : ["A", "B"], "fast_reactions" : []}
+    assert "10 sub-steps" in capsys.readouterr().out
+    engine.finalize()
+    
+    # with multirate = False, all the processes are integrated with the time step
+    engine.setup(RDScript(rds, t_sample, time_step=0.05, multirate=False))
+    assert engine.get_multirate_partition() == {"substeps" : 1, "fast_species" : [], "fast_reactions" : []}
+    assert "sub-steps" not in capsys.readouterr().out
+    engine.finalize()
+    
+    script = RDScript(rds, t_sample, multirate="A")
+    assert script.multirate == ["A"]
+    assert rdscript_from_dict(rdscript_to_dict(script)).multirate == ["A"]
+    script.multirate = False
+    assert rdscript_from_dict(rdscript_to_dict(script)).multirate is False
+    with pytest.raises(ValueError) :
+        RDScript(rds, t_sample, multirate=["C"])
+
+def test_local_time_stepping(capsys) :
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A", "D" : 10}, {"label" : "B", "D" : 1}], "reactions" : [{"eq" : "A -> B", "k+" : 0.1, "k-" : 0.05}]},
+        "space" : {"w" : 64, "h" : 1, "d" : 1}
+        })
+    rds.state = [1000]+[0]*127
+    # 8 single cell nodes, followed by 7 nodes of 8 cells
+    cgsystem = coarsegrain_system(rds, list(range(8)) + [8+(i-8)//8 for i in range(8, 64)])
+    t_sample = [0, 1, 5, 20]
+    reference = simulate(cgsystem, t_sample, engine=euler_engine(), time_step=1e-4).data.value
+    
+    # the small nodes (except the first one, with a single neighbor) exceed their stability bound
+    engine = euler_engine()
+    engine.setup(RDScript(cgsystem, t_sample, time_step=0.05, local_time_stepping=True))
+    assert engine.get_local_time_stepping_levels() == [0]+[1]*6+[0]*8
+    
+    capsys.readouterr()
+    out = simulate(cgsystem, t_sample, engine=euler_engine(), time_step=0.05, local_time_stepping=True)
+    assert "warning" not in capsys.readouterr().out
+    assert numpy.allclose(out.data.value, reference, rtol=0, atol=3)
+    
+    # the fluxes between levels are conservative
+    for engine in [euler_engine(), tauleap_engine()] :
+        out = simulate(cgsystem, t_sample, engine=engine, time_step=0.4, local_time_stepping=True, rng_seed=1)
+        assert numpy.allclose(numpy.sum(out.data.value.reshape((4, -1)), axis=1), 1000)
+    
+    engine = euler_engine()
+    engine.setup(RDScript(cgsystem, t_sample, time_step=0.05))
+    assert engine.get_local_time_stepping_levels() is None
+    engine.setup(RDScript(rds, t_sample, time_step=0.05, local_time_stepping=True))
+    assert "warning" in capsys.readouterr().out
+    assert engine.get_local_time_stepping_levels() is None
+    
+    script = RDScript(cgsystem, t_sample, local_time_stepping=True)
+    assert rdscript_from_dict(rdscript_to_dict(script)).local_time_stepping
+
+def test_hybrid_engine() :
+    rds = rdsystem_from_dict({
+        "network" : {"species" : [{"label" : "A", "D" : 1}, {"label" : "B", "D" : 1}, {"label" : "C", "D" : 0.1}, {"label" : "D", "D" : 0}],
+                     "reactions" : [{"eq" : "A -> B", "k+" : 1, "k-" : 1}, {"eq" : "B -> B + C", "k+" : 1e-4, "k-" : 0}, {"eq" : "C -> D", "k+" : 0.1, "k-" : 0}]},
+        "space" : {"w" : 4, "h" : 1, "d" : 1}
+        })
+    rds.state = [1e5]*4 + [0]*12
+    t_sample = numpy.linspace(0, 10, 11)
+    
+    for space in [rds.space, grid_to_graph(rds.space)] :
+        rds.space = space
+        out = simulate(rds, t_sample, engine=hybrid_engine(), time_step=0.01, rng_seed=2)
+        data = out.data.value.reshape((11, 4, 4))
+        assert numpy.allclose(numpy.sum(data[:, :2], axis=(1, 2)), 4e5)
+        # C and D are only changed by stochastic events
+        assert numpy.all(data[:, 2:] == numpy.round(data[:, 2:]))
+        # mean number of C : 200*(1-exp(-1)) = 126
+        assert 80 < numpy.sum(data[-1, 2]) < 180
+    
+    # once B is abundant, the reactions between A and B and the diffusion of A and B are continuous
+    engine = hybrid_engine()
+    engine.setup(RDScript(rds, t_sample, time_step=0.01, rng_seed=2))
+    engine.iterate_n(10)
+    assert engine.get_hybrid_partition() == {"continuous_reactions" : 8, "stochastic_reactions" : 16, "continuous_diffusion" : 12, "stochastic_diffusion" : 12}
+    engine.setup(RDScript(rds, t_sample, time_step=0.01, rng_seed=2, hybrid_propensity_threshold=1e9))
+    engine.iterate()
+    assert engine.get_hybrid_partition()["continuous_reactions"] == 0
+    engine = euler_engine()
+    engine.setup(RDScript(rds, t_sample))
+    assert engine.get_hybrid_partition() is None
+    
+    script = RDScript(rds, t_sample, hybrid_population_threshold=50, hybrid_propensity_threshold=5)
+    script2 = rdscript_from_dict(rdscript_to_dict(script))
+    assert script2.hybrid_population_threshold == 50 and script2.hybrid_propensity_threshold == 5
+
+def test_hybrid_stochastic_region() :
+    rds = rdsystem_from_dict({
+        "network" : {"environments" : ["bulk", "membrane"],
+                     "species" : [{"label" : "A", "D" : 1}, {"label" : "B", "D" : 0}],
+                     "reactions" : [{"eq" : "A -> B", "k+" : 1, "k-" : 0}]},
+        "space" : {"w" : 20, "h" : 1, "d" : 1, "cell_env" : [1, 1] + [0]*18}
+        })
+    rds.network.reactions[0].environments = ["membrane"]
+    rds.state = [1000]*20 + [0]*20
+    t_sample = numpy.linspace(0, 5, 6)
+    
+    for space in [rds.space, grid_to_graph(rds.space)] :
+        rds.space = space
+        out = simulate(rds, t_sample, engine=hybrid_engine(), time_step=0.01, rng_seed=1, hybrid_stochastic_region=["membrane"])
+        out2 = simulate(rds, t_sample, engine=hybrid_engine(), time_step=0.01, rng_seed=1, hybrid_stochastic_region=[True, True] + [False]*18)
+        assert numpy.array_equal(out.data.value, out2.data.value)
+        data = out.data.value.reshape((6, 2, 20))
+        assert numpy.allclose(numpy.sum(data, axis=(1, 2)), 20000)
+        # the quantities of the stochastic cells remain integers
+        assert numpy.all(data[:, :, :2] == numpy.round(data[:, :, :2]))
+        assert numpy.sum(data[-1, 1]) > 15000
+    
+    engine = hybrid_engine()
+    engine.setup(RDScript(rds, t_sample, time_step=0.01, hybrid_stochastic_region=["membrane"]))
+    assert engine.get_hybrid_partition() == {"continuous_reactions" : 36, "stochastic_reactions" : 4, "continuous_diffusion" : 70, "stochastic_diffusion" : 6}
+    
+    script = RDScript(rds, t_sample, hybrid_stochastic_region="membrane")
+    assert script.hybrid_stochastic_region == ["membrane"]
+    assert rdscript_from_dict(rdscript_to_dict(script)).hybrid_stochastic_region == ["membrane"]
+    script.hybrid_stochastic_region = numpy.arange(20) < 2
+    assert rdscript_from_dict(rdscript_to_dict(script)).hybrid_stochastic_region == [1, 1] + [0]*18
+    with pytest.raises(ValueError) :
+        script.hybrid_stochastic_region = ["cytoplasm"]
+    with pytest.raises(ValueError) :
+        script.hybrid_stochastic_region = [1, 0]
@@ -0,0 +1,102 @@
+import sys
+sys.path.append("../src/")
+from strengths import *
+from strengths.sweep import *
+from strengths.rdengine import RDEngineBase
+import numpy
+import pytest
+
+def make_script() :
+    rds = rdsystem_from_dict({
+        "network" : {
+            "species" : [
+                {"label" : "A", "density" : 1000, "D" : 1}, 
+                {"label" : "B"}
+                ], 
+            "reactions" : [
+                {"eq" : "A -> B", "k+" : 1, "k-" : 1}
+                ]
+            },
+        "space" : {"w" : 3, "h" : 1, "d" : 1}
+        })
+    return RDScript(rds, t_sample=numpy.linspace(0, 10, 11), time_step=0.01)
+
+def test_parameter_grid() :
+    grid = parameter_grid({"kf:0" : [1, 2], "rng_seed" : [0, 1, 2]})
+    assert len(grid) == 6
+    assert grid[0] == {"kf:0" : 1, "rng_seed" : 0}
+    assert grid[5] == {"kf:0" : 2, "rng_seed" : 2}
+
+def test_make_sweep_script() :
+    script = make_script()
+    s = make_sweep_script(script, {"kf:0" : 3, "rng_seed" : 7, "time_step" : 0.1, "density:B" : 2})
+    assert s.rng_seed == 7
+    assert s.time_step.value == 0.1
+    assert s.system.network.reactions[0].kf.value == 3
+    assert script.system.network.reactions[0].kf.value == 1
+    assert estimate_cost(s) < estimate_cost(script)
+
+def test_run_sweep(tmp_path) :
+    script = make_script()
+    overrides = parameter_grid({"kf:0" : [1, 2], "rng_seed" : [1, 2, 3]})
+    res = run_sweep(script, overrides, engine=tauleap_engine, max_workers=2)
+    
+    assert len(res) == 6
+    for i in range(6) :
+        o, output = res[i]
+        assert o == overrides[i]
+        ref = simulate_script(make_sweep_script(script, o), tauleap_engine())
+        assert numpy.array_equal(output.data.value, ref.data.value)
+    
+    table = res.to_table()
+    assert table["index"] == list(range(6))
+    assert table["rng_seed"] == [1, 2, 3, 1, 2, 3]
+    
+    res = run_sweep(script, overrides[:2], engine=euler_engine, output_dir=str(tmp_path))
+    for i in range(2) :
+        output = load_rdtrajectory(res.outputs[i])
+        assert output.nsamples() == 11
+
+class CountingEngine(RDEngineBase) :
+    # engine recording its setup and finalize calls, for the sweep workers tests.
+    def __init__(self) :
+        super().__init__("counting", "CountingEngine")
+        self.setup_result = None
+        self.n_setup = 0
+        self.n_finalize = 0
+    
+    def setup(self, script) :
+        self.n_setup += 1
+        return self.setup_result
+    
+    def reset(self, rng_seed=None, state=None) :
+        raise NotImplementedError("")
+    
+    def run(self, breathe_dt) :
+        return False
+    
+    def get_output(self) :
+        return None
+    
+    def finalize(self) :
+        self.n_finalize += 1
+
+def test_sweep_worker_finalize() :
+    import strengths.sweep as sweep
+    sweep._init_worker(make_script(), CountingEngine)
+    engine = sweep._worker["engine"]
+    
+    # the previous simulation is freed before each new setup
+    sweep._run_worker(0, {"kf:0" : 1}, None)
+    sweep._run_worker(1, {"kf:0" : 2}, None)
+    assert engine.n_setup == 2 and engine.n_finalize == 1
+    sweep._finalize_worker()
+    assert engine.n_finalize == 2
+    sweep._finalize_worker()
+    assert engine.n_finalize == 2
+    
+    # a failed setup raises, and its simulation is freed
+    engine.setup_result = 1
+    with pytest.raises(RuntimeError) :
+        sweep._run_worker(2, {"kf:0" : 3}, None)
+    assert engine.n_finalize == 3